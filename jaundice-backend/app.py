@@ -4,21 +4,31 @@ Production-grade REST API for serving predictions
 """
 
 import os
+import hmac
+import time
 import logging
+import itertools
+import threading
 import json
 from pathlib import Path
 from datetime import datetime
-from functools import lru_cache
 
 import numpy as np
-from PIL import Image
-import io
 
-import tensorflow as tf
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+from batching import MicroBatcher
+from cache import create_cache, content_key
+from inference import InferenceEngine, backend_model_path, batch_buckets, load_engine, shared_onnx_path_for
+from model_bundle import configured_bundle_path, load_bundle, postprocess
+from preprocessing import decode_image, resize_image, normalize_into, preprocess_signature
+from profiling import RequestProfiler, current_trace
+from streaming import NDJSON_MIMETYPE, iter_uploads, ndjson_line
+from telemetry import (CONTENT_TYPE as METRICS_CONTENT_TYPE, BATCH_SIZE_BUCKETS, STAGE_BUCKETS, MetricsRegistry,
+                       resident_memory_bytes)
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,8 +39,62 @@ load_dotenv()
 # Configuration
 PORT = int(os.getenv('PORT', 5000))
 MODEL_PATH = os.getenv('MODEL_PATH', 'models/jaundice_detection_model.h5')
+# Threshold/version/input spec written by training; defaults to the bundle next to MODEL_PATH
+MODEL_BUNDLE_PATH = configured_bundle_path(MODEL_PATH)
 IMG_SIZE = 224
+# Decision threshold; unset means the trained threshold from the model bundle
+PREDICTION_THRESHOLD = float(os.getenv('PREDICTION_THRESHOLD')) if os.getenv('PREDICTION_THRESHOLD') else None
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'bmp', 'gif'}
+# Largest single file a streaming batch upload may hold in memory
+MAX_FILE_SIZE_MB = float(os.getenv('MAX_FILE_SIZE_MB', 10))
+MAX_FILE_SIZE = int(MAX_FILE_SIZE_MB * 1024 * 1024)
+
+# Serving backend: 'keras' (full TensorFlow), 'tflite' (interpreter pool) or 'onnx' (ONNX Runtime)
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'keras').lower()
+TFLITE_MODEL_PATH = os.getenv('TFLITE_MODEL_PATH', 'models/jaundice_detection_model_float16.tflite')
+TFLITE_POOL_SIZE = int(os.getenv('TFLITE_POOL_SIZE', 2))
+TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', 0)) or None
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', 'models/jaundice_detection_model.onnx')
+ORT_INTRA_OP_THREADS = int(os.getenv('ORT_INTRA_OP_THREADS', 0)) or None
+ORT_INTER_OP_THREADS = int(os.getenv('ORT_INTER_OP_THREADS', 0)) or None
+# Serve the weight-sharing ONNX export (written by `cli.py export-onnx`) so workers map one copy of the weights
+ORT_SHARE_WEIGHTS = os.getenv('ORT_SHARE_WEIGHTS', 'True').lower() == 'true'
+
+# Import the model runtime and warm the model files in the gunicorn master (see gunicorn.conf.py)
+PRELOAD_MODEL = os.getenv('PRELOAD_MODEL', 'False').lower() == 'true'
+
+# Micro-batching configuration
+BATCHING_ENABLED = os.getenv('BATCHING_ENABLED', 'True').lower() == 'true'
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 16))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', 5))
+BATCH_PREDICT_CHUNK_SIZE = int(os.getenv('BATCH_PREDICT_CHUNK_SIZE', 32))
+# Longest a request waits for the batcher before running its own forward pass (0 waits forever)
+BATCH_SUBMIT_TIMEOUT_S = float(os.getenv('BATCH_SUBMIT_TIMEOUT_S', 10)) or None
+
+# Prediction cache configuration ('memory' per worker, or 'sqlite' shared by all workers on a node)
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'True').lower() == 'true'
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+CACHE_PATH = os.getenv('CACHE_PATH', 'cache/serving_cache.sqlite3')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+CACHE_MAX_MB = float(os.getenv('CACHE_MAX_MB', 64))
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', 0))
+TENSOR_CACHE_ENABLED = os.getenv('TENSOR_CACHE_ENABLED', 'False').lower() == 'true'
+TENSOR_CACHE_MAX_MB = float(os.getenv('TENSOR_CACHE_MAX_MB', 256))
+# How often to look for a replaced model file or bundle and reload it (0 disables; restart instead)
+MODEL_RELOAD_CHECK_SECONDS = float(os.getenv('MODEL_RELOAD_CHECK_SECONDS', 5))
+
+# Prometheus metrics at /metrics (per process: scrape every worker)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+
+# Opt-in request profiling (see profiling.py): trace a fraction of prediction
+# requests and/or any slower than PROFILE_SLOW_MS; both off by default
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 0))
+PROFILE_PYTHON = os.getenv('PROFILE_PYTHON', 'False').lower() == 'true'
+PROFILE_BUFFER_SIZE = int(os.getenv('PROFILE_BUFFER_SIZE', 100))
+PROFILE_DUMP_DIR = os.getenv('PROFILE_DUMP_DIR', 'logs/profiles')
+# Required as the X-Admin-Token header on /api/admin/* when set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 
 # Flask app
 app = Flask(__name__)
@@ -38,19 +102,341 @@ CORS(app)
 
 # Global model cache
 _model = None
+_engine = None
 _metrics = None
+_batcher = None
+_model_version = None
+_bundle = None
+_share_weights = None
+_model_stamp = None
+_next_reload_check = 0.0
+_engine_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_prediction_cache = create_cache(
+    CACHE_BACKEND,
+    'predictions',
+    path=CACHE_PATH,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=CACHE_TTL_SECONDS
+)
+_tensor_cache = create_cache(
+    CACHE_BACKEND,
+    'tensors',
+    path=CACHE_PATH,
+    codec='bytes',
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=TENSOR_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=CACHE_TTL_SECONDS
+) if TENSOR_CACHE_ENABLED else None
+_preprocess_version = preprocess_signature(IMG_SIZE)
+
+# Serving metrics; recording is lock-free (see telemetry.py)
+_telemetry = MetricsRegistry()
+_request_count = _telemetry.counter(
+    'jaundice_http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+_request_seconds = _telemetry.histogram(
+    'jaundice_http_request_duration_seconds', 'Time to produce the response, by route', ('route',))
+_in_flight = _telemetry.level('jaundice_http_requests_in_flight', 'Requests currently being handled')
+_stage_seconds = _telemetry.histogram(
+    'jaundice_stage_duration_seconds',
+    'Prediction stage time: upload_read, decode, resize_normalize, forward (per batch), serialize',
+    ('stage',), buckets=STAGE_BUCKETS)
+_model_load_seconds = _telemetry.gauge(
+    'jaundice_model_load_seconds', 'Time to load and warm up the inference engine', ('backend',))
+_model_reloads = _telemetry.counter(
+    'jaundice_model_reloads_total', 'Engine reloads after the model file or bundle changed on disk', ('result',))
+_cache_lookups = _telemetry.counter(
+    'jaundice_cache_lookups_total', 'Prediction and tensor cache lookups by result', ('cache', 'result'))
+_batch_size = _telemetry.histogram(
+    'jaundice_batch_size', 'Images per micro-batched forward pass', buckets=BATCH_SIZE_BUCKETS)
+_batch_wait_seconds = _telemetry.histogram(
+    'jaundice_batch_queue_wait_seconds', 'Time a request waited in the micro-batcher queue', buckets=STAGE_BUCKETS)
+_batch_fallbacks = _telemetry.counter(
+    'jaundice_batch_fallbacks_total', 'Requests that timed out in the micro-batcher and ran their own forward pass')
+_telemetry.gauge('jaundice_batch_queue_depth', 'Requests waiting in the micro-batcher queue',
+                 function=lambda: _batcher.get_queue_depth() if _batcher is not None else None)
+_telemetry.gauge('jaundice_batcher_restarts', 'Times the micro-batcher worker thread died and was restarted',
+                 function=lambda: _batcher.restarts if _batcher is not None else None)
+_telemetry.gauge('process_resident_memory_bytes', 'Resident memory size in bytes', function=resident_memory_bytes)
+
+_profiler = RequestProfiler(
+    sample_rate=PROFILE_SAMPLE_RATE,
+    slow_ms=PROFILE_SLOW_MS,
+    python_profile=PROFILE_PYTHON,
+    capacity=PROFILE_BUFFER_SIZE,
+    routes=('/api/predict', '/api/batch-predict'),
+    dump_dir=PROFILE_DUMP_DIR
+)
 
 def get_model():
     """Load model lazily"""
     global _model
     if _model is None:
-        logger.info("Loading model from: %s", MODEL_PATH)
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Model not found at {MODEL_PATH}. Please train the model first.")
-        _model = tf.keras.models.load_model(MODEL_PATH)
-        logger.info("Model loaded successfully")
+        _model = _read_model()
     return _model
 
+def _read_model():
+    """Load the Keras model from MODEL_PATH"""
+    import tensorflow as tf
+    
+    logger.info("Loading model from: %s", MODEL_PATH)
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Model not found at {MODEL_PATH}. Please train the model first.")
+    model = tf.keras.models.load_model(MODEL_PATH)
+    logger.info("Model loaded successfully")
+    return model
+
+def _ort_shares_weights():
+    """Whether the onnx backend serves the weight-sharing export instead of ONNX_MODEL_PATH"""
+    global _share_weights
+    if _share_weights is None:
+        shared_path = shared_onnx_path_for(ONNX_MODEL_PATH)
+        _share_weights = MODEL_BACKEND == 'onnx' and ORT_SHARE_WEIGHTS and shared_path.exists()
+        if MODEL_BACKEND == 'onnx' and ORT_SHARE_WEIGHTS and not _share_weights:
+            logger.warning("No weight-sharing ONNX export at %s; every worker loads its own copy of the weights. "
+                           "Run 'python cli.py export-onnx' to create it.", shared_path)
+    return _share_weights
+
+def _served_model_path():
+    """The model file the configured backend serves from"""
+    if _ort_shares_weights():
+        return str(shared_onnx_path_for(ONNX_MODEL_PATH))
+    return backend_model_path(MODEL_BACKEND, MODEL_PATH, TFLITE_MODEL_PATH, ONNX_MODEL_PATH)
+
+def _model_fingerprint(threshold):
+    """Identify the served model file and threshold so cached predictions never outlive them"""
+    stat = os.stat(_served_model_path())
+    return f"{MODEL_BACKEND}-{stat.st_size:x}-{stat.st_mtime_ns:x}-t{threshold:.6f}"
+
+def get_bundle():
+    """Threshold, version and input spec that were trained with the model"""
+    global _bundle
+    if _bundle is None:
+        bundle = load_bundle(MODEL_PATH, PREDICTION_THRESHOLD, MODEL_BUNDLE_PATH)
+        bundle.check_input(IMG_SIZE)
+        _bundle = bundle
+    return _bundle
+
+def _file_stamp():
+    """Size and mtime of the served model file and its bundle, to notice when either is replaced"""
+    stamps = []
+    for path in (_served_model_path(), MODEL_BUNDLE_PATH):
+        try:
+            stat = os.stat(path)
+            stamps.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            stamps.append(None)
+    return tuple(stamps)
+
+def get_engine():
+    """Get the warmed-up inference engine wrapping the loaded model
+
+    Every MODEL_RELOAD_CHECK_SECONDS a call also checks whether the model file
+    or its bundle was replaced and, if so, reloads them (see ``reload_model``).
+    """
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _load_engine()
+    elif MODEL_RELOAD_CHECK_SECONDS and time.monotonic() >= _next_reload_check:
+        check_model_reload()
+    return _engine
+
+def _load_engine():
+    """Build and warm up the engine for the model on disk, then swap it in with its bundle"""
+    global _model, _engine, _bundle, _model_version, _model_stamp, _next_reload_check
+    started = time.perf_counter()
+    stamp = _file_stamp()
+    bundle = load_bundle(MODEL_PATH, PREDICTION_THRESHOLD, MODEL_BUNDLE_PATH)
+    bundle.check_input(IMG_SIZE)
+    model = _model
+    if MODEL_BACKEND == 'keras':
+        model = get_model() if _engine is None else _read_model()
+        engine = InferenceEngine(model, warmup_batch_sizes=batch_buckets(BATCH_MAX_SIZE))
+    else:
+        share_weights = _ort_shares_weights()
+        engine = load_engine(
+            MODEL_BACKEND,
+            MODEL_PATH,
+            tflite_model_path=TFLITE_MODEL_PATH,
+            tflite_pool_size=TFLITE_POOL_SIZE,
+            tflite_num_threads=TFLITE_NUM_THREADS,
+            onnx_model_path=str(shared_onnx_path_for(ONNX_MODEL_PATH)) if share_weights else ONNX_MODEL_PATH,
+            ort_intra_op_threads=ORT_INTRA_OP_THREADS,
+            ort_inter_op_threads=ORT_INTER_OP_THREADS,
+            ort_share_weights=share_weights,
+            warmup_batch_sizes=batch_buckets(BATCH_MAX_SIZE)
+        )
+    engine.warmup()
+    version = _model_fingerprint(bundle.threshold)
+    
+    # Requests keep the old engine, bundle and version until all three are replaced
+    _model, _bundle, _model_version, _engine = model, bundle, version, engine
+    _model_stamp = stamp
+    _next_reload_check = time.monotonic() + MODEL_RELOAD_CHECK_SECONDS
+    _model_load_seconds.set(time.perf_counter() - started, MODEL_BACKEND)
+    return _engine
+
+def preload_model():
+    """Load fork-safe runtime state once in the master process
+
+    TensorFlow, TFLite (XNNPACK) and ONNX Runtime all start thread pools when
+    a model is instantiated, and those threads do not survive fork. So the
+    master imports the runtime, whose module pages the forked workers share
+    copy-on-write, and reads the model files once into the OS page cache.
+    Every worker then builds its own engine in ``warmup_worker``.
+
+    With the onnx backend and ``ORT_SHARE_WEIGHTS``, those engines map the
+    weights from the page cache in place, so all workers share one copy and
+    memory stays flat as workers are added. Keras (TF variables) and TFLite
+    (XNNPACK's packed weights) still hold a copy of the weights per worker.
+    """
+    started = time.perf_counter()
+    path = _served_model_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model not found at {path}. Please train the model first.")
+    files = [path]
+    if _ort_shares_weights():
+        files.append(Path(path).with_suffix('.weights'))
+    
+    # Module imports are fork-safe; runtime thread pools start with the first model
+    if MODEL_BACKEND == 'keras':
+        import tensorflow  # noqa: F401
+    elif MODEL_BACKEND == 'onnx':
+        import onnxruntime  # noqa: F401
+    else:
+        try:
+            import tflite_runtime.interpreter  # noqa: F401
+        except ImportError:
+            import tensorflow  # noqa: F401
+    
+    for file in files:
+        with open(file, 'rb') as f:
+            while f.read(16 * 1024 * 1024):  # warm the page cache for every worker
+                pass
+    
+    logger.info("Preloaded %s model state from %s in %.2fs", MODEL_BACKEND, path, time.perf_counter() - started)
+
+def warmup_worker():
+    """Build and warm up this worker's engine before it accepts traffic"""
+    started = time.perf_counter()
+    get_engine()
+    get_metrics()
+    logger.info("Worker %d ready in %.2fs", os.getpid(), time.perf_counter() - started)
+
+def get_model_version():
+    """Fingerprint of the currently loaded model"""
+    get_engine()
+    return _model_version
+
+def check_model_reload():
+    """Reload the model when its file or bundle changed on disk since it was loaded"""
+    global _next_reload_check, _model_stamp
+    if not _reload_lock.acquire(blocking=False):
+        return  # another thread is already checking or reloading
+    try:
+        _next_reload_check = time.monotonic() + MODEL_RELOAD_CHECK_SECONDS
+        if _file_stamp() == _model_stamp:
+            return
+        logger.info("Model file or bundle changed on disk; reloading")
+        try:
+            reload_model()
+            _model_reloads.inc('success')
+        except Exception as e:
+            # Keep serving the old engine and retry once the files change again
+            _model_stamp = _file_stamp()
+            logger.error("Model reload failed, still serving version %s: %s", _model_version, str(e))
+            _model_reloads.inc('error')
+    finally:
+        _reload_lock.release()
+
+def reload_model():
+    """Load the model again from disk, swap it in and drop predictions cached for the old one
+
+    Requests keep using the old engine until the new one is warmed up.
+    """
+    global _share_weights
+    with _engine_lock:
+        _share_weights = None
+        _load_engine()
+    _prediction_cache.clear()
+    return _engine
+
+def get_batcher():
+    """Get the shared micro-batcher for single-image predictions"""
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            lambda batch: run_forward(get_engine(), batch),
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            submit_timeout=BATCH_SUBMIT_TIMEOUT_S,
+            on_batch=observe_batch if METRICS_ENABLED else None
+        )
+    return _batcher
+
+def observe_batch(batch_size, waits):
+    """Record one micro-batch's size and how long each of its requests queued"""
+    _batch_size.observe(batch_size)
+    for wait in waits:
+        _batch_wait_seconds.observe(wait)
+
+def predict_single(img_array):
+    """Get the jaundice probability for one preprocessed image"""
+    trace = current_trace() if _profiler.enabled else None
+    # cProfile only sees this thread, so a profiled request runs its own forward pass
+    if BATCHING_ENABLED and (trace is None or trace.profile is None):
+        try:
+            if trace is None:
+                return get_batcher().submit(img_array)
+            # The forward pass runs on the batcher thread; trace the wait for it here
+            started = time.perf_counter()
+            result = get_batcher().submit(img_array)
+            trace_stage('batched_forward', time.perf_counter() - started)
+            return result
+        except TimeoutError as e:
+            logger.warning("%s; running this prediction unbatched", str(e))
+            if METRICS_ENABLED:
+                _batch_fallbacks.inc()
+    return float(run_forward(get_engine(), img_array)[0])
+
+def run_forward(engine, batch):
+    """One forward pass, timed as the forward stage"""
+    started = time.perf_counter()
+    predictions = engine.predict(batch)
+    observe_stage('forward', time.perf_counter() - started)
+    return predictions
+
+def observe_stage(stage, seconds):
+    """Record the duration of one prediction stage"""
+    if METRICS_ENABLED:
+        _stage_seconds.observe(seconds, stage)
+    if _profiler.enabled:
+        trace_stage(stage, seconds)
+
+def trace_stage(stage, seconds):
+    """Add a stage to the current request's profiling trace, if it has one"""
+    trace = current_trace()
+    if trace is not None:
+        trace.stage(stage, seconds)
+
+def trace_note(key, value):
+    """Attach a detail (upload size, decoded size, ...) to the current request's trace"""
+    if _profiler.enabled:
+        trace = current_trace()
+        if trace is not None:
+            trace.note(key, value)
+
+def record_request(route, method, status, seconds):
+    """Count a finished request and its latency under its route pattern"""
+    _request_count.inc(route, method, str(status))
+    _request_seconds.observe(seconds, route)
+
+def metrics_text():
+    """Prometheus exposition text for this process"""
+    return _telemetry.render()
+
 def get_metrics():
     """Load model metrics"""
     global _metrics
@@ -67,63 +453,84 @@ def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def preprocess_image(image_data):
-    """Preprocess image for model prediction"""
+def preprocess_image(image_data, out=None):
+    """Preprocess image for model prediction
+
+    When ``out`` is given (a preallocated (IMG_SIZE, IMG_SIZE, 3) float32 slot),
+    the normalized image is written into it instead of a new batch of one.
+    Decoded uint8 pixels are looked up in and stored to the tensor cache when enabled.
+    """
     try:
-        # Load image
-        img = Image.open(io.BytesIO(image_data))
+        tensor_key = None
+        pixels = None
+        if _tensor_cache is not None:
+            tensor_key = content_key(image_data, _preprocess_version)
+            cached = _tensor_cache.get(tensor_key)
+            if METRICS_ENABLED:
+                _cache_lookups.inc('tensors', 'miss' if cached is None else 'hit')
+            if cached is not None:
+                pixels = np.frombuffer(cached, dtype=np.uint8).reshape(IMG_SIZE, IMG_SIZE, 3)
         
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        started = time.perf_counter()
+        if pixels is None:
+            img = decode_image(image_data, IMG_SIZE)
+            img.load()  # PIL decodes lazily; force it so decode and resize are timed apart
+            decoded = time.perf_counter()
+            observe_stage('decode', decoded - started)
+            trace_note('decoded_size', list(img.size))
+            started = decoded
+            pixels = np.asarray(resize_image(img, IMG_SIZE), dtype=np.uint8)
+            if tensor_key is not None:
+                _tensor_cache.put(tensor_key, pixels.tobytes())
         
-        # Resize to model input size
-        img = img.resize((IMG_SIZE, IMG_SIZE), Image.Resampling.LANCZOS)
+        if out is not None:
+            normalize_into(pixels, out)
+            observe_stage('resize_normalize', time.perf_counter() - started)
+            return out
         
-        # Convert to numpy array
-        img_array = np.array(img, dtype=np.float32)
-        
-        # Normalize to [0, 1]
-        img_array = img_array / 255.0
-        
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        return img_array
+        batch = np.empty((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        normalize_into(pixels, batch[0])
+        observe_stage('resize_normalize', time.perf_counter() - started)
+        return batch
     
     except Exception as e:
         logger.error("Error preprocessing image: %s", str(e))
         raise ValueError(f"Invalid image: {str(e)}")
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
+# Route handlers return (payload, status) so the Flask app and the ASGI app
+# in asgi.py serve identical responses.
+
+def health_response():
+    """Health check payload"""
     try:
-        model = get_model()
-        return jsonify({
+        engine = get_engine()
+        return {
             'status': 'ok',
             'timestamp': datetime.now().isoformat(),
-            'model_loaded': model is not None
-        }), 200
+            'model_loaded': engine is not None,
+            'backend': MODEL_BACKEND
+        }, 200
     except Exception as e:
         logger.error("Health check failed: %s", str(e))
-        return jsonify({
+        return {
             'status': 'error',
             'error': str(e)
-        }), 500
+        }, 500
 
-@app.route('/api/model/info', methods=['GET'])
-def model_info():
-    """Get model information"""
+def model_info_response():
+    """Model information payload"""
     try:
         metrics = get_metrics()
-        model = get_model()
+        get_engine()
+        bundle = get_bundle()
         
         response = {
             'model_name': 'jaundice_detection_model',
-            'version': '1.0',
-            'input_shape': [IMG_SIZE, IMG_SIZE, 3],
-            'classes': ['normal', 'jaundice'],
+            'version': bundle.version,
+            'backend': MODEL_BACKEND,
+            'input_shape': bundle.input_spec['shape'],
+            'classes': bundle.classes,
+            'threshold': bundle.threshold,
             'timestamp': datetime.now().isoformat()
         }
         
@@ -138,137 +545,210 @@ def model_info():
                 'test_samples': metrics.get('total_samples', 0)
             })
         
-        return jsonify(response), 200
+        return response, 200
     
     except Exception as e:
         logger.error("Error getting model info: %s", str(e))
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
 
-@app.route('/api/predict', methods=['POST'])
-def predict():
-    """Predict jaundice from uploaded image"""
+def predict_response(filename, image_data):
+    """Prediction payload for one uploaded image"""
     try:
-        # Check if file is in request
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
+        if filename == '':
+            return {'error': 'Empty filename'}, 400
         
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'Empty filename'}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({
+        if not allowed_file(filename):
+            return {
                 'error': f'Invalid file type. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'
-            }), 400
+            }, 400
         
-        # Read image data
-        image_data = file.read()
+        trace_note('upload_bytes', len(image_data))
+        
+        # Serve repeated uploads of the same photo from the cache
+        cache_key = content_key(image_data, get_model_version()) if CACHE_ENABLED else None
+        cached = _prediction_cache.get(cache_key) if cache_key else None
+        if cache_key and METRICS_ENABLED:
+            _cache_lookups.inc('predictions', 'miss' if cached is None else 'hit')
+        if cached is not None:
+            trace_note('cached', True)
+            return {
+                **cached,
+                'timestamp': datetime.now().isoformat(),
+                'cached': True
+            }, 200
         
         # Preprocess image
         img_array = preprocess_image(image_data)
         
         # Get prediction
-        model = get_model()
-        prediction = model.predict(img_array, verbose=0)[0][0]
+        prediction = predict_single(img_array)
         
         # Prepare response
-        confidence = float(max(prediction, 1 - prediction))
-        predicted_class = 'jaundice' if prediction > 0.5 else 'normal'
+        bundle = get_bundle()
+        result = {
+            **postprocess([prediction], bundle.threshold)[0],
+            'model_version': bundle.version
+        }
+        if cache_key:
+            _prediction_cache.put(cache_key, result)
         
         response = {
-            'prediction': predicted_class,
-            'confidence': confidence,
-            'probability_jaundice': float(prediction),
-            'probability_normal': float(1 - prediction),
+            **result,
             'timestamp': datetime.now().isoformat(),
-            'model_version': '1.0'
+            'cached': False
         }
         
-        logger.info("Prediction: %s (confidence: %.2f%%)", predicted_class, confidence * 100)
+        logger.info("Prediction: %s (confidence: %.2f%%)", result['prediction'], result['confidence'] * 100)
         
-        return jsonify(response), 200
+        return response, 200
     
     except ValueError as e:
         logger.warning("Validation error: %s", str(e))
-        return jsonify({'error': str(e)}), 400
+        return {'error': str(e)}, 400
     
     except Exception as e:
         logger.error("Prediction error: %s", str(e), exc_info=True)
-        return jsonify({'error': 'Prediction failed: ' + str(e)}), 500
+        return {'error': 'Prediction failed: ' + str(e)}, 500
 
-@app.route('/api/batch-predict', methods=['POST'])
-def batch_predict():
-    """Batch predict from multiple images"""
-    try:
-        if 'files' not in request.files:
-            return jsonify({'error': 'No files provided'}), 400
-        
-        files = request.files.getlist('files')
+class BatchPredictionRun:
+    """Decode uploads into a reusable chunk tensor and score each chunk once it fills
+
+    ``add`` and ``finish`` return the (index, result) records completed by
+    that call, so the same run backs both the buffered JSON response and the
+    streaming NDJSON response.
+    """
+    
+    def __init__(self, engine, chunk_size=BATCH_PREDICT_CHUNK_SIZE):
+        self.engine = engine
+        self.chunk_size = max(1, chunk_size)
+        self.batch = np.empty((self.chunk_size, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        self.pending = []  # (result index, filename) for each filled row of batch
+        self.total = 0
+        self.successful = 0
+    
+    def add(self, filename, read):
+        """Decode one upload into the chunk; ``read`` is only called for allowed file types"""
+        index = self.total
+        self.total += 1
         
-        if not files:
-            return jsonify({'error': 'No files provided'}), 400
+        try:
+            if not allowed_file(filename):
+                return [(index, {
+                    'filename': filename,
+                    'status': 'error',
+                    'error': 'Invalid file type'
+                })]
+            
+            started = time.perf_counter()
+            image_data = read()
+            observe_stage('upload_read', time.perf_counter() - started)
+            preprocess_image(image_data, out=self.batch[len(self.pending)])
+            self.pending.append((index, filename))
         
-        results = []
-        model = get_model()
+        except Exception as e:
+            logger.error("Error processing file %s: %s", filename, str(e))
+            return [(index, {
+                'filename': filename,
+                'status': 'error',
+                'error': str(e)
+            })]
         
-        for file in files:
-            try:
-                if not allowed_file(file.filename):
-                    results.append({
-                        'filename': file.filename,
-                        'status': 'error',
-                        'error': 'Invalid file type'
-                    })
-                    continue
-                
-                image_data = file.read()
-                img_array = preprocess_image(image_data)
-                
-                prediction = model.predict(img_array, verbose=0)[0][0]
-                confidence = float(max(prediction, 1 - prediction))
-                predicted_class = 'jaundice' if prediction > 0.5 else 'normal'
-                
-                results.append({
-                    'filename': file.filename,
-                    'status': 'success',
-                    'prediction': predicted_class,
-                    'confidence': confidence,
-                    'probability_jaundice': float(prediction),
-                    'probability_normal': float(1 - prediction)
-                })
-            
-            except Exception as e:
-                logger.error("Error processing file %s: %s", file.filename, str(e))
-                results.append({
-                    'filename': file.filename,
+        if len(self.pending) == self.chunk_size:
+            return self._flush()
+        return []
+    
+    def finish(self):
+        """Score whatever is left in the last partial chunk"""
+        return self._flush() if self.pending else []
+    
+    def _flush(self):
+        chunk, self.pending = self.pending, []
+        try:
+            predictions = run_forward(self.engine, self.batch[:len(chunk)])
+        except Exception as e:
+            records = []
+            for index, filename in chunk:
+                logger.error("Error processing file %s: %s", filename, str(e))
+                records.append((index, {
+                    'filename': filename,
                     'status': 'error',
                     'error': str(e)
-                })
+                }))
+            return records
+        
+        records = [
+            (index, {'filename': filename, 'status': 'success', **result})
+            for (index, filename), result in zip(chunk, postprocess(predictions, get_bundle().threshold))
+        ]
+        self.successful += len(records)
+        return records
+    
+    def summary(self):
+        """Final record for streaming responses"""
+        return {
+            'type': 'summary',
+            'total': self.total,
+            'successful': self.successful,
+            'timestamp': datetime.now().isoformat()
+        }
+
+def batch_predict_response(uploads):
+    """Batch prediction payload for a list of (filename, read) uploads
+
+    ``read`` is called only for files with an allowed extension.
+    """
+    try:
+        results = [None] * len(uploads)
+        run = BatchPredictionRun(get_engine())
         
-        return jsonify({
+        for filename, read in uploads:
+            for index, record in run.add(filename, read):
+                results[index] = record
+        for index, record in run.finish():
+            results[index] = record
+        
+        return {
             'results': results,
-            'total': len(files),
+            'total': len(uploads),
             'successful': sum(1 for r in results if r['status'] == 'success'),
             'timestamp': datetime.now().isoformat()
-        }), 200
+        }, 200
     
     except Exception as e:
         logger.error("Batch prediction error: %s", str(e), exc_info=True)
-        return jsonify({'error': 'Batch prediction failed: ' + str(e)}), 500
+        return {'error': 'Batch prediction failed: ' + str(e)}, 500
 
-@app.route('/api/stats', methods=['GET'])
-def stats():
-    """Get model statistics"""
+def stream_batch_predictions(uploads):
+    """NDJSON lines for an iterable of (filename, data) uploads, one per file as its chunk finishes"""
+    run = BatchPredictionRun(get_engine())
+    try:
+        for filename, data in uploads:
+            for index, record in run.add(filename, lambda data=data: data):
+                yield ndjson_line({'type': 'result', 'index': index, **record})
+        for index, record in run.finish():
+            yield ndjson_line({'type': 'result', 'index': index, **record})
+    except Exception as e:
+        logger.error("Streaming batch prediction error: %s", str(e), exc_info=True)
+        yield ndjson_line({'type': 'error', 'error': 'Batch prediction failed: ' + str(e)})
+    yield ndjson_line(run.summary())
+
+def wants_stream(args, accept):
+    """Streaming is requested with ?stream=ndjson (or 1/true) or an NDJSON Accept header"""
+    return args.get('stream', '').lower() in ('ndjson', '1', 'true') or NDJSON_MIMETYPE in (accept or '')
+
+def stats_response():
+    """Model statistics payload"""
     try:
         metrics = get_metrics()
         
         if not metrics:
-            return jsonify({'error': 'Model metrics not available'}), 404
+            return {'error': 'Model metrics not available'}, 404
         
+        bundle = get_bundle()
         response = {
             'model_name': 'jaundice_detection_model',
-            'version': '1.0',
+            'version': bundle.version,
+            'threshold': bundle.threshold,
             'training_date': metrics.get('training_date', ''),
             'metrics': {
                 'accuracy': metrics.get('accuracy', 0),
@@ -285,11 +765,182 @@ def stats():
             'test_samples': metrics.get('total_samples', 0)
         }
         
-        return jsonify(response), 200
+        return response, 200
     
     except Exception as e:
         logger.error("Error getting stats: %s", str(e))
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
+
+def runtime_stats_response():
+    """Serving runtime statistics payload"""
+    return {
+        'batching': {
+            'enabled': BATCHING_ENABLED,
+            **(_batcher.get_stats() if _batcher is not None else {})
+        },
+        'cache': {
+            'enabled': CACHE_ENABLED,
+            'model_version': _model_version,
+            **_prediction_cache.get_stats()
+        },
+        'tensor_cache': {
+            'enabled': TENSOR_CACHE_ENABLED,
+            'preprocess_version': _preprocess_version,
+            **(_tensor_cache.get_stats() if _tensor_cache is not None else {})
+        },
+        'profiling': _profiler.stats(),
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
+def admin_authorized(token):
+    """Admin endpoints stay closed until ADMIN_TOKEN is set, then require it"""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token or '', ADMIN_TOKEN)
+
+def profiles_response(token):
+    """Profiler settings and the buffered request traces, newest first"""
+    if not _profiler.enabled:
+        return {'error': 'Profiling is disabled'}, 404
+    if not admin_authorized(token):
+        return {'error': 'Forbidden'}, 403
+    return {
+        **_profiler.stats(),
+        'traces': [trace.to_dict() for trace in _profiler.traces()]
+    }, 200
+
+def profile_response(trace_id, token):
+    """One buffered trace with its Python profile, if it has one"""
+    if not _profiler.enabled:
+        return {'error': 'Profiling is disabled'}, 404
+    if not admin_authorized(token):
+        return {'error': 'Forbidden'}, 403
+    trace = _profiler.get(trace_id)
+    if trace is None:
+        return {'error': f'Trace {trace_id} is not in the buffer'}, 404
+    return trace.to_dict(profile=True), 200
+
+def dump_profiles_response(token):
+    """Write the buffered traces to PROFILE_DUMP_DIR"""
+    if not _profiler.enabled:
+        return {'error': 'Profiling is disabled'}, 404
+    if not admin_authorized(token):
+        return {'error': 'Forbidden'}, 403
+    try:
+        directory, count = _profiler.dump()
+    except OSError as e:
+        logger.error("Error dumping profiles: %s", str(e))
+        return {'error': str(e)}, 500
+    return {'directory': str(directory), 'traces': count}, 200
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    payload, status = health_response()
+    return jsonify(payload), status
+
+@app.route('/api/model/info', methods=['GET'])
+def model_info():
+    """Get model information"""
+    payload, status = model_info_response()
+    return jsonify(payload), status
+
+@app.route('/api/predict', methods=['POST'])
+def predict():
+    """Predict jaundice from uploaded image"""
+    # Check if file is in request
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+    
+    file = request.files['file']
+    started = time.perf_counter()
+    image_data = file.read()
+    observe_stage('upload_read', time.perf_counter() - started)
+    payload, status = predict_response(file.filename, image_data)
+    return json_response(payload, status)
+
+@app.route('/api/batch-predict', methods=['POST'])
+def batch_predict():
+    """Batch predict from multiple images"""
+    if wants_stream(request.args, request.headers.get('Accept')):
+        return batch_predict_stream()
+    
+    if 'files' not in request.files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    files = request.files.getlist('files')
+    
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    payload, status = batch_predict_response([(file.filename, file.read) for file in files])
+    return json_response(payload, status)
+
+def json_response(payload, status):
+    """jsonify a prediction payload, timed as the serialize stage"""
+    started = time.perf_counter()
+    response = jsonify(payload)
+    observe_stage('serialize', time.perf_counter() - started)
+    return response, status
+
+def batch_predict_stream():
+    """Stream NDJSON results while the multipart body is still being parsed"""
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    try:
+        get_engine()
+    except Exception as e:
+        logger.error("Batch prediction error: %s", str(e), exc_info=True)
+        return jsonify({'error': 'Batch prediction failed: ' + str(e)}), 500
+    
+    uploads = iter_uploads(request.stream.read, boundary, max_file_size=MAX_FILE_SIZE)
+    # Wait for the first file, so an empty upload gets the same 400 as a buffered one
+    try:
+        first = next(uploads, None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
+    if first is None:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    uploads = itertools.chain([first], uploads)
+    return Response(stream_with_context(stream_batch_predictions(uploads)), mimetype=NDJSON_MIMETYPE)
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """Get model statistics"""
+    payload, status = stats_response()
+    return jsonify(payload), status
+
+@app.route('/api/runtime/stats', methods=['GET'])
+def runtime_stats():
+    """Get serving runtime statistics"""
+    payload, status = runtime_stats_response()
+    return jsonify(payload), status
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def profiles():
+    """List buffered request traces"""
+    payload, status = profiles_response(request.headers.get('X-Admin-Token'))
+    return jsonify(payload), status
+
+@app.route('/api/admin/profiles/<int:trace_id>', methods=['GET'])
+def profile(trace_id):
+    """Get one request trace with its Python profile"""
+    payload, status = profile_response(trace_id, request.headers.get('X-Admin-Token'))
+    return jsonify(payload), status
+
+@app.route('/api/admin/profiles/dump', methods=['POST'])
+def dump_profiles():
+    """Dump buffered request traces to logs/"""
+    payload, status = dump_profiles_response(request.headers.get('X-Admin-Token'))
+    return jsonify(payload), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this worker"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Endpoint not found'}), 404
+    return Response(metrics_text(), content_type=METRICS_CONTENT_TYPE)
 
 @app.errorhandler(404)
 def not_found(error):
@@ -304,24 +955,48 @@ def internal_error(error):
 
 @app.before_request
 def before_request():
-    """Log incoming requests"""
+    """Log incoming requests and start timing them"""
     logger.debug("%s %s", request.method, request.path)
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+        _in_flight.inc()
+    if _profiler.enabled:
+        trace = _profiler.begin(request.method, request.url_rule.rule if request.url_rule else None)
+        if trace is not None:
+            g.trace = trace
+            if trace.profile is not None:
+                trace.profile.enable()
 
 @app.after_request
 def after_request(response):
-    """Log response status"""
+    """Log response status and record request metrics"""
     logger.debug("Response status: %d", response.status_code)
+    if METRICS_ENABLED and 'request_started' in g:
+        # Route patterns, not raw paths, so unknown URLs can't grow the label set
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(route, request.method, response.status_code, time.perf_counter() - g.request_started)
+    if 'trace' in g:
+        g.trace.status = response.status_code
     return response
 
+@app.teardown_request
+def teardown_request(error):
+    """Close the in-flight count and any profiling trace, even when the request raised"""
+    if METRICS_ENABLED and g.pop('request_started', None) is not None:
+        _in_flight.dec()
+    trace = g.pop('trace', None)
+    if trace is not None:
+        _profiler.end(trace, 500 if error is not None else None)
+
 if __name__ == '__main__':
     try:
         logger.info("=" * 80)
         logger.info("Starting Jaundice Detection API Server")
         logger.info("=" * 80)
-        logger.info("Loading model from: %s", MODEL_PATH)
+        logger.info("Loading model from: %s (backend: %s)", MODEL_PATH, MODEL_BACKEND)
         
-        # Pre-load model
-        get_model()
+        # Pre-load and warm up model
+        get_engine()
         get_metrics()
         
         logger.info("Server starting on http://localhost:%d", PORT)
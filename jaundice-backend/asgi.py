@@ -0,0 +1,324 @@
+"""
+ASGI configuration for async serving
+Use with uvicorn: uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Serves the same routes and responses as the Flask app. Uploads are read
+asynchronously, so slow clients only hold an idle coroutine. Decode and
+inference run in a bounded thread pool, so thousands of open connections
+can't pile unbounded CPU work onto a worker. PIL, TensorFlow, TFLite and
+ONNX Runtime all release the GIL while they compute.
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+import app as core
+from profiling import current_trace
+from streaming import NDJSON_MIMETYPE, MultipartFileParser, ndjson_line
+
+logger = logging.getLogger(__name__)
+
+# Threads running decode + inference, and how many requests may wait for one
+ASGI_INFERENCE_WORKERS = int(os.getenv('ASGI_INFERENCE_WORKERS', os.cpu_count() or 4))
+ASGI_MAX_PENDING = int(os.getenv('ASGI_MAX_PENDING', 64))
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_INFERENCE_WORKERS, thread_name_prefix='inference')
+_pending = asyncio.Semaphore(ASGI_INFERENCE_WORKERS + ASGI_MAX_PENDING)
+
+
+async def offload(func, *args):
+    """Run CPU-bound work in the bounded pool, waiting for a slot when it is saturated"""
+    async with _pending:
+        loop = asyncio.get_running_loop()
+        trace = current_trace()
+        if trace is None:
+            return await loop.run_in_executor(_executor, func, *args)
+        # Carry the request's profiling trace (a context variable) into the pool thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_executor, context.run, trace.profiled, func, *args)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body generator may still be reading the request
+
+    The stock class listens for a client disconnect on ``receive`` while it
+    streams, which would swallow request body chunks. Reading the body raises
+    ``ClientDisconnect`` on its own, so that listener isn't needed here.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _is_upload(value):
+    return value is not None and not isinstance(value, str)
+
+
+async def read_upload(upload):
+    """Read an uploaded file, timed as the upload_read stage"""
+    started = time.perf_counter()
+    data = await upload.read()
+    core.observe_stage('upload_read', time.perf_counter() - started)
+    return data
+
+
+def json_response(payload, status):
+    """JSONResponse for a prediction payload, timed as the serialize stage"""
+    started = time.perf_counter()
+    response = JSONResponse(payload, status_code=status)
+    core.observe_stage('serialize', time.perf_counter() - started)
+    return response
+
+
+class InstrumentationMiddleware:
+    """Request metrics and profiling traces, as the Flask request hooks record them
+
+    Latency here runs until the last body chunk is sent, so it includes
+    streamed responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not (core.METRICS_ENABLED or core._profiler.enabled):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        route = route_label(scope)
+        trace = core._profiler.begin(scope['method'], route) if core._profiler.enabled else None
+
+        async def send_and_record(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        if core.METRICS_ENABLED:
+            core._in_flight.inc()
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            if trace is not None:
+                core._profiler.end(trace, status)
+            if core.METRICS_ENABLED:
+                core._in_flight.dec()
+                core.record_request(route, scope['method'], status, time.perf_counter() - started)
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    payload, status = await offload(core.health_response)
+    return JSONResponse(payload, status_code=status)
+
+
+async def model_info(request):
+    """Get model information"""
+    payload, status = await offload(core.model_info_response)
+    return JSONResponse(payload, status_code=status)
+
+
+async def predict(request):
+    """Predict jaundice from uploaded image"""
+    form = await request.form()
+    try:
+        upload = form.get('file')
+        if not _is_upload(upload):
+            return JSONResponse({'error': 'No file provided'}, status_code=400)
+
+        image_data = await read_upload(upload)
+        payload, status = await offload(core.predict_response, upload.filename or '', image_data)
+        return json_response(payload, status)
+    finally:
+        await form.close()
+
+
+async def batch_predict(request):
+    """Batch predict from multiple images"""
+    if core.wants_stream(request.query_params, request.headers.get('accept')):
+        return await batch_predict_stream(request)
+
+    form = await request.form()
+    try:
+        files = [f for f in form.getlist('files') if _is_upload(f)]
+        if not files:
+            return JSONResponse({'error': 'No files provided'}, status_code=400)
+
+        uploads = []
+        for upload in files:
+            data = await read_upload(upload)
+            uploads.append((upload.filename or '', lambda data=data: data))
+
+        payload, status = await offload(core.batch_predict_response, uploads)
+        return json_response(payload, status)
+    finally:
+        await form.close()
+
+
+async def batch_predict_stream(request):
+    """Stream NDJSON results while the multipart body is still arriving"""
+    content_type = request.headers.get('content-type', '')
+    boundary = None
+    if content_type.split(';')[0].strip() == 'multipart/form-data':
+        for param in content_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'boundary':
+                boundary = value.strip('"')
+    if not boundary:
+        return JSONResponse({'error': 'No files provided'}, status_code=400)
+
+    try:
+        await offload(core.get_engine)
+    except Exception as e:
+        logger.error("Batch prediction error: %s", str(e), exc_info=True)
+        return JSONResponse({'error': 'Batch prediction failed: ' + str(e)}, status_code=500)
+
+    # Wait for the first file, so an empty upload gets the same 400 as a buffered one
+    parser = MultipartFileParser(boundary, max_file_size=core.MAX_FILE_SIZE)
+    body = request.stream()
+    first = []
+    try:
+        async for chunk in body:
+            first = parser.feed(chunk)
+            if first:
+                break
+        else:
+            first = parser.close()
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=413)
+    if not first:
+        return JSONResponse({'error': 'No files provided'}, status_code=400)
+
+    async def lines():
+        run = core.BatchPredictionRun(core.get_engine())
+
+        async def score(uploads):
+            records = []
+            for filename, data in uploads:
+                records += await offload(run.add, filename, lambda data=data: data)
+            return records
+
+        try:
+            for index, record in await score(first):
+                yield ndjson_line({'type': 'result', 'index': index, **record})
+            async for chunk in body:
+                for index, record in await score(parser.feed(chunk)):
+                    yield ndjson_line({'type': 'result', 'index': index, **record})
+            records = await score(parser.close()) + await offload(run.finish)
+            for index, record in records:
+                yield ndjson_line({'type': 'result', 'index': index, **record})
+        except Exception as e:
+            logger.error("Streaming batch prediction error: %s", str(e), exc_info=True)
+            yield ndjson_line({'type': 'error', 'error': 'Batch prediction failed: ' + str(e)})
+        yield ndjson_line(run.summary())
+
+    return BodyStreamingResponse(lines(), media_type=NDJSON_MIMETYPE)
+
+
+async def stats(request):
+    """Get model statistics"""
+    payload, status = await offload(core.stats_response)
+    return JSONResponse(payload, status_code=status)
+
+
+async def runtime_stats(request):
+    """Get serving runtime statistics"""
+    payload, status = core.runtime_stats_response()
+    payload['asgi'] = {
+        'inference_workers': ASGI_INFERENCE_WORKERS,
+        'max_pending': ASGI_MAX_PENDING
+    }
+    return JSONResponse(payload, status_code=status)
+
+
+async def profiles(request):
+    """List buffered request traces"""
+    payload, status = core.profiles_response(request.headers.get('x-admin-token'))
+    return JSONResponse(payload, status_code=status)
+
+
+async def profile(request):
+    """Get one request trace with its Python profile"""
+    payload, status = core.profile_response(request.path_params['trace_id'], request.headers.get('x-admin-token'))
+    return JSONResponse(payload, status_code=status)
+
+
+async def dump_profiles(request):
+    """Dump buffered request traces to logs/"""
+    payload, status = await offload(core.dump_profiles_response, request.headers.get('x-admin-token'))
+    return JSONResponse(payload, status_code=status)
+
+
+async def metrics(request):
+    """Prometheus metrics for this worker"""
+    if not core.METRICS_ENABLED:
+        return JSONResponse({'error': 'Endpoint not found'}, status_code=404)
+    return Response(core.metrics_text(), headers={'content-type': core.METRICS_CONTENT_TYPE})
+
+
+async def http_error(request, exc):
+    """Return JSON errors like the Flask app"""
+    if exc.status_code == 404:
+        return JSONResponse({'error': 'Endpoint not found'}, status_code=404)
+    return JSONResponse({'error': exc.detail}, status_code=exc.status_code)
+
+
+async def startup():
+    """Load and warm up the model before serving"""
+    await offload(core.warmup_worker)
+
+
+routes = [
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/api/model/info', model_info, methods=['GET']),
+    Route('/api/predict', predict, methods=['POST']),
+    Route('/api/batch-predict', batch_predict, methods=['POST']),
+    Route('/api/stats', stats, methods=['GET']),
+    Route('/api/runtime/stats', runtime_stats, methods=['GET']),
+    Route('/api/admin/profiles', profiles, methods=['GET']),
+    Route('/api/admin/profiles/dump', dump_profiles, methods=['POST']),
+    Route('/api/admin/profiles/{trace_id:int}', profile, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+]
+# Label each route with its Flask rule ('{trace_id:int}' -> '<int:trace_id>'),
+# so both servers export the same metric and trace labels
+ROUTE_LABELS = {
+    route.path: re.sub(r'\{(\w+)(?::(\w+))?\}',
+                       lambda m: f'<{m.group(2)}:{m.group(1)}>' if m.group(2) else f'<{m.group(1)}>', route.path)
+    for route in routes
+}
+
+
+def route_label(scope):
+    """The Flask-style rule of the route that fully matches a request, else 'unmatched'"""
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return ROUTE_LABELS[route.path]
+    return 'unmatched'
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(InstrumentationMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    exception_handlers={HTTPException: http_error},
+    on_startup=[startup],
+)
@@ -0,0 +1,200 @@
+"""
+Dynamic micro-batching for single-image predictions
+Gathers concurrent requests into one forward pass and hands each caller its own result
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import Counter, deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    """A single queued image waiting for its prediction"""
+
+    __slots__ = ('image', 'enqueued_at', 'event', 'result', 'error', 'cancelled')
+
+    def __init__(self, image):
+        self.image = image
+        self.enqueued_at = time.perf_counter()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+
+class MicroBatcher:
+    """Collect concurrent single-image requests and run them through the model in batches
+
+    ``submit`` waits at most ``submit_timeout`` seconds (None waits forever)
+    and then raises TimeoutError, so a stuck or dead worker thread can't hang
+    its callers. A dead worker is restarted by the next ``submit``.
+    ``on_batch(batch_size, wait_seconds)`` is called after every forward pass.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, stats_window=1000,
+                 submit_timeout=None, on_batch=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.submit_timeout = submit_timeout
+        self.on_batch = on_batch
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        # Stats
+        self._batch_sizes = Counter()
+        self._wait_times = deque(maxlen=stats_window)
+        self._batch_times = deque(maxlen=stats_window)
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._timeouts = 0
+        self.restarts = 0
+
+    def _ensure_started(self):
+        """Start the worker thread (again after a fork, since threads do not survive it)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            elif self._thread is not None:
+                self.restarts += 1
+                logger.error("Micro-batcher worker thread died; restarting it (restart %d)", self.restarts)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._thread.start()
+            logger.info("Micro-batcher started (max_batch_size=%d, max_wait_ms=%.1f)",
+                        self.max_batch_size, self.max_wait * 1000)
+
+    def submit(self, image, timeout=None):
+        """Queue one preprocessed image of shape (1, H, W, C) and block until its probability is ready
+
+        ``timeout`` defaults to ``submit_timeout``.
+        """
+        self._ensure_started()
+        pending = _PendingRequest(image)
+        self._queue.put(pending)
+
+        if not pending.event.wait(self.submit_timeout if timeout is None else timeout):
+            pending.cancelled = True
+            with self._lock:
+                self._timeouts += 1
+            alive = self._thread.is_alive()
+            raise TimeoutError(f"Timed out waiting for batched prediction (worker thread {'busy' if alive else 'dead'})")
+        if pending.error is not None:
+            raise pending.error
+        if pending.result is None:
+            raise RuntimeError("Micro-batcher worker thread died before finishing this batch")
+        return pending.result
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires
+
+        Requests whose caller already timed out are dropped.
+        """
+        first = self._queue.get()
+        while first.cancelled:
+            first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    pending = self._queue.get_nowait()
+                else:
+                    pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if not pending.cancelled:
+                batch.append(pending)
+        return batch
+
+    def _run(self):
+        """Worker loop: one forward pass per collected batch"""
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            finally:
+                # Release the callers even if this thread is about to die
+                for pending in batch:
+                    pending.event.set()
+
+    def _process(self, batch):
+        """Run one batch and record its stats"""
+        started = time.perf_counter()
+
+        try:
+            inputs = np.concatenate([p.image for p in batch], axis=0)
+            outputs = np.asarray(self.predict_fn(inputs)).reshape(len(batch), -1)[:, 0]
+            for pending, output in zip(batch, outputs):
+                pending.result = float(output)
+        except Exception as e:
+            logger.error("Batched prediction failed: %s", str(e), exc_info=True)
+            self._errors += 1
+            for pending in batch:
+                pending.error = e
+
+        finished = time.perf_counter()
+        waits = [started - p.enqueued_at for p in batch]
+        with self._lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._batch_sizes[len(batch)] += 1
+            self._batch_times.append(finished - started)
+            self._wait_times.extend(waits)
+        if self.on_batch is not None:
+            self.on_batch(len(batch), waits)
+
+    def get_queue_depth(self):
+        return self._queue.qsize()
+
+    def get_stats(self):
+        """Queue depth, batch-size histogram and wait-time percentiles"""
+        with self._lock:
+            wait_ms = np.array(self._wait_times, dtype=np.float64) * 1000
+            batch_ms = np.array(self._batch_times, dtype=np.float64) * 1000
+            histogram = {str(size): count for size, count in sorted(self._batch_sizes.items())}
+            requests, batches, errors, timeouts = self._requests, self._batches, self._errors, self._timeouts
+
+        def summarize(values):
+            if values.size == 0:
+                return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            return {
+                'mean': float(values.mean()),
+                'p50': float(p50),
+                'p95': float(p95),
+                'p99': float(p99),
+                'max': float(values.max())
+            }
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+            'requests': requests,
+            'batches': batches,
+            'errors': errors,
+            'timeouts': timeouts,
+            'restarts': self.restarts,
+            'mean_batch_size': requests / batches if batches else 0.0,
+            'batch_size_histogram': histogram,
+            'wait_ms': summarize(wait_ms),
+            'batch_ms': summarize(batch_ms)
+        }
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Jaundice Detection backend
+Run from the jaundice-backend directory, e.g. python -m benchmarks.bench_preprocessing
+"""
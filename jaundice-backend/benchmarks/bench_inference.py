@@ -0,0 +1,249 @@
+"""
+Inference microbenchmark and regression gate
+Times preprocess, forward pass and postprocess per batch size for each available backend, without HTTP
+
+Usage: python -m benchmarks.bench_inference [--backends keras,keras-function,tflite,onnx] [--batch-sizes 1,2,4,...,128]
+       [--threads 4] [--save-baseline] [--max-regression 0.10]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.loadtest import DATASET_TEST_PATH, load_images, git_revision
+
+BACKENDS = ('keras', 'keras-function', 'tflite', 'onnx')
+DEFAULT_BATCH_SIZES = '1,2,4,8,16,32,64,128'
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "bench_inference.json"
+STAGES = ('preprocess', 'forward', 'postprocess')
+
+
+def configure_threads(threads):
+    """Size TensorFlow's thread pools before it runs anything; returns the effective settings"""
+    settings = {'threads': threads, 'cpus': os.cpu_count()}
+    if hasattr(os, 'sched_getaffinity'):
+        settings['affinity'] = len(os.sched_getaffinity(0))
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return settings
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(2)
+    settings['tf_intra_op'] = tf.config.threading.get_intra_op_parallelism_threads()
+    settings['tf_inter_op'] = tf.config.threading.get_inter_op_parallelism_threads()
+    return settings
+
+
+def load_forward(backend, app_module, threads=None):
+    """(forward function, versions) for a backend; raises when it can't run here"""
+    from inference import InferenceEngine, TFLiteEngine, OnnxEngine
+
+    if backend == 'keras':
+        # The plain Model.predict path, for comparison with the traced function
+        model = app_module.get_model()
+        import tensorflow as tf
+        return (lambda batch: model.predict(batch, verbose=0).reshape(-1)), {'tensorflow': tf.__version__}
+    if backend == 'keras-function':
+        import tensorflow as tf
+        engine = InferenceEngine(app_module.get_model(), warmup_batch_sizes=())
+        return engine.predict, {'tensorflow': tf.__version__}
+    if backend == 'tflite':
+        engine = TFLiteEngine(app_module.TFLITE_MODEL_PATH, pool_size=1,
+                              num_threads=threads or app_module.TFLITE_NUM_THREADS, warmup_batch_sizes=())
+        return engine.predict, {}
+    if backend == 'onnx':
+        import onnxruntime
+        engine = OnnxEngine(app_module.ONNX_MODEL_PATH, intra_op_threads=threads or app_module.ORT_INTRA_OP_THREADS,
+                            inter_op_threads=app_module.ORT_INTER_OP_THREADS, warmup_batch_sizes=())
+        return engine.predict, {'onnxruntime': onnxruntime.__version__}
+    raise ValueError(f"Unknown backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+
+
+def time_batch(payloads, batch, preprocess, forward, postprocess):
+    """Seconds spent in each stage for one batch"""
+    started = time.perf_counter()
+    for i, data in enumerate(payloads):
+        preprocess(data, out=batch[i])
+    preprocessed = time.perf_counter()
+    probs = forward(batch)
+    forwarded = time.perf_counter()
+    postprocess(probs)
+    return preprocessed - started, forwarded - preprocessed, time.perf_counter() - forwarded
+
+
+def bench_batch_size(batch_size, images, preprocess, forward, postprocess, img_size, warmup=3, repeats=10):
+    """Median stage times (ms) and throughput for one batch size over ``repeats`` timed runs"""
+    batch = np.empty((batch_size, img_size, img_size, 3), dtype=np.float32)
+    runs = []
+    for run in range(warmup + repeats):
+        start = (run * batch_size) % len(images)
+        payloads = [images[(start + i) % len(images)][1] for i in range(batch_size)]
+        timings = time_batch(payloads, batch, preprocess, forward, postprocess)
+        if run >= warmup:
+            runs.append(timings)
+
+    runs = np.array(runs) * 1000
+    totals = runs.sum(axis=1)
+    result = {'batch_size': batch_size, 'repeats': repeats}
+    for stage, column in zip(STAGES, runs.T):
+        result[f'{stage}_ms'] = float(np.median(column))
+    result['total_ms'] = float(np.median(totals))
+    result['total_p95_ms'] = float(np.percentile(totals, 95))
+    result['images_per_sec'] = batch_size / (result['total_ms'] / 1000)
+    result['forward_images_per_sec'] = batch_size / (result['forward_ms'] / 1000)
+    return result
+
+
+def compare(results, baseline, max_regression):
+    """Cases whose throughput fell more than ``max_regression`` below the baseline"""
+    previous = {(r['backend'], r['batch_size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for r in results:
+        before = previous.get((r['backend'], r['batch_size']))
+        if before is None:
+            continue
+        change = r['images_per_sec'] / before['images_per_sec'] - 1
+        r['baseline_images_per_sec'] = before['images_per_sec']
+        r['change'] = change
+        if change < -max_regression:
+            regressions.append(r)
+    return regressions
+
+
+def print_report(results, environment, skipped):
+    print("\n" + "=" * 96)
+    print(f"INFERENCE BENCHMARK (threads {environment['threads'] or 'default'}, {environment['cpus']} CPUs, "
+          f"revision {environment['revision']})")
+    print("=" * 96)
+    print(f"{'backend':<16}{'batch':>6}{'prep ms':>10}{'fwd ms':>10}{'post ms':>9}{'total ms':>10}"
+          f"{'p95 ms':>9}{'img/s':>9}{'fwd img/s':>11}{'vs base':>9}")
+    for r in results:
+        change = f"{r['change'] * 100:+.1f}%" if 'change' in r else ''
+        print(f"{r['backend']:<16}{r['batch_size']:>6}{r['preprocess_ms']:>10.2f}{r['forward_ms']:>10.2f}"
+              f"{r['postprocess_ms']:>9.3f}{r['total_ms']:>10.2f}{r['total_p95_ms']:>9.2f}"
+              f"{r['images_per_sec']:>9.1f}{r['forward_images_per_sec']:>11.1f}{change:>9}")
+    for backend, reason in skipped.items():
+        print(f"{backend:<16}skipped: {reason}")
+    print("=" * 96 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference microbenchmark and regression gate")
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help='Comma-separated backends to run; unavailable ones are skipped')
+    parser.add_argument('--batch-sizes', default=DEFAULT_BATCH_SIZES, help='Comma-separated batch sizes')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed runs per batch size')
+    parser.add_argument('--repeats', type=int, default=10, help='Timed runs per batch size')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='CPU threads for TF intra-op, TFLite and ONNX Runtime (default: each runtime\'s own)')
+    parser.add_argument('--images', default=str(DATASET_TEST_PATH), help='Directory of input images')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Write this run as the new baseline')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='Fail when images/sec drops by more than this fraction of the baseline')
+    parser.add_argument('--output', default=None, help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error(f"Unknown backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    batch_sizes = sorted({int(s) for s in args.batch_sizes.split(',') if s.strip()})
+
+    environment = {
+        **configure_threads(args.threads),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now().isoformat()
+    }
+
+    import app as app_module
+    from model_bundle import postprocess
+
+    images = load_images(args.images)
+    threshold = app_module.get_bundle().threshold
+
+    def post(probs):
+        return postprocess(probs, threshold)
+
+    results, skipped, versions = [], {}, {}
+    for backend in backends:
+        try:
+            forward, backend_versions = load_forward(backend, app_module, args.threads)
+        except (ImportError, FileNotFoundError, OSError) as e:
+            skipped[backend] = str(e).splitlines()[0]
+            continue
+        versions.update(backend_versions)
+        for batch_size in batch_sizes:
+            result = bench_batch_size(batch_size, images, app_module.preprocess_image, forward, post,
+                                      app_module.IMG_SIZE, args.warmup, args.repeats)
+            results.append({'backend': backend, **result})
+            print(f"{backend} batch {batch_size}: {result['images_per_sec']:.1f} img/s", flush=True)
+    environment['versions'] = versions
+
+    if not results:
+        print(f"No backend could run: {skipped}")
+        return 1
+
+    baseline_path = Path(args.baseline)
+    baseline = None
+    if baseline_path.exists() and not args.save_baseline:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_regression) if baseline else []
+
+    print_report(results, environment, skipped)
+    if baseline:
+        before = baseline['environment']
+        for key in ('threads', 'cpus', 'affinity', 'machine'):
+            if before.get(key) != environment.get(key):
+                print(f"Warning: baseline {key} was {before.get(key)}, now {environment.get(key)}; "
+                      f"throughput may not be comparable")
+
+    report = {
+        'environment': environment,
+        'settings': {'warmup': args.warmup, 'repeats': args.repeats, 'batch_sizes': batch_sizes},
+        'skipped': skipped,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return 0
+
+    if regressions:
+        print(f"FAILED: {len(regressions)} case(s) regressed more than {args.max_regression:.0%} "
+              f"against {baseline['environment'].get('revision')}:")
+        for r in regressions:
+            print(f"  {r['backend']} batch {r['batch_size']}: {r['baseline_images_per_sec']:.1f} -> "
+                  f"{r['images_per_sec']:.1f} img/s ({r['change'] * 100:+.1f}%)")
+        return 1
+
+    print(f"OK: no case regressed more than {args.max_regression:.0%} against "
+          f"{baseline['environment'].get('revision')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
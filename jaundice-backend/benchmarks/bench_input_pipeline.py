@@ -0,0 +1,58 @@
+"""
+Training input pipeline benchmark
+Compares images/sec of the legacy ImageDataGenerator against the tf.data pipelines, without a model
+
+Usage: python -m benchmarks.bench_input_pipeline [--epochs 3] [--split train]
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training input pipeline benchmark")
+    parser.add_argument('--epochs', type=int, default=3, help='Passes over the split per pipeline')
+    parser.add_argument('--split', choices=['train', 'validate', 'test'], default='train',
+                        help='Split to iterate (train includes augmentation)')
+    parser.add_argument('--output', default=None, help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    import train_model
+    from data_pipeline import measure_input_throughput
+
+    index = ['train', 'validate', 'test'].index(args.split)
+    results = {}
+    for pipeline in ('generator', 'tfdata', 'cached'):
+        data = train_model.load_data(pipeline, cache_eval='memory')[index]
+        epochs = [measure_input_throughput(data) for _ in range(args.epochs)]
+        results[pipeline] = {
+            'samples': data.samples,
+            'epochs': epochs,
+            'best_images_per_sec': max(e['images_per_sec'] for e in epochs)
+        }
+
+    baseline = results['generator']['best_images_per_sec'] or 1
+    speedups = {name: result['best_images_per_sec'] / baseline for name, result in results.items()}
+    print("\n" + "=" * 60)
+    print(f"INPUT PIPELINE BENCHMARK ({args.split}, {results['generator']['samples']} images)")
+    print("=" * 60)
+    print(f"{'pipeline':<12}" + "".join(f"{f'epoch {i + 1}':>12}" for i in range(args.epochs)))
+    for pipeline, result in results.items():
+        print(f"{pipeline:<12}" + "".join(f"{e['images_per_sec']:>12.1f}" for e in result['epochs']))
+    print("\nSpeedup vs generator (best epoch): "
+          + ", ".join(f"{name} {speedup:.2f}x" for name, speedup in speedups.items() if name != 'generator'))
+    print("=" * 60 + "\n")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'split': args.split, 'results': results, 'speedups': speedups}, f, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Preprocessing microbenchmark
+Compares decode+resize time and peak memory of the legacy PIL path against preprocessing.py
+
+Usage: python -m benchmarks.bench_preprocessing [--limit 200] [--filters lanczos,bilinear]
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import resource
+import tracemalloc
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import IMAGE_EXTENSIONS
+
+IMG_SIZE = 224
+DATASET_PATH = Path(__file__).resolve().parent.parent.parent / "datasets"
+
+
+def legacy_preprocess(image_data):
+    """The original app.preprocess_image: full decode, LANCZOS, three array copies"""
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_data))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img = img.resize((IMG_SIZE, IMG_SIZE), Image.Resampling.LANCZOS)
+    img_array = np.array(img, dtype=np.float32)
+    img_array = img_array / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def _run_variant(variant, paths, result_queue):
+    """Time one variant over all images in a fresh process so RSS peaks don't mix"""
+    import preprocessing
+
+    payloads = [Path(p).read_bytes() for p in paths]
+    buffer = np.empty((IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+
+    if variant['name'] == 'legacy':
+        run = legacy_preprocess
+    else:
+        def run(data):
+            return preprocessing.preprocess_into(data, buffer, IMG_SIZE,
+                                                 resample=variant['resample'], draft=variant['draft'])
+
+    run(payloads[0])  # import/codec warmup
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = np.empty(len(payloads), dtype=np.float64)
+    tracemalloc.start()
+    for i, data in enumerate(payloads):
+        started = time.perf_counter()
+        run(data)
+        timings[i] = time.perf_counter() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result_queue.put({
+        'variant': variant['name'],
+        'images': len(payloads),
+        'mean_ms': float(timings.mean() * 1000),
+        'p50_ms': float(np.percentile(timings, 50) * 1000),
+        'p95_ms': float(np.percentile(timings, 95) * 1000),
+        'images_per_sec': float(len(payloads) / timings.sum()),
+        'traced_peak_kb': traced_peak / 1024,
+        'rss_growth_kb': max(0, peak_rss - baseline_rss)
+    })
+
+
+def collect_images(dataset_path, limit=None):
+    """All images under the dataset directory, in a stable order"""
+    paths = sorted(
+        str(p) for p in Path(dataset_path).rglob('*')
+        if p.suffix.lower().lstrip('.') in IMAGE_EXTENSIONS
+    )
+    return paths[:limit] if limit else paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocessing microbenchmark")
+    parser.add_argument('--dataset', default=str(DATASET_PATH), help='Directory of images to preprocess')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N images')
+    parser.add_argument('--filters', default='lanczos,bilinear',
+                        help='Comma-separated resample filters to compare')
+    parser.add_argument('--output', default=None, help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    paths = collect_images(args.dataset, args.limit)
+    if not paths:
+        print(f"No images found under {args.dataset}")
+        return 1
+
+    variants = [{'name': 'legacy'}]
+    for name in [f.strip() for f in args.filters.split(',') if f.strip()]:
+        variants.append({'name': name, 'resample': name, 'draft': False})
+        variants.append({'name': f'{name}+draft', 'resample': name, 'draft': True})
+
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for variant in variants:
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=_run_variant, args=(variant, paths, result_queue))
+        process.start()
+        results.append(result_queue.get())
+        process.join()
+
+    legacy_mean = results[0]['mean_ms']
+    print("\n" + "=" * 86)
+    print(f"PREPROCESSING BENCHMARK ({len(paths)} images)")
+    print("=" * 86)
+    print(f"{'variant':<18}{'mean ms':>10}{'p95 ms':>10}{'img/s':>10}{'speedup':>10}"
+          f"{'traced KB':>12}{'RSS +KB':>12}")
+    for r in results:
+        print(f"{r['variant']:<18}{r['mean_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['images_per_sec']:>10.1f}"
+              f"{legacy_mean / r['mean_ms']:>9.2f}x{r['traced_peak_kb']:>12.0f}{r['rss_growth_kb']:>12.0f}")
+    print("=" * 86 + "\n")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'images': len(paths), 'results': results}, f, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+HTTP load test for the serving API
+Replays a mix of /api/predict, /api/batch-predict and /api/health at fixed concurrency and reports latency percentiles
+
+Usage: python -m benchmarks.loadtest [--url http://localhost:5000] [--concurrency 8] [--duration 30]
+       [--mix predict=70,batch=20,health=10] [--batch-sizes 2,4,8,16] [--compare previous.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DATASET_TEST_PATH = BACKEND_DIR.parent / "datasets" / "test"
+RESULTS_PATH = Path(__file__).resolve().parent / "results"
+
+KINDS = ('predict', 'batch', 'health')
+BOUNDARY = 'loadtest-boundary-7d1f0c'
+
+
+def parse_mix(value):
+    """'predict=70,batch=20,health=10' -> {'predict': 0.7, 'batch': 0.2, 'health': 0.1}"""
+    weights = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown request kind '{kind}'. Choose from: {', '.join(KINDS)}")
+        weights[kind] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("The traffic mix needs at least one positive weight")
+    return {kind: weight / total for kind, weight in weights.items() if weight > 0}
+
+
+def load_images(path=DATASET_TEST_PATH, limit=None):
+    """(filename, bytes) for the test images, read once up front"""
+    files = sorted(p for p in Path(path).rglob('*') if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))
+    if not files:
+        raise FileNotFoundError(f"No images found under {path}")
+    return [(p.name, p.read_bytes()) for p in files[:limit]]
+
+
+def multipart_body(field, files):
+    """multipart/form-data body with one part per (filename, bytes)"""
+    parts = []
+    for filename, data in files:
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append(f'--{BOUNDARY}--\r\n'.encode())
+    return b''.join(parts)
+
+
+class TrafficGenerator:
+    """Pick the next request of the mix; one per client thread, so no locking"""
+
+    def __init__(self, images, mix, batch_sizes, bust_cache=True, seed=None):
+        self.images = images
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.batch_sizes = batch_sizes
+        self.bust_cache = bust_cache
+        self.rng = random.Random(seed)
+
+    def _image(self):
+        filename, data = self.rng.choice(self.images)
+        if self.bust_cache:
+            # Decoders ignore bytes after the image; the server's result cache doesn't
+            data = data + self.rng.randbytes(8)
+        return filename, data
+
+    def next(self):
+        """(kind, method, path, body, headers, images)"""
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        if kind == 'health':
+            return kind, 'GET', '/api/health', None, {}, 0
+        headers = {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'}
+        if kind == 'predict':
+            return kind, 'POST', '/api/predict', multipart_body('file', [self._image()]), headers, 1
+        size = self.rng.choice(self.batch_sizes)
+        body = multipart_body('files', [self._image() for _ in range(size)])
+        return kind, 'POST', '/api/batch-predict', body, headers, size
+
+
+def client(base_url, generator, deadline, records, timeout):
+    """Closed loop: send the next request as soon as the previous one returns"""
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    conn = connection_class(url.hostname, url.port, timeout=timeout)
+    prefix = url.path.rstrip('/')
+
+    while time.perf_counter() < deadline:
+        kind, method, path, body, headers, images = generator.next()
+        started = time.perf_counter()
+        try:
+            conn.request(method, prefix + path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            status = None
+        ended = time.perf_counter()
+        records.append((started, ended - started, kind, images, status))
+    conn.close()
+
+
+def summarize(records, seconds):
+    """Throughput and latency percentiles (ms) for a list of request records"""
+    if not records:
+        return {'requests': 0}
+    latencies = np.array([r[1] for r in records]) * 1000
+    ok = [r for r in records if r[4] is not None and r[4] < 400]
+    return {
+        'requests': len(records),
+        'errors': len(records) - len(ok),
+        'requests_per_sec': len(records) / seconds,
+        'images_per_sec': sum(r[3] for r in ok) / seconds,
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max())
+        }
+    }
+
+
+def run_load(base_url, images, mix, batch_sizes, concurrency=8, duration=30.0, warmup=5.0,
+             bust_cache=True, timeout=60.0, seed=0):
+    """Drive ``base_url`` for warmup + duration seconds; only requests started after warmup count"""
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+    per_thread = [[] for _ in range(concurrency)]
+    threads = [
+        threading.Thread(target=client, daemon=True,
+                         args=(base_url, TrafficGenerator(images, mix, batch_sizes, bust_cache, seed + i),
+                               deadline, per_thread[i], timeout))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Requests still in flight at the deadline finish late; count the window they ran in
+    records = [r for records in per_thread for r in records if r[0] >= measure_from]
+    seconds = max(max((r[0] + r[1] for r in records), default=deadline), deadline) - measure_from
+    return {
+        'seconds': seconds,
+        'overall': summarize(records, seconds),
+        'by_kind': {kind: summarize([r for r in records if r[2] == kind], seconds) for kind in mix},
+        'by_status': {str(status): sum(1 for r in records if r[4] == status)
+                      for status in sorted({r[4] for r in records}, key=str)}
+    }
+
+
+def start_in_process_server():
+    """Serve app.py on an ephemeral localhost port from a background thread; returns (url, server, load seconds)"""
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    started = time.perf_counter()
+    app_module.warmup_worker()
+    load_seconds = time.perf_counter() - started
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server, load_seconds
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def server_backend(base_url, timeout=10):
+    """The serving backend the health endpoint reports, if it answers"""
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+    try:
+        conn.request('GET', url.path.rstrip('/') + '/api/health')
+        return json.loads(conn.getresponse().read()).get('backend')
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+    finally:
+        conn.close()
+
+
+def print_report(result):
+    settings = result['settings']
+    print("\n" + "=" * 72)
+    print(f"LOAD TEST ({result['meta']['target']}, backend {result['meta']['backend']}, "
+          f"concurrency {settings['concurrency']}, {result['seconds']:.0f}s)")
+    print("=" * 72)
+    print(f"{'kind':<10}{'requests':>10}{'errors':>8}{'req/s':>9}{'img/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for kind, stats in [*result['by_kind'].items(), ('overall', result['overall'])]:
+        if not stats['requests']:
+            print(f"{kind:<10}{0:>10}")
+            continue
+        latency = stats['latency_ms']
+        print(f"{kind:<10}{stats['requests']:>10}{stats['errors']:>8}{stats['requests_per_sec']:>9.1f}"
+              f"{stats['images_per_sec']:>9.1f}{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}")
+    print(f"Status codes: {result['by_status']}")
+    print("=" * 72 + "\n")
+
+
+def print_comparison(result, baseline):
+    """Per-kind deltas against an earlier result file"""
+    print(f"Compared with {baseline['meta'].get('revision')} / {baseline['meta'].get('backend')} "
+          f"({baseline['meta'].get('timestamp')}):")
+    for kind in [*result['by_kind'], 'overall']:
+        now = result['by_kind'].get(kind) if kind != 'overall' else result['overall']
+        before = baseline['by_kind'].get(kind) if kind != 'overall' else baseline.get('overall')
+        if not now or not before or not now.get('requests') or not before.get('requests'):
+            continue
+        line = [f"  {kind:<9} req/s {before['requests_per_sec']:.1f} -> {now['requests_per_sec']:.1f}"]
+        for p in ('p50', 'p95', 'p99'):
+            b, n = before['latency_ms'][p], now['latency_ms'][p]
+            line.append(f"{p} {b:.1f} -> {n:.1f} ms ({(n - b) / b * 100:+.0f}%)" if b else f"{p} {n:.1f} ms")
+        print(", ".join(line))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test for the serving API")
+    parser.add_argument('--url', default=None,
+                        help='Server to test, e.g. http://localhost:5000 (default: start app.py in-process)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client connections')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds before that')
+    parser.add_argument('--mix', default='predict=70,batch=20,health=10',
+                        help='Traffic mix as kind=weight (kinds: predict, batch, health)')
+    parser.add_argument('--batch-sizes', default='2,4,8,16', help='Image counts for batch-predict requests')
+    parser.add_argument('--images', default=str(DATASET_TEST_PATH), help='Directory of request images')
+    parser.add_argument('--allow-cache-hits', action='store_true',
+                        help="Send images unchanged, so repeats can hit the server's result cache")
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Traffic generator seed')
+    parser.add_argument('--output', default=None,
+                        help='Result JSON (default: benchmarks/results/loadtest-<backend>-<revision>-<time>.json)')
+    parser.add_argument('--compare', default=None, help='Earlier result JSON to print deltas against')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    batch_sizes = [int(s) for s in args.batch_sizes.split(',') if s.strip()]
+    images = load_images(args.images)
+
+    server, load_seconds = None, None
+    base_url = args.url
+    if base_url is None:
+        base_url, server, load_seconds = start_in_process_server()
+
+    try:
+        backend = server_backend(base_url) or os.getenv('MODEL_BACKEND', 'keras')
+        result = run_load(base_url, images, mix, batch_sizes, args.concurrency, args.duration, args.warmup,
+                          not args.allow_cache_hits, args.timeout, args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    result = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'target': 'in-process' if args.url is None else args.url,
+            'backend': backend,
+            'model_load_seconds': load_seconds,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'images': len(images)
+        },
+        'settings': {
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'mix': mix,
+            'batch_sizes': batch_sizes,
+            'cache_busting': not args.allow_cache_hits
+        },
+        **result
+    }
+    print_report(result)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+
+    output = Path(args.output) if args.output else RESULTS_PATH / (
+        f"loadtest-{backend}-{result['meta']['revision'] or 'norev'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
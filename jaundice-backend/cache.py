@@ -0,0 +1,326 @@
+"""
+Content-addressed prediction and preprocessed-tensor caches
+Keyed by a hash of the raw upload bytes plus the model version, with LRU/TTL eviction.
+The in-process backend is per worker; the SQLite backend is shared by every worker on a node.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(data, model_version):
+    """Cache key for raw upload bytes under a given model version"""
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return f"{model_version}:{digest}"
+
+
+class PredictionCache:
+    """Thread-safe LRU cache of prediction results
+
+    Bounded by both entry count and approximate memory. Entries older than
+    ``ttl_seconds`` (when set) are treated as misses and dropped.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl_seconds=None):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_seconds = ttl_seconds or None
+
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    def _sizeof(key, value):
+        if isinstance(value, (bytes, bytearray)):
+            return sys.getsizeof(key) + len(value)
+        return sys.getsizeof(key) + len(json.dumps(value))
+
+    def get(self, key):
+        """Return the cached value or None, refreshing its LRU position"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            value, size, stored_at = entry
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._bytes -= size
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a JSON-serializable value or raw bytes, evicting least recently used entries as needed"""
+        size = self._sizeof(key, value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        """Drop every entry (e.g. after a model reload)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """Hit/miss ratios and occupancy"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / lookups if lookups else 0.0,
+                'miss_ratio': self._misses / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
+
+
+class SQLiteCache:
+    """LRU cache in a SQLite database in WAL mode, shared by all worker processes
+
+    Every worker opens its own connection to the same file, so a result
+    stored by one worker is a hit for the others and survives worker
+    recycling. WAL lets readers proceed while one writer commits; writers
+    serialize on ``BEGIN IMMEDIATE`` and wait up to ``busy_timeout_ms``.
+    Entry count and total size are kept in a stats row by triggers, so
+    eviction never has to scan the table.
+
+    ``codec`` is ``'json'`` for prediction dicts or ``'bytes'`` for raw tensors.
+    Hit/miss counters are per process.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS {table} (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at);
+        CREATE TABLE IF NOT EXISTS {table}_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            entries INTEGER NOT NULL,
+            bytes INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO {table}_totals VALUES (0, 0, 0);
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {table} BEGIN
+            UPDATE {table}_totals SET entries = entries + 1, bytes = bytes + NEW.size;
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {table} BEGIN
+            UPDATE {table}_totals SET entries = entries - 1, bytes = bytes - OLD.size;
+        END;
+    """
+
+    # Only rewrite accessed_at on a hit when it is older than this, so hot
+    # keys don't turn every read into a write.
+    ACCESS_RESOLUTION_SECONDS = 1.0
+
+    def __init__(self, path, namespace='predictions', codec='json', max_entries=10000,
+                 max_bytes=64 * 1024 * 1024, ttl_seconds=None, busy_timeout_ms=5000):
+        if codec not in ('json', 'bytes'):
+            raise ValueError(f"Unknown cache codec: {codec}")
+
+        self.path = str(path)
+        self.table = namespace
+        self.codec = codec
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_seconds = ttl_seconds or None
+        self.busy_timeout_ms = int(busy_timeout_ms)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(self._SCHEMA.format(table=self.table))
+
+    def _connect(self):
+        """One connection per thread and per process (connections must not cross a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms}')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _encode(self, value):
+        if self.codec == 'json':
+            return json.dumps(value).encode('utf-8')
+        return bytes(value)
+
+    def _decode(self, blob):
+        if self.codec == 'json':
+            return json.loads(blob)
+        return blob
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, key):
+        """Return the cached value or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f'SELECT value, stored_at, accessed_at FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            # A locked or unreadable database is a miss, never a failed request
+            logger.warning("Cache read skipped: %s", str(e))
+            row = None
+
+        if row is None:
+            self._count('_misses')
+            return None
+
+        value, stored_at, accessed_at = row
+        now = time.time()
+        expired = bool(self.ttl_seconds) and now - stored_at > self.ttl_seconds
+        try:
+            if expired:
+                conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            elif now - accessed_at > self.ACCESS_RESOLUTION_SECONDS:
+                conn.execute(f'UPDATE {self.table} SET accessed_at = ? WHERE key = ?', (now, key))
+        except sqlite3.OperationalError as e:
+            # A busy database must never fail the request; bookkeeping is best effort.
+            logger.debug("Cache bookkeeping skipped: %s", str(e))
+
+        if expired:
+            self._count('_expirations')
+            self._count('_misses')
+            return None
+
+        self._count('_hits')
+        return self._decode(value)
+
+    def put(self, key, value):
+        """Store a value and evict least recently used entries past the limits"""
+        blob = self._encode(value)
+        size = len(key) + len(blob)
+        if size > self.max_bytes:
+            return
+
+        conn = self._connect()
+        now = time.time()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                conn.execute(
+                    f'INSERT INTO {self.table} (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                    (key, blob, size, now, now)
+                )
+                entries, total_bytes = conn.execute(
+                    f'SELECT entries, bytes FROM {self.table}_totals'
+                ).fetchone()
+
+                evicted = 0
+                while entries > self.max_entries or total_bytes > self.max_bytes:
+                    row = conn.execute(
+                        f'SELECT key, size FROM {self.table} ORDER BY accessed_at LIMIT 1'
+                    ).fetchone()
+                    if row is None:
+                        break
+                    conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (row[0],))
+                    entries -= 1
+                    total_bytes -= row[1]
+                    evicted += 1
+
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.OperationalError as e:
+            logger.warning("Cache write skipped: %s", str(e))
+            return
+
+        if evicted:
+            self._count('_evictions', evicted)
+
+    def clear(self):
+        """Drop every entry for all workers (e.g. after a model reload)"""
+        self._connect().execute(f'DELETE FROM {self.table}')
+
+    def get_stats(self):
+        """Hit/miss ratios for this worker and shared occupancy"""
+        entries, total_bytes = self._connect().execute(
+            f'SELECT entries, bytes FROM {self.table}_totals'
+        ).fetchone()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': 'sqlite',
+                'path': self.path,
+                'entries': entries,
+                'bytes': total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / lookups if lookups else 0.0,
+                'miss_ratio': self._misses / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
+
+
+def create_cache(backend, namespace, path=None, codec='json', **kwargs):
+    """Build the configured cache backend ('memory' or 'sqlite')"""
+    if backend == 'memory':
+        return PredictionCache(**kwargs)
+    if backend == 'sqlite':
+        return SQLiteCache(path, namespace=namespace, codec=codec, **kwargs)
+    raise ValueError(f"Unknown CACHE_BACKEND '{backend}'. Choose from: memory, sqlite")
@@ -0,0 +1,244 @@
+"""
+Resumable training checkpoints
+Full training state after every epoch (weights, optimizer, phase, epoch, LR, callback counters), written in the background
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tensorflow import keras
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'state.json'
+
+# Counters each callback resets in on_train_begin and that a resume has to put back
+CALLBACK_STATE = {
+    keras.callbacks.EarlyStopping: ('wait', 'best', 'best_epoch', 'stopped_epoch'),
+    keras.callbacks.ReduceLROnPlateau: ('wait', 'best', 'cooldown_counter'),
+    keras.callbacks.ModelCheckpoint: ('best',),
+}
+
+
+def _optimizer_variables(optimizer):
+    variables = optimizer.variables
+    return variables() if callable(variables) else variables
+
+
+def _build_optimizer(optimizer, trainable_variables):
+    """Create the optimizer's slot variables so saved values can be assigned"""
+    if hasattr(optimizer, 'build'):
+        optimizer.build(trainable_variables)
+    else:
+        optimizer._create_all_weights(trainable_variables)
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _save_arrays(path, arrays):
+    with open(path, 'wb') as f:
+        np.savez(f, *arrays)
+
+
+def _load_arrays(path):
+    with np.load(path) as data:
+        return [data[f'arr_{i}'] for i in range(len(data.files))]
+
+
+def load_training_state(checkpoint_dir):
+    """The last completed checkpoint's state, or None"""
+    path = Path(checkpoint_dir) / STATE_FILE
+    if not path.exists():
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    state['path'] = str(Path(checkpoint_dir) / state['directory'])
+    return state
+
+
+def checkpoint_weights(state):
+    """Full-model weights saved with a checkpoint state"""
+    return _load_arrays(Path(state['path']) / 'weights.npz')
+
+
+class TrainingCheckpoint(keras.callbacks.Callback):
+    """Save and restore the complete training state across both phases
+
+    The epoch loop only pays for copying weights and optimizer slots into
+    numpy arrays; a single background thread writes them out. Each checkpoint
+    goes into a fresh directory, and ``state.json`` is switched to it only once
+    every file is on disk, so a crash mid-write leaves the previous one intact.
+
+    ``model`` is the full model: in feature-cache phase 1 Keras fits a head
+    model that shares its layers, and the full model's weights are what get
+    saved. Place this callback after the callbacks it tracks so its
+    ``on_train_begin`` restores their counters after they reset themselves.
+    With ``write=False`` (non-chief workers) it only restores.
+    """
+
+    def __init__(self, model, checkpoint_dir, tracked_callbacks, settings=None, keep=2, write=True):
+        super().__init__()
+        self.full_model = model
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.tracked = tracked_callbacks
+        self.settings = settings or {}
+        self.keep = keep
+        self.write = write
+
+        self.phase = 1
+        self._restore = None
+        self._sequence = 0
+        self._pending = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        if write:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+    # -- phase bookkeeping --------------------------------------------------
+
+    def begin_phase(self, phase, state=None):
+        """Start a phase, restoring ``state`` (from load_training_state) when resuming into it"""
+        self.phase = phase
+        self._restore = state
+        if state is not None:
+            self._sequence = state.get('sequence', 0)
+
+    def end_phase(self):
+        """Record that the current phase finished (after EarlyStopping restored its best weights)"""
+        self._save(self.phase + 1, 0, optimizer=None)
+
+    def clear(self):
+        """Drop checkpoints of an earlier run before starting from scratch"""
+        if not self.write:
+            return
+        self._wait()
+        for old in self.checkpoint_dir.glob('ckpt-*'):
+            shutil.rmtree(old, ignore_errors=True)
+        (self.checkpoint_dir / STATE_FILE).unlink(missing_ok=True)
+        self._sequence = 0
+
+    def close(self):
+        """Wait for the last write"""
+        self._wait()
+        self._executor.shutdown(wait=True)
+
+    # -- Keras hooks ----------------------------------------------------------
+
+    def on_train_begin(self, logs=None):
+        state, self._restore = self._restore, None
+        if state is None:
+            return
+
+        self.full_model.set_weights(checkpoint_weights(state))
+
+        optimizer = self.model.optimizer
+        optimizer_path = Path(state['path']) / 'optimizer.npz'
+        if optimizer_path.exists():
+            values = _load_arrays(optimizer_path)
+            _build_optimizer(optimizer, self.model.trainable_variables)
+            variables = _optimizer_variables(optimizer)
+            if len(variables) == len(values):
+                for variable, value in zip(variables, values):
+                    variable.assign(value)
+            else:
+                logger.warning("Optimizer layout changed (%d vs %d variables); starting it fresh",
+                               len(variables), len(values))
+        if state.get('learning_rate') is not None:
+            keras.backend.set_value(optimizer.learning_rate, state['learning_rate'])
+
+        best_weights = Path(state['path']) / 'best_weights.npz'
+        for callback in self.tracked:
+            saved = state.get('callbacks', {}).get(type(callback).__name__)
+            if not saved:
+                continue
+            for name, value in saved.items():
+                setattr(callback, name, value)
+            if isinstance(callback, keras.callbacks.EarlyStopping) and best_weights.exists():
+                callback.best_weights = _load_arrays(best_weights)
+
+        logger.info(f"Resumed phase {state['phase']} after epoch {state['epoch']} "
+                    f"(lr {state.get('learning_rate')})")
+
+    def on_epoch_end(self, epoch, logs=None):
+        self._save(self.phase, epoch + 1, optimizer=self.model.optimizer, logs=logs)
+
+    # -- saving ---------------------------------------------------------------
+
+    def _callback_states(self, counters=True):
+        """Saved attributes per callback; ``counters=False`` keeps only cross-phase ones (get_state)"""
+        states, best_weights = {}, None
+        for callback in self.tracked:
+            if hasattr(callback, 'get_state'):
+                states[type(callback).__name__] = callback.get_state()
+                continue
+            if not counters:
+                continue
+            names = next((n for cls, n in CALLBACK_STATE.items() if isinstance(callback, cls)), ())
+            states[type(callback).__name__] = {
+                name: _to_json(getattr(callback, name)) for name in names if hasattr(callback, name)
+            }
+            if isinstance(callback, keras.callbacks.EarlyStopping) and callback.best_weights is not None:
+                best_weights = [np.array(w) for w in callback.best_weights]
+        return states, best_weights
+
+    def _save(self, phase, epoch, optimizer=None, logs=None):
+        if not self.write:
+            return
+        # Snapshot on the training thread; everything after this is I/O in the background
+        weights = [np.array(w) for w in self.full_model.get_weights()]
+        optimizer_values = ([v.numpy() for v in _optimizer_variables(optimizer)]
+                            if optimizer is not None else None)
+        learning_rate = (float(keras.backend.get_value(optimizer.learning_rate))
+                         if optimizer is not None else None)
+        # A finished phase carries no counters into the next one; its callbacks start fresh
+        callback_states, best_weights = self._callback_states(counters=optimizer is not None)
+
+        self._sequence += 1
+        state = {
+            'phase': phase,
+            'epoch': epoch,
+            'sequence': self._sequence,
+            'directory': f'ckpt-{self._sequence:05d}',
+            'learning_rate': learning_rate,
+            'callbacks': callback_states,
+            'settings': self.settings,
+            'logs': {k: _to_json(v) for k, v in (logs or {}).items()},
+            'saved_at': datetime.now().isoformat()
+        }
+
+        self._wait()
+        self._pending = self._executor.submit(self._write, state, weights, optimizer_values, best_weights)
+
+    def _write(self, state, weights, optimizer_values, best_weights):
+        started = time.perf_counter()
+        directory = self.checkpoint_dir / state['directory']
+        directory.mkdir(parents=True, exist_ok=True)
+
+        _save_arrays(directory / 'weights.npz', weights)
+        if optimizer_values is not None:
+            _save_arrays(directory / 'optimizer.npz', optimizer_values)
+        if best_weights is not None:
+            _save_arrays(directory / 'best_weights.npz', best_weights)
+
+        tmp = self.checkpoint_dir / (STATE_FILE + '.tmp')
+        tmp.write_text(json.dumps(state, indent=2))
+        os.replace(tmp, self.checkpoint_dir / STATE_FILE)
+
+        for old in sorted(self.checkpoint_dir.glob('ckpt-*'))[:-self.keep]:
+            shutil.rmtree(old, ignore_errors=True)
+        logger.debug("Checkpoint %s written in %.2fs", directory.name, time.perf_counter() - started)
+
+    def _wait(self):
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
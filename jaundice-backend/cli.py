@@ -79,9 +79,9 @@ def cmd_stats(args):
 def cmd_test(args):
     """Test the model on a sample image"""
     try:
-        import tensorflow as tf
-        import numpy as np
-        from PIL import Image
+        from inference import InferenceEngine
+        from model_bundle import configured_bundle_path, load_bundle, postprocess
+        from preprocessing import preprocess
         
         model_path = Path("models/jaundice_detection_model.h5")
         if not model_path.exists():
@@ -90,7 +90,8 @@ def cmd_test(args):
         
         # Load model
         logger.info("Loading model...")
-        model = tf.keras.models.load_model(str(model_path))
+        bundle = load_bundle(model_path, args.threshold, configured_bundle_path(model_path))
+        engine = InferenceEngine.from_path(str(model_path), warmup_batch_sizes=())
         
         # Load test image
         test_image_path = Path(args.image)
@@ -99,24 +100,19 @@ def cmd_test(args):
             return 1
         
         logger.info("Loading image: %s", test_image_path)
-        img = Image.open(test_image_path)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        img = img.resize((224, 224), Image.Resampling.LANCZOS)
-        img_array = np.array(img, dtype=np.float32) / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
+        img_array = preprocess(test_image_path)
         
         # Predict
-        prediction = model.predict(img_array, verbose=0)[0][0]
-        confidence = max(prediction, 1 - prediction)
-        predicted_class = 'JAUNDICE' if prediction > 0.5 else 'NORMAL'
+        result = postprocess(engine.predict(img_array), bundle.threshold)[0]
+        prediction = result['probability_jaundice']
+        confidence = result['confidence']
+        predicted_class = result['prediction'].upper()
         
         print("\n" + "=" * 60)
         print("PREDICTION RESULT")
         print("=" * 60)
         print(f"Image: {test_image_path.name}")
-        print(f"Prediction: {predicted_class}")
+        print(f"Prediction: {predicted_class} (threshold {bundle.threshold:.3f}, model {bundle.version})")
         print(f"Confidence: {confidence * 100:.2f}%")
         print(f"  Jaundice Probability: {prediction * 100:.2f}%")
         print(f"  Normal Probability:   {(1 - prediction) * 100:.2f}%")
@@ -128,6 +124,271 @@ def cmd_test(args):
         logger.error("Test failed: %s", str(e), exc_info=True)
         return 1
 
+def cmd_export_tflite(args):
+    """Export TFLite variants of the trained model and report accuracy drift"""
+    try:
+        from export_model import export_and_report
+        
+        model_path = Path(args.model)
+        if not model_path.exists():
+            logger.error("Model not found. Train the model first.")
+            return 1
+        
+        variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+        report = export_and_report(
+            model_path,
+            Path("../datasets"),
+            variants=variants,
+            calibration_samples=args.calibration_samples,
+            threshold=args.threshold,
+            num_threads=args.threads
+        )
+        
+        print("\n" + "=" * 60)
+        print("TFLITE EXPORT - ACCURACY DRIFT ON TEST SPLIT")
+        print("=" * 60)
+        print(f"Test Samples: {report['samples']}")
+        print(f"Threshold:    {report['threshold']:.4f}")
+        print(f"Keras Accuracy: {report['reference']['accuracy']:.4f} "
+              f"({report['reference']['latency_ms']:.1f} ms/image)")
+        for variant, data in report['variants'].items():
+            print(f"\n{variant.upper()} ({data['size_mb']:.1f} MB):")
+            print(f"  Accuracy:      {data['accuracy']:.4f} (drift {data['accuracy_drift']:+.4f})")
+            print(f"  Agreement:     {data['agreement'] * 100:.2f}%")
+            print(f"  Max |diff|:    {data['max_abs_diff']:.5f}")
+            print(f"  Latency:       {data['latency_ms']:.1f} ms/image ({data['speedup']:.2f}x)")
+        print("=" * 60 + "\n")
+        
+        return 0
+    
+    except Exception as e:
+        logger.error("Export failed: %s", str(e), exc_info=True)
+        return 1
+
+def cmd_export_onnx(args):
+    """Export the trained model to ONNX and check parity with Keras"""
+    try:
+        from export_model import export_onnx_and_check
+        
+        model_path = Path(args.model)
+        if not model_path.exists():
+            logger.error("Model not found. Train the model first.")
+            return 1
+        
+        report = export_onnx_and_check(
+            model_path,
+            Path("../datasets"),
+            opset=args.opset,
+            tolerance=args.tolerance,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads,
+            threshold=args.threshold
+        )
+        
+        print("\n" + "=" * 60)
+        print("ONNX EXPORT - PARITY WITH KERAS ON TEST SPLIT")
+        print("=" * 60)
+        print(f"Test Samples:   {report['samples']}")
+        print(f"Threshold:      {report['threshold']:.4f}")
+        for variant, data in report['variants'].items():
+            print(f"\n{variant.upper()} ({report['exported'][variant]}):")
+            print(f"  Max |diff|:   {data['max_abs_diff']:.2e} (tolerance {report['tolerance']:.0e})")
+            print(f"  Mean |diff|:  {data['mean_abs_diff']:.2e}")
+            print(f"  Agreement:    {data['agreement'] * 100:.2f}%")
+            print(f"  Latency:      {data['latency_ms']:.1f} ms/image ({data['speedup']:.2f}x vs Keras)")
+        print(f"\nParity:         {'PASS' if report['parity_ok'] else 'FAIL'}")
+        print("=" * 60 + "\n")
+        
+        return 0 if report['parity_ok'] else 1
+    
+    except Exception as e:
+        logger.error("Export failed: %s", str(e), exc_info=True)
+        return 1
+
+def cmd_build_dataset_cache(args):
+    """Build or incrementally refresh the preprocessed dataset cache"""
+    try:
+        from dataset_cache import build_split_cache
+        
+        dataset_path = Path("../datasets")
+        if not dataset_path.exists():
+            logger.error("Dataset not found at %s", dataset_path.absolute())
+            return 1
+        
+        splits = [s.strip() for s in args.splits.split(',') if s.strip()]
+        cache_dir = Path(args.cache_dir) if args.cache_dir else None
+        kwargs = {'cache_dir': cache_dir} if cache_dir else {}
+        
+        print("\n" + "=" * 60)
+        print("DATASET CACHE")
+        print("=" * 60)
+        print(f"{'split':<12}{'images':>10}{'decoded':>10}{'reused':>10}{'removed':>10}")
+        for split in splits:
+            report = build_split_cache(dataset_path, split, rebuild=args.rebuild, **kwargs)
+            print(f"{split:<12}{report['images']:>10}{report['decoded']:>10}{report['reused']:>10}{report['removed']:>10}")
+        print("=" * 60 + "\n")
+        
+        return 0
+    
+    except Exception as e:
+        logger.error("Dataset cache build failed: %s", str(e), exc_info=True)
+        return 1
+
+def cmd_sweep(args, sweep_args):
+    """Run a hyperparameter sweep (sweep.py) with the remaining arguments"""
+    # Imported here: sweep pulls in TensorFlow and the training code
+    import sweep
+    
+    return sweep.main(sweep_args, prog='cli.py sweep')
+
+def cmd_score(args):
+    """Score a directory, glob or manifest of images into a CSV/JSONL/Parquet file"""
+    try:
+        from inference import load_engine
+        from model_bundle import configured_bundle_path, load_bundle
+        from scoring import collect_inputs, score
+        
+        paths = collect_inputs(args.source)
+        if not paths:
+            logger.error("No images found in %s", args.source)
+            return 1
+        logger.info("Found %d images in %s", len(paths), args.source)
+        
+        # The serving threshold lives in the Keras model's bundle, whichever backend scores
+        bundle = load_bundle(args.keras_model, args.threshold, configured_bundle_path(args.keras_model))
+        model_path = args.model or {
+            'keras': args.keras_model,
+            'tflite': 'models/jaundice_detection_model_float16.tflite',
+            'onnx': 'models/jaundice_detection_model.onnx'
+        }[args.backend]
+        engine = load_engine(args.backend, model_path, tflite_model_path=model_path, onnx_model_path=model_path,
+                             tflite_pool_size=1, tflite_num_threads=args.threads,
+                             ort_intra_op_threads=args.threads, warmup_batch_sizes=(args.batch_size,)).warmup()
+        
+        summary = score(paths, engine, bundle.threshold, Path(args.output), args.format,
+                        batch_size=args.batch_size, workers=args.workers, decode_chunk=args.decode_chunk,
+                        checkpoint_every=args.checkpoint_every, restart=args.restart, model_version=bundle.version)
+        
+        print("\n" + "=" * 60)
+        print("BULK SCORING")
+        print("=" * 60)
+        print(f"Model:       {args.backend} {model_path} (version {bundle.version}, threshold {bundle.threshold:.3f})")
+        print(f"Images:      {summary['images']} ({summary['resumed_from']} done in earlier runs)")
+        print(f"Scored now:  {summary['scored']} in {summary['seconds']:.1f}s")
+        print(f"Throughput:  {summary['images_per_sec']:.1f} images/sec")
+        print(f"  Inference:        {summary['inference_seconds']:.1f}s")
+        print(f"  Waiting on decode: {summary['decode_wait_seconds']:.1f}s")
+        print(f"Errors:      {summary['errors']}")
+        print(f"Output:      {summary['output']} ({summary['format']})")
+        print("=" * 60 + "\n")
+        
+        return 0
+    
+    except Exception as e:
+        logger.error("Scoring failed: %s", str(e), exc_info=True)
+        return 1
+
+def _profile_worker(results, measure):
+    """Forked worker: time engine load + warmup, then report memory once all siblings are up"""
+    import os
+    import time
+    from app import warmup_worker
+    from utils import get_process_memory
+    
+    started = time.perf_counter()
+    warmup_worker()
+    startup = time.perf_counter() - started
+    
+    results.put(('ready', os.getpid(), startup))
+    measure.wait()
+    results.put(('memory', os.getpid(), get_process_memory()))
+
+def cmd_startup_profile(args):
+    """Measure per-worker startup time and memory with and without preloading"""
+    import time
+    import multiprocessing
+    from utils import get_process_memory
+    
+    try:
+        ctx = multiprocessing.get_context('fork')
+        
+        started = time.perf_counter()
+        import app as serving_app
+        if args.preload:
+            serving_app.preload_model()
+        master_seconds = time.perf_counter() - started
+        master_memory = get_process_memory()
+        
+        results = ctx.Queue()
+        measure = ctx.Event()
+        workers = [ctx.Process(target=_profile_worker, args=(results, measure)) for _ in range(args.workers)]
+        
+        forked = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        
+        startup = {}
+        while len(startup) < args.workers:
+            _, pid, seconds = results.get(timeout=args.timeout)
+            startup[pid] = seconds
+        all_ready = time.perf_counter() - forked
+        
+        measure.set()
+        memory = {}
+        while len(memory) < args.workers:
+            _, pid, data = results.get(timeout=args.timeout)
+            memory[pid] = data
+        for worker in workers:
+            worker.join()
+        
+        print("\n" + "=" * 60)
+        print(f"STARTUP PROFILE ({args.workers} workers, preload {'on' if args.preload else 'off'})")
+        print("=" * 60)
+        print(f"Master: {master_seconds:.2f}s, RSS {master_memory['rss_mb']:.1f} MB")
+        print(f"\n{'pid':>8}{'startup s':>12}{'RSS MB':>10}{'PSS MB':>10}{'private MB':>12}")
+        for pid in sorted(startup):
+            data = memory[pid]
+            pss = f"{data['pss_mb']:.1f}" if data['pss_mb'] is not None else 'n/a'
+            private = f"{data['private_mb']:.1f}" if data['private_mb'] is not None else 'n/a'
+            print(f"{pid:>8}{startup[pid]:>12.2f}{data['rss_mb']:>10.1f}{pss:>10}{private:>12}")
+        
+        total_pss = sum(m['pss_mb'] or m['rss_mb'] for m in memory.values())
+        print(f"\nAll workers ready after: {all_ready:.2f}s")
+        print(f"Total worker footprint (PSS): {total_pss:.1f} MB")
+        
+        report = {
+            'backend': serving_app.MODEL_BACKEND,
+            'preload': args.preload,
+            'share_weights': serving_app._ort_shares_weights(),
+            'workers': args.workers,
+            'master_rss_mb': master_memory['rss_mb'],
+            'all_ready_seconds': all_ready,
+            'total_pss_mb': total_pss,
+            'per_worker': {key: sum((m[key] or m['rss_mb']) for m in memory.values()) / args.workers
+                           for key in ('rss_mb', 'pss_mb', 'private_mb')}
+        }
+        if args.compare:
+            with open(args.compare) as f:
+                before = json.load(f)
+            print(f"\nPer worker vs {args.compare} (backend {before['backend']}, preload "
+                  f"{'on' if before['preload'] else 'off'}, shared weights {'on' if before['share_weights'] else 'off'}):")
+            print(f"{'':>14}{'before MB':>12}{'after MB':>12}{'change':>10}")
+            for key, label in (('rss_mb', 'RSS'), ('pss_mb', 'PSS'), ('private_mb', 'private')):
+                old, new = before['per_worker'][key], report['per_worker'][key]
+                print(f"{label:>14}{old:>12.1f}{new:>12.1f}{(new / old - 1) * 100 if old else 0.0:>+9.1f}%")
+        print("=" * 60 + "\n")
+        
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Report saved to {args.output}")
+        
+        return 0
+    
+    except Exception as e:
+        logger.error("Startup profile failed: %s", str(e), exc_info=True)
+        return 1
+
 def main():
     """Main CLI entry point"""
     parser = argparse.ArgumentParser(
@@ -144,8 +405,84 @@ def main():
     # Test command
     test_parser = subparsers.add_parser('test', help='Test model on an image')
     test_parser.add_argument('image', help='Path to test image')
+    test_parser.add_argument('--threshold', type=float, default=None,
+                             help="Override the model bundle's decision threshold")
+    
+    # Export TFLite command
+    export_parser = subparsers.add_parser('export-tflite', help='Export quantized TFLite models')
+    export_parser.add_argument('--model', default='models/jaundice_detection_model.h5',
+                               help='Path to the trained Keras model')
+    export_parser.add_argument('--variants', default='float16,int8',
+                               help='Comma-separated variants to export (float16, int8)')
+    export_parser.add_argument('--calibration-samples', type=int, default=100,
+                               help='Validation images used to calibrate int8 activations')
+    export_parser.add_argument('--threshold', type=float, default=None,
+                               help="Override the model bundle's decision threshold for the accuracy comparison")
+    export_parser.add_argument('--threads', type=int, default=None,
+                               help='TFLite interpreter threads')
+    
+    # Export ONNX command
+    onnx_parser = subparsers.add_parser('export-onnx', help='Export ONNX model and check parity with Keras')
+    onnx_parser.add_argument('--model', default='models/jaundice_detection_model.h5',
+                             help='Path to the trained Keras model')
+    onnx_parser.add_argument('--opset', type=int, default=13, help='ONNX opset version')
+    onnx_parser.add_argument('--tolerance', type=float, default=1e-4,
+                             help='Maximum allowed |ORT - Keras| probability difference')
+    onnx_parser.add_argument('--intra-op-threads', type=int, default=None, help='ORT intra-op threads')
+    onnx_parser.add_argument('--inter-op-threads', type=int, default=None, help='ORT inter-op threads')
+    onnx_parser.add_argument('--threshold', type=float, default=None,
+                             help="Override the model bundle's decision threshold for the agreement check")
+    
+    # Startup profile command
+    profile_parser = subparsers.add_parser('startup-profile',
+                                           help='Measure worker startup time and per-worker memory')
+    profile_parser.add_argument('--workers', type=int, default=4, help='Number of forked workers')
+    profile_parser.add_argument('--preload', action='store_true',
+                                help='Preload model state in the master before forking')
+    profile_parser.add_argument('--timeout', type=float, default=300, help='Seconds to wait for workers')
+    profile_parser.add_argument('--output', default=None, help='Write the per-worker averages to this JSON file')
+    profile_parser.add_argument('--compare', default=None,
+                                help='Earlier --output report to print a before/after comparison against')
+    
+    # Dataset cache command
+    cache_parser = subparsers.add_parser('build-dataset-cache',
+                                         help='Preprocess dataset splits into memory-mapped arrays')
+    cache_parser.add_argument('--splits', default='train,validate,test', help='Comma-separated splits')
+    cache_parser.add_argument('--cache-dir', default=None,
+                              help='Output directory (default: DATASET_CACHE_DIR or cache/dataset)')
+    cache_parser.add_argument('--rebuild', action='store_true', help='Re-decode every image')
+    
+    # Bulk scoring command
+    score_parser = subparsers.add_parser('score', help='Score a directory, glob or manifest of images offline')
+    score_parser.add_argument('source', help='Image directory, quoted glob pattern, or .txt/.csv/.jsonl manifest')
+    score_parser.add_argument('output', help='Results file (.csv, .jsonl) or Parquet directory (.parquet)')
+    score_parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], default=None,
+                              help='Output format (default: from the output suffix)')
+    score_parser.add_argument('--backend', choices=['keras', 'tflite', 'onnx'], default='keras',
+                              help='Inference backend')
+    score_parser.add_argument('--model', default=None,
+                              help="Model file for the backend (default: the backend's usual export)")
+    score_parser.add_argument('--keras-model', default='models/jaundice_detection_model.h5',
+                              help='Keras model whose bundle supplies the threshold and version')
+    score_parser.add_argument('--threshold', type=float, default=None,
+                              help="Override the model bundle's decision threshold")
+    score_parser.add_argument('--batch-size', type=int, default=64, help='Images per inference batch')
+    score_parser.add_argument('--workers', type=int, default=None,
+                              help='Decode processes (default: half the CPUs)')
+    score_parser.add_argument('--decode-chunk', type=int, default=16, help='Images per decode task')
+    score_parser.add_argument('--threads', type=int, default=None, help='TFLite/ORT inference threads')
+    score_parser.add_argument('--checkpoint-every', type=int, default=4096,
+                              help='Images between progress checkpoints')
+    score_parser.add_argument('--restart', action='store_true',
+                              help='Ignore saved progress and score everything again')
+    
+    # Sweep command: its own arguments are parsed by sweep.py
+    subparsers.add_parser('sweep', add_help=False,
+                          help='Parallel hyperparameter sweep (cli.py sweep --help for its options)')
     
-    args = parser.parse_args()
+    args, extra = parser.parse_known_args()
+    if extra and args.command != 'sweep':
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
     
     if args.command == 'info':
         return cmd_info(args)
@@ -153,6 +490,18 @@ def main():
         return cmd_stats(args)
     elif args.command == 'test':
         return cmd_test(args)
+    elif args.command == 'export-tflite':
+        return cmd_export_tflite(args)
+    elif args.command == 'export-onnx':
+        return cmd_export_onnx(args)
+    elif args.command == 'startup-profile':
+        return cmd_startup_profile(args)
+    elif args.command == 'build-dataset-cache':
+        return cmd_build_dataset_cache(args)
+    elif args.command == 'score':
+        return cmd_score(args)
+    elif args.command == 'sweep':
+        return cmd_sweep(args, extra)
     else:
         parser.print_help()
         return 1
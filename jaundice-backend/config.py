@@ -21,17 +21,49 @@ FLASK_DEBUG = os.getenv("FLASK_DEBUG", "False").lower() == "true"
 PORT = int(os.getenv("PORT", 5000))
 HOST = os.getenv("HOST", "0.0.0.0")
 
+# ASGI Configuration
+ASGI_INFERENCE_WORKERS = int(os.getenv("ASGI_INFERENCE_WORKERS", os.cpu_count() or 4))
+ASGI_MAX_PENDING = int(os.getenv("ASGI_MAX_PENDING", 64))
+
 # Model Configuration
 MODEL_PATH = os.getenv("MODEL_PATH", "models/jaundice_detection_model.h5")
 FULL_MODEL_PATH = MODELS_DIR / "jaundice_detection_model.h5"
 MODEL_METRICS_PATH = MODELS_DIR / "model_metrics.json"
 IMG_SIZE = 224
 BATCH_SIZE = 32
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "keras").lower()
+TFLITE_MODEL_PATH = os.getenv("TFLITE_MODEL_PATH", "models/jaundice_detection_model_float16.tflite")
+TFLITE_POOL_SIZE = int(os.getenv("TFLITE_POOL_SIZE", 2))
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", 0)) or None
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "models/jaundice_detection_model.onnx")
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", 0)) or None
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", 0)) or None
+ORT_SHARE_WEIGHTS = os.getenv("ORT_SHARE_WEIGHTS", "True").lower() == "true"
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "False").lower() == "true"
+WARMUP_BATCH_SIZES = [int(v) for v in os.getenv("WARMUP_BATCH_SIZES", "1,2,4,8,16,32").split(",") if v.strip()]
 
 # Prediction Configuration
-PREDICTION_THRESHOLD = 0.5
+# Unset: serve the threshold trained into the model bundle (models/<model>.bundle.json)
+PREDICTION_THRESHOLD = float(os.getenv("PREDICTION_THRESHOLD")) if os.getenv("PREDICTION_THRESHOLD") else None
 ALLOWED_FILE_EXTENSIONS = {"jpg", "jpeg", "png", "bmp", "gif"}
-MAX_FILE_SIZE_MB = 10
+MAX_FILE_SIZE_MB = float(os.getenv("MAX_FILE_SIZE_MB", 10))
+
+# Micro-batching Configuration
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "True").lower() == "true"
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+BATCH_PREDICT_CHUNK_SIZE = int(os.getenv("BATCH_PREDICT_CHUNK_SIZE", 32))
+BATCH_SUBMIT_TIMEOUT_S = float(os.getenv("BATCH_SUBMIT_TIMEOUT_S", 10)) or None
+
+# Prediction Cache Configuration
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_PATH = os.getenv("CACHE_PATH", "cache/serving_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", 64))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 0))
+TENSOR_CACHE_ENABLED = os.getenv("TENSOR_CACHE_ENABLED", "False").lower() == "true"
+TENSOR_CACHE_MAX_MB = float(os.getenv("TENSOR_CACHE_MAX_MB", 256))
 
 # Training Configuration
 TRAINING_EPOCHS = 50
@@ -40,6 +72,7 @@ LEARNING_RATE = 0.001
 FINE_TUNE_LEARNING_RATE = 0.0001
 VALIDATION_SPLIT = 0.2
 TEST_SPLIT = 0.1
+DATASET_CACHE_DIR = Path(os.getenv("DATASET_CACHE_DIR", PROJECT_ROOT / "cache" / "dataset"))
 
 # Logging Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -70,12 +103,43 @@ CONFIG = {
         "port": PORT,
         "host": HOST,
     },
+    "asgi": {
+        "inference_workers": ASGI_INFERENCE_WORKERS,
+        "max_pending": ASGI_MAX_PENDING,
+    },
     "model": {
         "path": FULL_MODEL_PATH,
         "metrics_path": MODEL_METRICS_PATH,
         "img_size": IMG_SIZE,
         "classes": CLASSES,
         "threshold": PREDICTION_THRESHOLD,
+        "warmup_batch_sizes": WARMUP_BATCH_SIZES,
+        "backend": MODEL_BACKEND,
+        "preload": PRELOAD_MODEL,
+        "tflite_path": TFLITE_MODEL_PATH,
+        "tflite_pool_size": TFLITE_POOL_SIZE,
+        "tflite_num_threads": TFLITE_NUM_THREADS,
+        "onnx_path": ONNX_MODEL_PATH,
+        "ort_intra_op_threads": ORT_INTRA_OP_THREADS,
+        "ort_inter_op_threads": ORT_INTER_OP_THREADS,
+        "ort_share_weights": ORT_SHARE_WEIGHTS,
+    },
+    "batching": {
+        "enabled": BATCHING_ENABLED,
+        "max_batch_size": BATCH_MAX_SIZE,
+        "max_wait_ms": BATCH_MAX_WAIT_MS,
+        "batch_predict_chunk_size": BATCH_PREDICT_CHUNK_SIZE,
+        "submit_timeout_s": BATCH_SUBMIT_TIMEOUT_S,
+    },
+    "cache": {
+        "enabled": CACHE_ENABLED,
+        "backend": CACHE_BACKEND,
+        "path": CACHE_PATH,
+        "max_entries": CACHE_MAX_ENTRIES,
+        "max_mb": CACHE_MAX_MB,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+        "tensor_cache_enabled": TENSOR_CACHE_ENABLED,
+        "tensor_cache_max_mb": TENSOR_CACHE_MAX_MB,
     },
     "training": {
         "epochs": TRAINING_EPOCHS,
@@ -88,6 +152,7 @@ CONFIG = {
         "models": str(MODELS_DIR),
         "logs": str(LOGS_DIR),
         "datasets": str(DATASETS_DIR),
+        "dataset_cache": str(DATASET_CACHE_DIR),
     },
 }
 
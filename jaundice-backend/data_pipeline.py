@@ -0,0 +1,302 @@
+"""
+tf.data input pipeline for training and evaluation
+Parallel decode, batched on-graph augmentation and prefetching in place of ImageDataGenerator
+"""
+
+import math
+import time
+import logging
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from utils import list_split_images
+
+logger = logging.getLogger(__name__)
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# The ImageDataGenerator settings the training script has always used
+AUGMENTATION = {
+    'rotation_range': 25,               # degrees
+    'width_shift_range': 0.25,          # fraction of width
+    'height_shift_range': 0.25,         # fraction of height
+    'shear_range': 0.2,                 # degrees, as Keras interprets it
+    'zoom_range': 0.3,                  # zoom factors drawn from [0.7, 1.3] per axis
+    'brightness_range': (0.7, 1.3),
+    'horizontal_flip': True,
+}
+
+
+def split_classes(split):
+    """Class directory mapping for a split, e.g. {'train N': 0, 'train J': 1}"""
+    return {f'{split} N': 0, f'{split} J': 1}
+
+
+class DatasetSplit:
+    """A batched tf.data.Dataset plus the bookkeeping Keras generators expose
+
+    ``classes`` and ``samples`` mirror DirectoryIterator, so class weighting and
+    evaluation work the same whichever pipeline produced the split.
+    """
+
+    def __init__(self, dataset, filepaths, classes, split, batch_size):
+        self.dataset = dataset
+        self.filepaths = [str(p) for p in filepaths]
+        self.classes = classes
+        self.samples = len(classes)
+        self.class_indices = split_classes(split)
+        self.batch_size = batch_size
+
+    def __len__(self):
+        return math.ceil(self.samples / self.batch_size)
+
+
+def as_input(data):
+    """What to hand model.fit/predict: the dataset of a DatasetSplit, or a generator as-is"""
+    return data.dataset if isinstance(data, DatasetSplit) else data
+
+
+def decode_and_resize(path, img_size):
+    """Read, decode and resize one image to float32 pixels in [0, 255]"""
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(image, (img_size, img_size), method='bilinear', antialias=True)
+    image.set_shape((img_size, img_size, 3))
+    return image
+
+
+def _affine_transforms(batch_size, img_size, settings):
+    """Random per-image affine maps (output -> input pixel), as ImageProjectiveTransformV3 params
+
+    Builds the same rotation @ shift @ shear @ zoom matrix as Keras'
+    apply_affine_transform, centred on the image, for a whole batch at once.
+    """
+    shape = (batch_size,)
+    theta = float(np.deg2rad(settings['rotation_range'])) * tf.random.uniform(shape, -1.0, 1.0)
+    tx = settings['height_shift_range'] * img_size * tf.random.uniform(shape, -1.0, 1.0)
+    ty = settings['width_shift_range'] * img_size * tf.random.uniform(shape, -1.0, 1.0)
+    shear = float(np.deg2rad(settings['shear_range'])) * tf.random.uniform(shape, -1.0, 1.0)
+    zoom = settings['zoom_range']
+    zx = tf.random.uniform(shape, 1.0 - zoom, 1.0 + zoom)
+    zy = tf.random.uniform(shape, 1.0 - zoom, 1.0 + zoom)
+
+    cos_t, sin_t = tf.cos(theta), tf.sin(theta)
+    sin_s, cos_s = tf.sin(shear), tf.cos(shear)
+
+    # (row, col) matrix of rotation @ shift @ shear @ zoom, expanded by hand
+    a = cos_t * zx
+    b = (-cos_t * sin_s - sin_t * cos_s) * zy
+    c = cos_t * tx - sin_t * ty
+    d = sin_t * zx
+    e = (-sin_t * sin_s + cos_t * cos_s) * zy
+    f = sin_t * tx + cos_t * ty
+
+    # Offset to the image centre: M_c = T(center) @ M @ T(-center)
+    center = (img_size - 1) / 2.0
+    c = c + center - a * center - b * center
+    f = f + center - d * center - e * center
+
+    # Swap to (x=col, y=row) ordering for the TF op
+    zeros = tf.zeros(shape)
+    return tf.stack([e, d, f, b, a, c, zeros, zeros], axis=1)
+
+
+def augment_batch(images, settings=None):
+    """Apply random affine, flip and brightness to a (B, H, W, 3) float batch in [0, 255]
+
+    Vectorized over the batch and runs on-graph inside the tf.data map.
+    """
+    settings = settings or AUGMENTATION
+    batch_size = tf.shape(images)[0]
+    img_size = images.shape[1]
+
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=_affine_transforms(batch_size, img_size, settings),
+        output_shape=tf.shape(images)[1:3],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode='NEAREST'
+    )
+
+    if settings['horizontal_flip']:
+        flip = tf.random.uniform((batch_size, 1, 1, 1)) < 0.5
+        images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+
+    low, high = settings['brightness_range']
+    factor = tf.random.uniform((batch_size, 1, 1, 1), low, high)
+    return tf.clip_by_value(images * factor, 0.0, 255.0)
+
+
+def build_dataset(paths, labels, img_size=224, batch_size=32, training=False,
+                  augment=True, cache=None, shuffle_seed=None, shard=None):
+    """Batched (images in [0, 1], float32 labels) dataset for a list of files
+
+    ``cache`` keeps decoded tensors after the first epoch: ``''`` caches in
+    memory, any other string caches to that file prefix. Only use it for
+    splits without per-epoch randomness before the cache point. ``shard`` is
+    ``(num_shards, index)``: keep only every num_shards-th file, before any decoding.
+    """
+    ds = tf.data.Dataset.from_tensor_slices(([str(p) for p in paths], np.asarray(labels, dtype=np.float32)))
+    if shard:
+        ds = ds.shard(*shard)
+    if training:
+        ds = ds.shuffle(len(paths), seed=shuffle_seed, reshuffle_each_iteration=True)
+
+    ds = ds.map(lambda path, label: (decode_and_resize(path, img_size), label),
+                num_parallel_calls=AUTOTUNE, deterministic=not training)
+    if cache is not None:
+        ds = ds.cache(cache)
+
+    ds = ds.batch(batch_size)
+    if training and augment:
+        ds = ds.map(lambda images, labels: (augment_batch(images), labels), num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda images, labels: (images / 255.0, labels), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def build_cached_dataset(images, labels, batch_size=32, training=False, augment=None, shuffle_seed=None,
+                         shard=None):
+    """Batched dataset over a memory-mapped uint8 (N, H, W, 3) array from dataset_cache.py
+
+    Only row indices flow through the graph; each batch gathers its rows
+    straight from the memmap, so nothing is decoded and the array never has
+    to fit in memory. Augmentation follows ``training`` unless ``augment`` is given.
+    With ``shard=(num_shards, index)`` only that worker's rows are ever read.
+    """
+    img_size = images.shape[1]
+    augment = training if augment is None else augment
+
+    def lookup(indices):
+        batch = tf.numpy_function(lambda rows: images[rows], [indices], tf.uint8)
+        batch.set_shape((None, img_size, img_size, 3))
+        return tf.cast(batch, tf.float32)
+
+    labels = np.asarray(labels, dtype=np.float32)
+    ds = tf.data.Dataset.from_tensor_slices(np.arange(len(labels), dtype=np.int64))
+    if shard:
+        ds = ds.shard(*shard)
+    if training:
+        ds = ds.shuffle(len(labels), seed=shuffle_seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    # Sorted gathers read the memmap sequentially; labels follow the same order
+    label_table = tf.constant(labels)
+    if training:
+        ds = ds.map(lambda indices: tf.sort(indices), num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda indices: (lookup(indices), tf.gather(label_table, indices)),
+                num_parallel_calls=AUTOTUNE, deterministic=not training)
+
+    if augment:
+        ds = ds.map(lambda images, labels: (augment_batch(images), labels), num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda images, labels: (images / 255.0, labels), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def load_cached_split(dataset_path, split, img_size=224, batch_size=32, training=False, cache_dir=None,
+                      shard=None):
+    """DatasetSplit read from the preprocessed dataset cache, refreshing it first if files changed
+
+    With ``shard`` the dataset yields only this worker's part, while
+    ``classes``/``samples`` still describe the whole split.
+    """
+    import dataset_cache
+
+    cache_dir = cache_dir or dataset_cache.DATASET_CACHE_DIR
+    dataset_cache.build_split_cache(dataset_path, split, cache_dir, img_size)
+    images, labels, manifest = dataset_cache.load_split_cache(split, cache_dir)
+    paths = [Path(dataset_path) / entry['path'] for entry in manifest['files']]
+    dataset = build_cached_dataset(images, labels, batch_size, training=training, shard=shard)
+    return DatasetSplit(dataset, paths, labels, split, batch_size)
+
+
+def load_split(dataset_path, split, img_size=224, batch_size=32, training=False, cache=None, shard=None):
+    """DatasetSplit for one of train/validate/test, in flow_from_directory file order"""
+    paths, labels = list_split_images(dataset_path, split)
+    if not paths:
+        raise FileNotFoundError(f"No images found for split '{split}' under {dataset_path}")
+    dataset = build_dataset(paths, labels, img_size, batch_size, training=training, cache=cache, shard=shard)
+    return DatasetSplit(dataset, paths, labels, split, batch_size)
+
+
+def cache_spec(cache, cache_dir, split, shard=None):
+    """Translate a --cache-eval choice into a Dataset.cache() argument (one file per shard)"""
+    if cache == 'memory':
+        return ''
+    if cache == 'disk':
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        suffix = f'-{shard[1]}of{shard[0]}' if shard else ''
+        return str(Path(cache_dir) / f'{split}{suffix}.tfcache')
+    return None
+
+
+class ThroughputLogger(keras.callbacks.Callback):
+    """Log training images/sec for every epoch and keep them for the run summary"""
+
+    def __init__(self, samples, label):
+        super().__init__()
+        self.samples = samples
+        self.label = label
+        self.epochs = []
+        self.phase = 0
+
+    def on_train_begin(self, logs=None):
+        self.phase += 1
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._train_ended = None
+
+    def on_test_begin(self, logs=None):
+        # Validation runs inside the epoch; leave it out of the training rate
+        self._train_ended = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        ended = time.perf_counter()
+        seconds = (self._train_ended or ended) - self._started
+        images_per_sec = self.samples / seconds if seconds else 0.0
+        self.epochs.append({'phase': self.phase, 'epoch': epoch + 1, 'seconds': seconds,
+                            'epoch_seconds': ended - self._started, 'images_per_sec': images_per_sec})
+        logger.info(f"[{self.label}] phase {self.phase} epoch {epoch + 1}: {seconds:.1f}s, "
+                    f"{images_per_sec:.1f} images/sec")
+
+    def get_state(self):
+        """What a resumed run needs to keep reporting the whole run (see checkpointing.py)"""
+        return {'epochs': self.epochs}
+
+    def summary(self):
+        """Mean throughput, excluding the first epoch (tracing, cache fill) when there are others"""
+        steady = self.epochs[1:] or self.epochs
+        if not steady:
+            return {'pipeline': self.label, 'epochs': 0}
+        return {
+            'pipeline': self.label,
+            'epochs': len(self.epochs),
+            'mean_images_per_sec': float(np.mean([e['images_per_sec'] for e in steady])),
+            'per_epoch': self.epochs
+        }
+
+
+def measure_input_throughput(data, batches=None):
+    """Images/sec of iterating an input pipeline alone (no model), for comparing loaders"""
+    if isinstance(data, DatasetSplit):
+        iterator = iter(data.dataset)
+    else:
+        data.reset()
+        iterator = iter(data)
+    batches = batches or len(data)
+
+    next(iterator)  # warm up: first decode, graph tracing, thread pools
+    images = 0
+    started = time.perf_counter()
+    for _ in range(batches - 1):
+        try:
+            x, _ = next(iterator)
+        except StopIteration:
+            break
+        images += len(x)
+    seconds = time.perf_counter() - started
+    return {'batches': batches, 'images': images, 'seconds': seconds,
+            'images_per_sec': images / seconds if seconds else 0.0}
@@ -0,0 +1,217 @@
+"""
+Preprocessed dataset cache
+Each split is stored once as a memory-mapped uint8 (N, 224, 224, 3) array, so training and evaluation skip decode
+"""
+
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+from preprocessing import IMG_SIZE, load_uint8, normalize_into, preprocess_signature
+from utils import list_split_images
+
+logger = logging.getLogger(__name__)
+
+DATASET_PATH = Path(__file__).parent.parent / "datasets"
+DATASET_CACHE_DIR = Path(os.getenv('DATASET_CACHE_DIR', Path(__file__).parent / "cache" / "dataset"))
+SPLITS = ('train', 'validate', 'test')
+
+MANIFEST_VERSION = 1
+
+
+def file_hash(path):
+    """Content hash of a source image"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def split_dir(cache_dir, split):
+    return Path(cache_dir) / split
+
+
+def read_manifest(cache_dir, split):
+    """The split's manifest, or None if it has never been built"""
+    path = split_dir(cache_dir, split) / 'manifest.json'
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_atomic(path, write):
+    tmp = path.with_name(path.name + '.tmp')
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def build_split_cache(dataset_path=DATASET_PATH, split='train', cache_dir=DATASET_CACHE_DIR,
+                      img_size=IMG_SIZE, resample=None, draft=None, rebuild=False):
+    """Create or incrementally refresh one split's cache
+
+    Files whose size and mtime match the manifest are trusted without being
+    read; anything else is hashed, and only files whose hash isn't already
+    cached get decoded. Rows of unchanged files are copied from the previous
+    array. Changing the image size or preprocessing settings rebuilds the split.
+    """
+    dataset_path = Path(dataset_path)
+    out_dir = split_dir(cache_dir, split)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    signature = preprocess_signature(img_size, resample, draft)
+    manifest = None if rebuild else read_manifest(cache_dir, split)
+    if manifest and (manifest.get('version') != MANIFEST_VERSION or manifest.get('signature') != signature):
+        logger.info("Preprocessing settings changed for %s; rebuilding", split)
+        manifest = None
+    if manifest and not (out_dir / 'images.npy').exists():
+        manifest = None
+
+    old_entries = {e['path']: e for e in manifest['files']} if manifest else {}
+    old_by_hash = {e['hash']: e for e in old_entries.values()}
+    old_images = np.load(out_dir / 'images.npy', mmap_mode='r') if manifest else None
+
+    paths, labels = list_split_images(dataset_path, split)
+    entries, sources = [], []
+    for path, label in zip(paths, labels):
+        rel = path.relative_to(dataset_path).as_posix()
+        stat = path.stat()
+        old = old_entries.get(rel)
+        if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+            digest = old['hash']
+        else:
+            digest = file_hash(path)
+        entries.append({'path': rel, 'label': int(label), 'hash': digest,
+                        'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+        reuse = old if old and old['hash'] == digest else old_by_hash.get(digest)
+        sources.append(reuse['index'] if reuse else None)
+
+    decoded = sum(1 for s in sources if s is None)
+    removed = len(set(old_entries) - {e['path'] for e in entries})
+    unchanged = (manifest is not None and not decoded and not removed
+                 and sources == list(range(len(entries))))
+
+    if unchanged:
+        # Same files in the same rows; only refresh stat info (e.g. after a touch)
+        for i, entry in enumerate(entries):
+            entry['index'] = i
+        if entries != manifest['files']:
+            manifest['files'] = entries
+            _write_atomic(out_dir / 'manifest.json', lambda p: p.write_text(json.dumps(manifest, indent=2)))
+        return {'split': split, 'images': len(entries), 'reused': len(entries), 'decoded': 0,
+                'removed': 0, 'rebuilt': False}
+
+    def write_images(tmp):
+        images = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8,
+                                           shape=(len(entries), img_size, img_size, 3))
+        for i, (entry, source) in enumerate(zip(entries, sources)):
+            if source is None:
+                load_uint8(dataset_path / entry['path'], img_size, resample, draft, out=images[i])
+            else:
+                images[i] = old_images[source]
+        images.flush()
+        del images
+
+    def write_labels(tmp):
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(labels, dtype=np.int64))
+
+    _write_atomic(out_dir / 'images.npy', write_images)
+    _write_atomic(out_dir / 'labels.npy', write_labels)
+
+    for i, entry in enumerate(entries):
+        entry['index'] = i
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'split': split,
+        'signature': signature,
+        'img_size': img_size,
+        'count': len(entries),
+        'built_at': datetime.now().isoformat(),
+        'files': entries
+    }
+    _write_atomic(out_dir / 'manifest.json', lambda p: p.write_text(json.dumps(manifest, indent=2)))
+
+    logger.info("Dataset cache %s: %d images, %d decoded, %d reused, %d removed",
+                split, len(entries), decoded, len(entries) - decoded, removed)
+    return {'split': split, 'images': len(entries), 'reused': len(entries) - decoded, 'decoded': decoded,
+            'removed': removed, 'rebuilt': not old_entries}
+
+
+def load_split_cache(split, cache_dir=DATASET_CACHE_DIR):
+    """(images memmap, labels, manifest) for a built split"""
+    out_dir = split_dir(cache_dir, split)
+    manifest = read_manifest(cache_dir, split)
+    if manifest is None:
+        raise FileNotFoundError(f"No dataset cache for '{split}' in {cache_dir}. Run: python cli.py build-dataset-cache")
+    images = np.load(out_dir / 'images.npy', mmap_mode='r')
+    labels = np.load(out_dir / 'labels.npy')
+    return images, labels, manifest
+
+
+class DatasetCache:
+    """Look up cached uint8 images by source path across all built splits
+
+    A row is only served while the file's size and mtime still match the
+    manifest; anything else is a miss and the caller decodes it.
+    """
+
+    def __init__(self, cache_dir=DATASET_CACHE_DIR, dataset_path=DATASET_PATH, splits=SPLITS):
+        self.dataset_path = Path(dataset_path).resolve()
+        self.img_size = None
+        self._arrays = {}
+        self._index = {}
+
+        for split in splits:
+            manifest = read_manifest(cache_dir, split)
+            if manifest is None or manifest.get('version') != MANIFEST_VERSION:
+                continue
+            if manifest['signature'] != preprocess_signature(manifest['img_size']):
+                continue  # built with other preprocessing settings than this process uses
+            self.img_size = manifest['img_size']
+            self._arrays[split] = np.load(split_dir(cache_dir, split) / 'images.npy', mmap_mode='r')
+            for entry in manifest['files']:
+                self._index[str(self.dataset_path / entry['path'])] = (split, entry)
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, path):
+        """The cached (H, W, 3) uint8 row for a source file, or None"""
+        path = Path(path).resolve()
+        hit = self._index.get(str(path))
+        if hit is None:
+            return None
+        split, entry = hit
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        if stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+            return None
+        return self._arrays[split][entry['index']]
+
+    def load_into(self, path, out):
+        """Normalize a cached image into ``out``; False on a miss"""
+        row = self.get(path)
+        if row is None:
+            return False
+        normalize_into(row, out)
+        return True
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """The process-wide DatasetCache for DATASET_CACHE_DIR, or None if nothing is built"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DatasetCache()
+    return _default_cache if len(_default_cache) else None
@@ -0,0 +1,216 @@
+"""
+Multi-worker CPU training
+MultiWorkerMirroredStrategy over TF_CONFIG, with a launcher for several pinned worker processes on one host
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import subprocess
+from contextlib import closing
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from data_pipeline import as_input
+
+logger = logging.getLogger(__name__)
+
+# Set by launch_local_workers for each child: the CPUs that worker is pinned to
+WORKER_CPUS_ENV = 'TRAIN_WORKER_CPUS'
+
+LR_SCALING = ('linear', 'sqrt', 'none')
+
+
+def in_cluster():
+    """True when TF_CONFIG describes a cluster this process is a worker of"""
+    return bool(os.getenv('TF_CONFIG'))
+
+
+def cpu_chunks(num_workers, cpus=None):
+    """Split the usable CPUs into contiguous groups, one per worker
+
+    Linux numbers the cores of a socket contiguously, so on a multi-socket box
+    with one worker per socket each worker stays on its own socket's memory.
+    """
+    cpus = sorted(cpus if cpus is not None else os.sched_getaffinity(0))
+    if num_workers > len(cpus):
+        raise ValueError(f"{num_workers} workers need at least as many CPUs ({len(cpus)} available)")
+    return [chunk.tolist() for chunk in np.array_split(cpus, num_workers)]
+
+
+def pin_to(cpus):
+    """Pin this process to ``cpus`` and size TF's thread pools to match
+
+    The thread pools can only be sized before TensorFlow executes its first
+    op; later calls just move the process.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(len(cpus))
+        tf.config.threading.set_inter_op_parallelism_threads(2)
+    except RuntimeError:
+        pass  # TF already initialized in this process
+    return cpus
+
+
+def pin_worker():
+    """Pin this process to the CPUs the launcher gave it, if any"""
+    value = os.getenv(WORKER_CPUS_ENV)
+    if not value:
+        return None
+    return pin_to([int(cpu) for cpu in value.split(',')])
+
+
+class Cluster:
+    """This process's place in a training run: one worker of many, or a plain single process"""
+
+    def __init__(self, num_workers=1, index=0, strategy=None):
+        self.num_workers = num_workers
+        self.index = index
+        self.strategy = strategy or tf.distribute.get_strategy()
+
+    @classmethod
+    def from_env(cls):
+        """Read TF_CONFIG and create the MultiWorkerMirroredStrategy (call before building any model)"""
+        if not in_cluster():
+            return cls()
+
+        tf_config = json.loads(os.environ['TF_CONFIG'])
+        num_workers = len(tf_config['cluster'].get('worker', []))
+        index = tf_config['task']['index']
+        cpus = pin_worker()
+
+        # Ring all-reduce is the CPU-friendly implementation
+        options = tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING)
+        strategy = tf.distribute.MultiWorkerMirroredStrategy(communication_options=options)
+        logger.info(f"Worker {index}/{num_workers} ({strategy.num_replicas_in_sync} replicas in sync)"
+                    + (f", pinned to CPUs {cpus[0]}-{cpus[-1]}" if cpus else ""))
+        return cls(num_workers, index, strategy)
+
+    @property
+    def distributed(self):
+        return self.num_workers > 1
+
+    @property
+    def is_chief(self):
+        return self.index == 0
+
+    @property
+    def shard(self):
+        """(num_shards, index) for the data pipeline, or None when not distributed"""
+        return (self.num_workers, self.index) if self.distributed else None
+
+    def scope(self):
+        return self.strategy.scope()
+
+    def global_batch_size(self, per_worker_batch_size):
+        return per_worker_batch_size * self.num_workers
+
+    def lr_scale(self, rule='linear'):
+        """Learning rate multiplier for the larger global batch
+
+        ``linear`` (Goyal et al.) keeps the per-sample update size constant;
+        ``sqrt`` is gentler for adaptive optimizers on small datasets.
+        """
+        if rule == 'linear':
+            return float(self.num_workers)
+        if rule == 'sqrt':
+            return float(np.sqrt(self.num_workers))
+        if rule == 'none':
+            return 1.0
+        raise ValueError(f"Unknown learning rate scaling '{rule}'. Choose from: {', '.join(LR_SCALING)}")
+
+    def worker_path(self, path):
+        """``path`` on the chief; a per-worker sibling on the others, so they never clobber its files"""
+        if self.is_chief:
+            return path
+        return path.parent / f"worker-{self.index}" / path.name
+
+
+def distribute_split(cluster, data, class_weights=None, training=False):
+    """(distributed dataset, steps) for model.fit from a DatasetSplit built with ``shard=cluster.shard``
+
+    Each worker's shard is already batched at the per-worker batch size. The
+    dataset repeats and the step count is fixed, because all workers must run
+    the same number of steps even when their shards differ by an image.
+    Class weights become per-sample weights, since Keras can't apply
+    ``class_weight`` to a distributed dataset.
+    """
+    dataset = as_input(data)
+    if class_weights is not None:
+        table = tf.constant([class_weights[i] for i in sorted(class_weights)], dtype=tf.float32)
+        dataset = dataset.map(lambda images, labels: (images, labels, tf.gather(table, tf.cast(labels, tf.int32))),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.repeat()
+
+    global_batch = cluster.global_batch_size(data.batch_size)
+    if training:
+        steps = max(1, data.samples // global_batch)
+    else:
+        steps = max(1, -(-data.samples // global_batch))
+
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    dataset = dataset.with_options(options)
+    return cluster.strategy.distribute_datasets_from_function(lambda context: dataset), steps
+
+
+def local_copy(model):
+    """The trained model rebuilt outside the strategy, for chief-only evaluation and saving"""
+    copy = keras.models.clone_model(model)
+    copy.set_weights(model.get_weights())
+    return copy
+
+
+def _free_port():
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def launch_local_workers(num_workers, script, argv, pin=True):
+    """Run ``script argv`` as ``num_workers`` cooperating worker processes on this host
+
+    Each child gets a TF_CONFIG for a localhost cluster and, with ``pin``, its
+    own contiguous slice of the CPUs. If any worker fails the rest are
+    stopped, since the others would wait forever on its all-reduces.
+    Returns the exit code.
+    """
+    workers = [f"localhost:{_free_port()}" for _ in range(num_workers)]
+    chunks = cpu_chunks(num_workers) if pin else [None] * num_workers
+    logger.info(f"Launching {num_workers} local workers: {', '.join(workers)}")
+
+    processes = []
+    for index, cpus in enumerate(chunks):
+        env = dict(os.environ)
+        env['TF_CONFIG'] = json.dumps({'cluster': {'worker': workers}, 'task': {'type': 'worker', 'index': index}})
+        if cpus:
+            env[WORKER_CPUS_ENV] = ','.join(map(str, cpus))
+        processes.append(subprocess.Popen([sys.executable, str(script), *argv], env=env))
+
+    try:
+        while True:
+            codes = [p.poll() for p in processes]
+            if any(code not in (None, 0) for code in codes):
+                failed = next(i for i, code in enumerate(codes) if code not in (None, 0))
+                logger.error(f"Worker {failed} exited with code {codes[failed]}; stopping the others")
+                break
+            if all(code == 0 for code in codes):
+                return 0
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; stopping workers")
+
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        process.wait()
+    return max(abs(p.returncode) for p in processes) or 1
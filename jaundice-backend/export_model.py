@@ -0,0 +1,267 @@
+"""
+Model export for lightweight CPU serving
+Converts the trained Keras model to TFLite / ONNX and reports accuracy drift
+"""
+
+import json
+import mmap
+import time
+import logging
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+from inference import shared_onnx_path_for
+from model_bundle import configured_bundle_path, load_bundle
+from utils import load_batch, load_image, list_split_images
+
+logger = logging.getLogger(__name__)
+
+TFLITE_VARIANTS = ('float16', 'int8')
+ONNX_PARITY_TOLERANCE = 1e-4
+
+
+def tflite_path_for(model_path, variant):
+    """Path of a TFLite variant next to the Keras model, e.g. model_float16.tflite"""
+    model_path = Path(model_path)
+    return model_path.with_name(f"{model_path.stem}_{variant}.tflite")
+
+
+def representative_dataset(dataset_path, split='validate', max_samples=100):
+    """Calibration generator over a dataset split, one image per step"""
+    paths, _ = list_split_images(dataset_path, split)
+    if not paths:
+        raise FileNotFoundError(f"No calibration images found in {Path(dataset_path) / split}")
+
+    step = max(1, len(paths) // max_samples)
+    selected = paths[::step][:max_samples]
+
+    def generator():
+        for path in selected:
+            yield [load_image(path)[np.newaxis]]
+
+    return generator
+
+
+def export_tflite(model, model_path, dataset_path, variants=TFLITE_VARIANTS, calibration_samples=100):
+    """Convert a Keras model to the requested TFLite variants
+
+    ``float16`` stores weights in half precision. ``int8`` quantizes weights
+    and activations to int8, with activation ranges calibrated on the
+    validation split; inputs and outputs stay float32 so serving code is unchanged.
+    """
+    import tensorflow as tf
+
+    exported = {}
+    for variant in variants:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if variant == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif variant == 'int8':
+            converter.representative_dataset = representative_dataset(
+                dataset_path, 'validate', calibration_samples
+            )
+        else:
+            raise ValueError(f"Unknown TFLite variant: {variant}")
+
+        logger.info("Converting model to TFLite (%s)...", variant)
+        tflite_model = converter.convert()
+
+        output_path = tflite_path_for(model_path, variant)
+        output_path.write_bytes(tflite_model)
+        exported[variant] = output_path
+        logger.info("Saved %s TFLite model to %s (%.1f MB)",
+                    variant, output_path, len(tflite_model) / 1024 / 1024)
+
+    return exported
+
+
+def onnx_path_for(model_path):
+    """Path of the ONNX export next to the Keras model"""
+    return Path(model_path).with_suffix('.onnx')
+
+
+def export_onnx(model, model_path, opset=13):
+    """Convert a Keras model to ONNX with a dynamic batch dimension"""
+    import tensorflow as tf
+    import tf2onnx
+
+    input_signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='image')]
+    output_path = onnx_path_for(model_path)
+
+    logger.info("Converting model to ONNX (opset %d)...", opset)
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset,
+                               output_path=str(output_path))
+    logger.info("Saved ONNX model to %s (%.1f MB)", output_path, output_path.stat().st_size / 1024 / 1024)
+    return output_path
+
+
+def export_shared_onnx(onnx_path, min_bytes=4096):
+    """Write a pre-optimized copy of an ONNX model whose weights workers can share
+
+    ONNX Runtime applies its portable graph optimizations here, once, and the
+    result is saved with every initializer of at least ``min_bytes`` moved to
+    a side file at page-aligned offsets. ORT memory-maps such initializers and
+    uses them in place on CPU, so all workers serving the model read the same
+    page-cache pages instead of each holding a copy of the weights.
+    """
+    import onnx
+    import onnxruntime as ort
+    from onnx.external_data_helper import set_external_data
+
+    output_path = shared_onnx_path_for(onnx_path)
+    weights_path = output_path.with_suffix('.weights')
+    optimized_path = output_path.with_name(output_path.stem + '.optimized.onnx')
+
+    # Extended optimizations are hardware independent, unlike the layout changes ORT_ENABLE_ALL makes
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = str(optimized_path)
+    ort.InferenceSession(str(onnx_path), sess_options=options, providers=['CPUExecutionProvider'])
+    model = onnx.load(str(optimized_path))
+    optimized_path.unlink()
+
+    offset = 0
+    with open(weights_path, 'wb') as f:
+        for tensor in model.graph.initializer:
+            if len(tensor.raw_data) < min_bytes:
+                continue
+            offset = -(-offset // mmap.ALLOCATIONGRANULARITY) * mmap.ALLOCATIONGRANULARITY
+            f.seek(offset)
+            f.write(tensor.raw_data)
+            set_external_data(tensor, weights_path.name, offset, len(tensor.raw_data))
+            offset += len(tensor.raw_data)
+            tensor.ClearField('raw_data')
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+    onnx.save_model(model, str(output_path))
+
+    logger.info("Saved weight-sharing ONNX model to %s (weights in %s, %.1f MB)",
+                output_path, weights_path, weights_path.stat().st_size / 1024 / 1024)
+    return output_path
+
+
+def _score_engine(engine, images, labels, threshold):
+    """Probabilities, accuracy and per-image latency for one engine"""
+    started = time.perf_counter()
+    probs = np.concatenate([engine.predict(images[i:i + 1]) for i in range(len(images))])
+    elapsed = time.perf_counter() - started
+
+    accuracy = float(np.mean((probs >= threshold).astype(np.int64) == labels))
+    return probs, accuracy, elapsed / max(len(images), 1) * 1000
+
+
+def measure_drift(reference_engine, engines, dataset_path, split='test', threshold=0.5):
+    """Compare each engine against the reference (Keras) engine on a dataset split
+
+    Labels use ``probs >= threshold``, as ``model_bundle.postprocess`` does when serving.
+    """
+    paths, labels = list_split_images(dataset_path, split)
+    if not paths:
+        raise FileNotFoundError(f"No images found in {Path(dataset_path) / split}")
+    images = load_batch(paths)
+
+    reference_probs, reference_accuracy, reference_ms = _score_engine(
+        reference_engine, images, labels, threshold
+    )
+    reference_preds = reference_probs >= threshold
+
+    report = {
+        'split': split,
+        'samples': len(paths),
+        'threshold': threshold,
+        'reference': {'accuracy': reference_accuracy, 'latency_ms': reference_ms},
+        'variants': {}
+    }
+
+    for name, engine in engines.items():
+        probs, accuracy, latency_ms = _score_engine(engine, images, labels, threshold)
+        diff = np.abs(probs - reference_probs)
+        report['variants'][name] = {
+            'accuracy': accuracy,
+            'accuracy_drift': accuracy - reference_accuracy,
+            'agreement': float(np.mean((probs >= threshold) == reference_preds)),
+            'max_abs_diff': float(diff.max()),
+            'mean_abs_diff': float(diff.mean()),
+            'latency_ms': latency_ms,
+            'speedup': reference_ms / latency_ms if latency_ms else 0.0
+        }
+
+    return report
+
+
+def export_and_report(model_path, dataset_path, variants=TFLITE_VARIANTS, calibration_samples=100,
+                      threshold=None, num_threads=None):
+    """Export TFLite variants of a saved model and write a drift report next to it
+
+    ``threshold`` defaults to the one in the model's bundle, the one serving uses.
+    """
+    from inference import InferenceEngine, TFLiteEngine
+
+    threshold = load_bundle(model_path, threshold, configured_bundle_path(model_path)).threshold
+
+    reference = InferenceEngine.from_path(str(model_path), warmup_batch_sizes=())
+    exported = export_tflite(reference.model, model_path, dataset_path, variants, calibration_samples)
+
+    engines = {
+        variant: TFLiteEngine(str(path), pool_size=1, num_threads=num_threads)
+        for variant, path in exported.items()
+    }
+    report = measure_drift(reference, engines, dataset_path, 'test', threshold)
+
+    report['model_path'] = str(model_path)
+    report['exported'] = {variant: str(path) for variant, path in exported.items()}
+    for variant, path in exported.items():
+        report['variants'][variant]['size_mb'] = Path(path).stat().st_size / 1024 / 1024
+    report['export_date'] = datetime.now().isoformat()
+
+    report_path = Path(model_path).with_name('tflite_export_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info("Export report saved to: %s", report_path)
+
+    return report
+
+
+def export_onnx_and_check(model_path, dataset_path, opset=13, tolerance=ONNX_PARITY_TOLERANCE,
+                          intra_op_threads=None, inter_op_threads=None, threshold=None):
+    """Export a saved model to ONNX and check ORT probabilities match Keras on the test split
+
+    The weight-sharing export (``export_shared_onnx``) is written and checked
+    alongside the plain one. Returns the drift report; ``report['parity_ok']``
+    is False when any test image from either differs from the Keras
+    probability by more than ``tolerance``. Agreement is measured at the
+    bundle's threshold unless ``threshold`` is given.
+    """
+    from inference import InferenceEngine, OnnxEngine
+
+    threshold = load_bundle(model_path, threshold, configured_bundle_path(model_path)).threshold
+
+    reference = InferenceEngine.from_path(str(model_path), warmup_batch_sizes=())
+    output_path = export_onnx(reference.model, model_path, opset)
+    shared_path = export_shared_onnx(output_path)
+
+    engines = {
+        'onnx': OnnxEngine(str(output_path), intra_op_threads=intra_op_threads,
+                           inter_op_threads=inter_op_threads),
+        'onnx-shared': OnnxEngine(str(shared_path), intra_op_threads=intra_op_threads,
+                                  inter_op_threads=inter_op_threads, share_weights=True)
+    }
+    report = measure_drift(reference, engines, dataset_path, 'test', threshold)
+
+    report['model_path'] = str(model_path)
+    report['exported'] = {'onnx': str(output_path), 'onnx-shared': str(shared_path)}
+    report['variants']['onnx']['size_mb'] = output_path.stat().st_size / 1024 / 1024
+    report['variants']['onnx-shared']['size_mb'] = shared_path.with_suffix('.weights').stat().st_size / 1024 / 1024
+    report['tolerance'] = tolerance
+    report['parity_ok'] = all(data['max_abs_diff'] <= tolerance for data in report['variants'].values())
+    report['export_date'] = datetime.now().isoformat()
+
+    report_path = Path(model_path).with_name('onnx_export_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info("Export report saved to: %s", report_path)
+
+    return report
@@ -0,0 +1,109 @@
+"""
+Frozen-backbone feature cache for phase-1 training
+Runs MobileNetV2 + GlobalAveragePooling2D once per image and trains the classifier head on the saved embeddings
+"""
+
+import os
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers, models
+
+import dataset_cache
+from data_pipeline import build_cached_dataset
+
+logger = logging.getLogger(__name__)
+
+FEATURE_CACHE_DIR = Path(os.getenv('FEATURE_CACHE_DIR', Path(__file__).parent / "cache" / "features"))
+
+
+def feature_extractor(model):
+    """The model's own backbone + pooling layers as a standalone model
+
+    ``model`` is the Sequential from build_model(): [backbone, pooling, head...].
+    Sharing the layers (rather than rebuilding them) guarantees the cached
+    embeddings are exactly what the full model feeds its head.
+    """
+    return keras.Model(inputs=model.inputs, outputs=model.layers[1].output)
+
+
+def head_model(model):
+    """The model's classifier head on its own, sharing weights with the full model
+
+    Training this trains the full model's head in place, so phase 2 starts
+    from the weights phase 1 found without any copying.
+    """
+    feature_dim = model.layers[1].output.shape[-1]
+    return models.Sequential([layers.Input(shape=(feature_dim,))] + model.layers[2:])
+
+
+def _backbone_fingerprint(model):
+    """Identify the frozen backbone weights, so a different backbone never reuses features
+
+    Every weight's name, shape, dtype and values go into the hash. MobileNetV2
+    holds ~9 MB of weights, so this costs a few milliseconds per run.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for weights in model.layers[0].weights:
+        values = weights.numpy()
+        digest.update(f"{weights.name}:{values.shape}:{values.dtype}".encode())
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def features_key(manifest, model, augment_copies, seed):
+    """Cache key covering the images, preprocessing, backbone and augmentation settings"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(manifest['signature'].encode())
+    for entry in manifest['files']:
+        digest.update(entry['hash'].encode())
+    policy = keras.mixed_precision.global_policy().name
+    digest.update(f"{_backbone_fingerprint(model)}:{tf.__version__}:{policy}:{augment_copies}:{seed}".encode())
+    return digest.hexdigest()
+
+
+def extract_features(model, images, labels, batch_size=32, augment_copies=0, seed=42):
+    """Embeddings of every image, plus ``augment_copies`` fixed augmented passes over them"""
+    extractor = feature_extractor(model)
+    passes = [build_cached_dataset(images, labels, batch_size, training=False, augment=False)]
+    for copy in range(augment_copies):
+        tf.random.set_seed(seed + copy)
+        passes.append(build_cached_dataset(images, labels, batch_size, training=False, augment=True))
+
+    features = np.concatenate([extractor.predict(ds, verbose=0) for ds in passes])
+    return features.astype(np.float32), np.tile(np.asarray(labels, dtype=np.float32), len(passes))
+
+
+def load_or_extract(model, dataset_path, split, img_size=224, batch_size=32, augment_copies=0,
+                    seed=42, cache_dir=FEATURE_CACHE_DIR):
+    """(features, labels) for a split, extracted once and reused from disk afterwards"""
+    dataset_cache.build_split_cache(dataset_path, split, img_size=img_size)
+    images, labels, manifest = dataset_cache.load_split_cache(split)
+
+    key = features_key(manifest, model, augment_copies, seed)
+    path = Path(cache_dir) / f"{split}-{key}.npz"
+    if path.exists():
+        with np.load(path) as data:
+            logger.info(f"Loaded cached {split} features: {data['features'].shape}")
+            return data['features'], data['labels']
+
+    logger.info(f"Extracting {split} features ({len(labels)} images x {1 + augment_copies} passes)...")
+    features, feature_labels = extract_features(model, images, labels, batch_size, augment_copies, seed)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.stem + '.tmp.npz')
+    np.savez(tmp, features=features, labels=feature_labels)
+    os.replace(tmp, path)
+    return features, feature_labels
+
+
+def feature_dataset(features, labels, batch_size=32, training=False, seed=None):
+    """Batched in-memory dataset of cached embeddings"""
+    ds = tf.data.Dataset.from_tensor_slices((features, labels))
+    if training:
+        ds = ds.shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+    return ds.batch(batch_size).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration for production deployment
+Use with: gunicorn -c gunicorn.conf.py wsgi:app
+
+With PRELOAD_MODEL=True the app and the model runtime are imported once in
+the master and shared copy-on-write by the forked workers. Weights are shared
+only by the onnx backend's memory-mapped export (ORT_SHARE_WEIGHTS); Keras
+and TFLite workers each hold their own copy.
+Every worker builds and warms up its engine before it accepts traffic.
+"""
+
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+preload_app = os.getenv('PRELOAD_MODEL', 'False').lower() == 'true'
+
+
+def post_worker_init(worker):
+    """Warm up the model in each worker before its accept loop starts"""
+    from app import warmup_worker
+    warmup_worker()
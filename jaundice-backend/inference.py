@@ -0,0 +1,295 @@
+"""
+Inference engines for the Jaundice Detection model
+Keras (traced tf.function), TFLite and ONNX Runtime backends share one interface
+"""
+
+import os
+import time
+import queue
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IMG_SIZE = 224
+DEFAULT_WARMUP_BATCH_SIZES = (1, 2, 4, 8, 16, 32)
+BACKENDS = ('keras', 'tflite', 'onnx')
+
+
+def parse_batch_sizes(value, default=DEFAULT_WARMUP_BATCH_SIZES):
+    """Parse a comma-separated list of batch sizes, e.g. "1,4,16" """
+    if not value:
+        return tuple(default)
+    return tuple(sorted({int(v) for v in value.split(',') if v.strip()}))
+
+
+WARMUP_BATCH_SIZES = parse_batch_sizes(os.getenv('WARMUP_BATCH_SIZES'))
+
+
+def batch_buckets(max_batch_size, sizes=WARMUP_BATCH_SIZES):
+    """Bucket sizes for batches of at most ``max_batch_size``: ``sizes`` below it, plus the maximum itself"""
+    return tuple(sorted({size for size in sizes if size < max_batch_size} | {max_batch_size}))
+
+
+class _BaseEngine:
+    """Shared input validation, batch bucketing and warmup for all backends
+
+    Backends that compile for a fixed input shape (Keras, TFLite) pad every
+    batch up to the nearest of ``warmup_batch_sizes`` and split batches past
+    the largest, so they only ever run, and warm up, those few shapes. With no
+    warmup sizes they run whatever batch size they are given.
+    """
+
+    backend = None
+
+    def __init__(self, img_size=IMG_SIZE, warmup_batch_sizes=WARMUP_BATCH_SIZES):
+        self.img_size = img_size
+        self.input_shape = (img_size, img_size, 3)
+        self.warmup_batch_sizes = tuple(sorted(set(warmup_batch_sizes)))
+        self.warmup_seconds = None
+
+    def _check_input(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        if images.ndim == 3:
+            images = images[np.newaxis]
+        if images.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected input of shape (N, {self.img_size}, {self.img_size}, 3), got {images.shape}")
+        return images
+
+    def _run_bucketed(self, images, run):
+        """Call ``run`` on bucket-sized, zero-padded chunks of the batch and trim the padding off the results"""
+        if not self.warmup_batch_sizes:
+            return run(images)
+        largest = self.warmup_batch_sizes[-1]
+        outputs = []
+        for start in range(0, len(images), largest):
+            chunk = images[start:start + largest]
+            count = len(chunk)
+            bucket = next(size for size in self.warmup_batch_sizes if size >= count)
+            if bucket > count:
+                chunk = np.concatenate([chunk, np.zeros((bucket - count,) + self.input_shape, dtype=np.float32)])
+            outputs.append(run(chunk)[:count])
+        return np.concatenate(outputs) if outputs else np.zeros(0, dtype=np.float32)
+
+    def warmup(self):
+        """Run each warmup batch size (bucket) once so the first real request pays no setup cost"""
+        started = time.perf_counter()
+        for batch_size in self.warmup_batch_sizes:
+            self.predict(np.zeros((batch_size,) + self.input_shape, dtype=np.float32))
+        self.warmup_seconds = time.perf_counter() - started
+        logger.info("%s engine warmed up for batch sizes %s in %.2fs",
+                    self.backend, list(self.warmup_batch_sizes), self.warmup_seconds)
+        return self
+
+    def predict(self, images):
+        """Return the jaundice probability for each image in a (N, H, W, 3) batch"""
+        raise NotImplementedError
+
+
+class InferenceEngine(_BaseEngine):
+    """Run the classifier through a tf.function instead of Model.predict
+
+    ``Model.predict`` builds a data adapter, callbacks and a fresh execution
+    function on every call. Here the model is traced once per batch bucket
+    into a concrete function with a static batch dimension, so each call is a
+    single graph execution of an already-specialized graph. Without buckets
+    one function with a dynamic batch dimension serves every size.
+    """
+
+    backend = 'keras'
+
+    def __init__(self, model, img_size=IMG_SIZE, warmup_batch_sizes=WARMUP_BATCH_SIZES):
+        import tensorflow as tf
+
+        super().__init__(img_size, warmup_batch_sizes)
+        self.model = model
+        self._function = tf.function(self._call_model)
+        self._forward = {}
+
+    @classmethod
+    def from_path(cls, model_path, **kwargs):
+        """Load a saved Keras model and wrap it"""
+        import tensorflow as tf
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found at {model_path}. Please train the model first.")
+        model = tf.keras.models.load_model(model_path)
+        return cls(model, **kwargs)
+
+    def _call_model(self, images):
+        return self.model(images, training=False)
+
+    def _forward_for(self, batch_size):
+        """The concrete function for one batch size (None for any), traced on first use"""
+        import tensorflow as tf
+
+        forward = self._forward.get(batch_size)
+        if forward is None:
+            forward = self._function.get_concrete_function(
+                tf.TensorSpec([batch_size, self.img_size, self.img_size, 3], tf.float32))
+            self._forward[batch_size] = forward
+        return forward
+
+    def _run(self, images):
+        import tensorflow as tf
+
+        forward = self._forward_for(len(images) if self.warmup_batch_sizes else None)
+        return forward(tf.convert_to_tensor(images)).numpy().reshape(-1)
+
+    def predict(self, images):
+        """Return the jaundice probability for each image in a (N, H, W, 3) batch"""
+        return self._run_bucketed(self._check_input(images), self._run)
+
+
+def _tflite_interpreter_class():
+    """Prefer the standalone tflite-runtime package, fall back to full TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteEngine(_BaseEngine):
+    """Serve a TFLite model through a pool of interpreters
+
+    A TFLite interpreter is not thread-safe, so each concurrent call checks
+    a slot out of the pool. A slot keeps one interpreter per batch bucket,
+    allocated on first use (warmup), so a stream of different batch sizes
+    never resizes and reallocates tensors. Without buckets a slot has a single
+    interpreter that is resized whenever the batch size changes.
+    """
+
+    backend = 'tflite'
+
+    def __init__(self, model_path, pool_size=2, num_threads=None, img_size=IMG_SIZE,
+                 warmup_batch_sizes=WARMUP_BATCH_SIZES):
+        super().__init__(img_size, warmup_batch_sizes)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"TFLite model not found at {model_path}. Run 'python cli.py export-tflite' first.")
+
+        self.model_path = model_path
+        self.pool_size = max(1, int(pool_size))
+        self.num_threads = num_threads
+
+        self._interpreter_class = _tflite_interpreter_class()
+        self._pool = queue.Queue()
+        for _ in range(self.pool_size):
+            self._pool.put({None: self._new_interpreter()})
+        logger.info("Loaded TFLite model %s (%d interpreters, %s threads each)",
+                    model_path, self.pool_size, num_threads or 'default')
+
+    def _new_interpreter(self):
+        interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def _interpreter_for(self, slot, shape):
+        """The slot's interpreter for this input shape, sized for it"""
+        key = shape[0] if self.warmup_batch_sizes else None
+        interpreter = slot.get(key)
+        if interpreter is None:
+            # The first bucket takes over the interpreter built at load time
+            interpreter = slot.pop(None, None)
+            slot[key] = interpreter if interpreter is not None else self._new_interpreter()
+            interpreter = slot[key]
+        input_detail = interpreter.get_input_details()[0]
+        if tuple(input_detail['shape']) != shape:
+            interpreter.resize_tensor_input(input_detail['index'], shape)
+            interpreter.allocate_tensors()
+        return interpreter, input_detail['index']
+
+    def _run(self, images):
+        slot = self._pool.get()
+        try:
+            interpreter, input_index = self._interpreter_for(slot, images.shape)
+            interpreter.set_tensor(input_index, images)
+            interpreter.invoke()
+            output_index = interpreter.get_output_details()[0]['index']
+            return interpreter.get_tensor(output_index).reshape(-1).astype(np.float32)
+        finally:
+            self._pool.put(slot)
+
+    def predict(self, images):
+        """Return the jaundice probability for each image in a (N, H, W, 3) batch"""
+        return self._run_bucketed(self._check_input(images), self._run)
+
+
+class OnnxEngine(_BaseEngine):
+    """Serve an ONNX export through a single ONNX Runtime session
+
+    One session per process with pinned intra/inter-op thread counts lets
+    several gunicorn workers share a node without oversubscribing cores.
+    ``InferenceSession.run`` is thread-safe, so no pool is needed.
+
+    With ``share_weights`` the model is the pre-optimized export from
+    ``export_model.export_shared_onnx``, whose weights sit page-aligned in a
+    side file. ONNX Runtime memory-maps them and uses them in place, so every
+    worker reads the same page-cache pages. Session-time optimization and
+    prepacking are turned off because they would copy the weights again.
+    """
+
+    backend = 'onnx'
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None, img_size=IMG_SIZE,
+                 warmup_batch_sizes=WARMUP_BATCH_SIZES, share_weights=False):
+        import onnxruntime as ort
+
+        super().__init__(img_size, warmup_batch_sizes)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found at {model_path}. Run 'python cli.py export-onnx' first.")
+
+        options = ort.SessionOptions()
+        if share_weights:
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            options.add_session_config_entry('session.disable_prepacking', '1')
+        else:
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+
+        self.model_path = model_path
+        self.share_weights = share_weights
+        self._session = ort.InferenceSession(model_path, sess_options=options,
+                                             providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+        logger.info("Loaded ONNX model %s (intra-op threads: %s, inter-op threads: %s, shared weights: %s)",
+                    model_path, intra_op_threads or 'default', inter_op_threads or 'default', share_weights)
+
+    def predict(self, images):
+        """Return the jaundice probability for each image in a (N, H, W, 3) batch"""
+        images = self._check_input(images)
+        outputs = self._session.run(None, {self._input_name: images})
+        return np.asarray(outputs[0], dtype=np.float32).reshape(-1)
+
+
+def shared_onnx_path_for(onnx_path):
+    """Path of the weight-sharing ONNX export, e.g. model_shared.onnx next to model.onnx"""
+    onnx_path = Path(onnx_path)
+    return onnx_path.with_name(f"{onnx_path.stem}_shared.onnx")
+
+
+def backend_model_path(backend, model_path, tflite_model_path=None, onnx_model_path=None):
+    """The file a backend serves from"""
+    return {'tflite': tflite_model_path, 'onnx': onnx_model_path}.get(backend, model_path)
+
+
+def load_engine(backend, model_path, tflite_model_path=None, tflite_pool_size=2, tflite_num_threads=None,
+                onnx_model_path=None, ort_intra_op_threads=None, ort_inter_op_threads=None,
+                ort_share_weights=False, **kwargs):
+    """Create the inference engine for the configured serving backend"""
+    if backend == 'keras':
+        return InferenceEngine.from_path(model_path, **kwargs)
+    if backend == 'tflite':
+        return TFLiteEngine(tflite_model_path, pool_size=tflite_pool_size,
+                            num_threads=tflite_num_threads, **kwargs)
+    if backend == 'onnx':
+        return OnnxEngine(onnx_model_path, intra_op_threads=ort_intra_op_threads,
+                          inter_op_threads=ort_inter_op_threads, share_weights=ort_share_weights, **kwargs)
+    raise ValueError(f"Unknown MODEL_BACKEND '{backend}'. Choose from: {', '.join(BACKENDS)}")
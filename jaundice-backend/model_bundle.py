@@ -0,0 +1,179 @@
+"""
+Model bundle: the trained weights plus everything needed to serve them
+Decision threshold, version and input spec live in a JSON file next to the model file
+"""
+
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.5
+CLASSES = ('normal', 'jaundice')
+
+# Metrics files that older training runs left next to the model
+LEGACY_METRICS_FILES = ('model_metrics.json', 'best_model_metrics.json')
+
+
+def bundle_path_for(model_path):
+    """Bundle manifest next to the model file, e.g. models/jaundice_detection_model.bundle.json"""
+    model_path = Path(model_path)
+    return model_path.with_name(f"{model_path.stem}.bundle.json")
+
+
+def configured_bundle_path(model_path):
+    """MODEL_BUNDLE_PATH when set, otherwise the bundle next to ``model_path``
+
+    Training and serving both read this, so the bundle a training run writes
+    is the one the server loads even when the model file is copied elsewhere.
+    """
+    return Path(os.getenv('MODEL_BUNDLE_PATH') or bundle_path_for(model_path))
+
+
+def model_digest(model_path):
+    """Short blake2b digest of the model file; the suffix of a bundle version"""
+    return hashlib.blake2b(Path(model_path).read_bytes(), digest_size=4).hexdigest()
+
+
+def _version_digest(version):
+    """The model digest in a '<date>-<digest>' version, or None for older version strings"""
+    digest = str(version or '').rpartition('-')[2]
+    return digest if len(digest) == 8 and all(c in '0123456789abcdef' for c in digest) else None
+
+
+def make_input_spec(img_size=224, preprocessing=None):
+    """What the model expects: RGB float32 in [0, 1] at img_size x img_size"""
+    return {
+        'shape': [img_size, img_size, 3],
+        'dtype': 'float32',
+        'range': [0.0, 1.0],
+        'preprocessing': preprocessing
+    }
+
+
+class ModelBundle:
+    """Serving metadata for one trained model"""
+
+    def __init__(self, model_path, threshold=DEFAULT_THRESHOLD, version=None, input_spec=None,
+                 classes=CLASSES, metrics=None, source='default'):
+        self.model_path = str(model_path)
+        self.threshold = float(threshold)
+        self.version = version or '1.0'
+        self.input_spec = input_spec or make_input_spec()
+        self.classes = list(classes)
+        self.metrics = metrics or {}
+        self.source = source
+
+        # Just above 1.0 is the threshold that flags nothing when scores saturate at 1.0
+        if not 0.0 <= self.threshold <= np.nextafter(1.0, 2.0):
+            raise ValueError(f"Model threshold must be within [0, 1], got {self.threshold}")
+
+    def check_input(self, img_size):
+        """Fail fast when the served preprocessing doesn't match what the model was trained on"""
+        expected = self.input_spec.get('shape', [img_size, img_size, 3])
+        if list(expected) != [img_size, img_size, 3]:
+            raise ValueError(f"Model bundle expects input {expected} but serving uses "
+                             f"{[img_size, img_size, 3]}")
+
+    def to_dict(self):
+        return {
+            'model_file': Path(self.model_path).name,
+            'version': self.version,
+            'threshold': self.threshold,
+            'classes': self.classes,
+            'input_spec': self.input_spec,
+            'metrics': self.metrics
+        }
+
+
+def write_bundle(model_path, threshold, metrics=None, img_size=224, preprocessing=None, version=None, path=None):
+    """Write the bundle manifest for a freshly saved model and return its path (next to the model by default)"""
+    model_path = Path(model_path)
+    if version is None:
+        version = f"{datetime.now():%Y.%m.%d}-{model_digest(model_path)}"
+
+    bundle = ModelBundle(model_path, threshold, version, make_input_spec(img_size, preprocessing),
+                         metrics={k: v for k, v in (metrics or {}).items() if not isinstance(v, (dict, list))},
+                         source='bundle')
+    path = Path(path) if path is not None else bundle_path_for(model_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(bundle.to_dict(), indent=2))
+    os.replace(tmp, path)
+    return path
+
+
+def load_bundle(model_path, threshold_override=None, bundle_path=None):
+    """Load a model's bundle, falling back to a legacy metrics file, then to a 0.5 threshold
+
+    ``bundle_path`` defaults to the bundle next to the model file.
+    ``threshold_override`` (e.g. from the PREDICTION_THRESHOLD env var) wins
+    over whatever the bundle says. A bundle whose version names a different
+    model digest than the file at ``model_path`` was trained with another
+    model, so it is ignored like a missing one.
+    """
+    model_path = Path(model_path)
+    path = Path(bundle_path) if bundle_path is not None else bundle_path_for(model_path)
+
+    bundle = None
+    if path.exists():
+        with open(path) as f:
+            data = json.load(f)
+        expected = _version_digest(data.get('version'))
+        actual = model_digest(model_path) if expected and model_path.exists() else expected
+        if actual == expected:
+            bundle = ModelBundle(model_path, data.get('threshold', DEFAULT_THRESHOLD), data.get('version'),
+                                 data.get('input_spec'), data.get('classes', CLASSES), data.get('metrics'),
+                                 source=str(path))
+        else:
+            logger.warning("Model bundle %s (version %s) was written for another model than %s (digest %s); "
+                           "ignoring it", path, data.get('version'), model_path, actual)
+
+    if bundle is None:
+        bundle = ModelBundle(model_path)
+        for name in LEGACY_METRICS_FILES:
+            metrics_path = model_path.parent / name
+            if metrics_path.exists():
+                with open(metrics_path) as f:
+                    metrics = json.load(f)
+                if 'threshold' in metrics:
+                    bundle = ModelBundle(model_path, metrics['threshold'], metrics.get('model_version'),
+                                         source=str(metrics_path))
+                    break
+        if threshold_override is None:
+            logger.warning("No usable model bundle at %s (set MODEL_BUNDLE_PATH to the bundle written by training); "
+                           "serving the FALLBACK threshold %.4f from %s, not the trained one",
+                           path, bundle.threshold, bundle.source)
+
+    if threshold_override is not None:
+        bundle.threshold = float(threshold_override)
+        bundle.source = 'override'
+    logger.info("Model bundle: version %s, threshold %.4f (%s)", bundle.version, bundle.threshold, bundle.source)
+    return bundle
+
+
+def postprocess(probs, threshold):
+    """Turn a batch of jaundice probabilities into response records in one vectorized pass
+
+    Confidence is the probability of the predicted class.
+    """
+    probs = np.asarray(probs, dtype=np.float64).reshape(-1)
+    jaundice = probs >= threshold
+    confidence = np.where(jaundice, probs, 1.0 - probs)
+    labels = np.where(jaundice, CLASSES[1], CLASSES[0])
+
+    return [
+        {
+            'prediction': label,
+            'confidence': conf,
+            'probability_jaundice': p,
+            'probability_normal': q
+        }
+        for label, conf, p, q in zip(labels.tolist(), confidence.tolist(), probs.tolist(), (1.0 - probs).tolist())
+    ]
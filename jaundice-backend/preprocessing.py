@@ -0,0 +1,111 @@
+"""
+Shared image preprocessing for serving, evaluation and the CLI
+Decodes, resizes and normalizes images straight into caller-provided buffers
+"""
+
+import io
+import os
+import logging
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMG_SIZE = 224
+
+RESAMPLE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+RESAMPLE_FILTER = os.getenv('RESAMPLE_FILTER', 'lanczos').lower()
+# Opt-in: draft decoding changes the pixels, so the model must be checked (or
+# trained) with it before it is served that way
+JPEG_DRAFT = os.getenv('JPEG_DRAFT', 'False').lower() == 'true'
+
+_SCALE = np.float32(255.0)
+
+
+def _target_size(size):
+    """Accept an int or a (width, height) tuple"""
+    if isinstance(size, int):
+        return (size, size)
+    return tuple(size)
+
+
+def get_resample_filter(name=None):
+    """Look up a PIL resampling filter by name"""
+    name = (name or RESAMPLE_FILTER).lower()
+    if name not in RESAMPLE_FILTERS:
+        raise ValueError(f"Unknown resample filter '{name}'. Choose from: {', '.join(RESAMPLE_FILTERS)}")
+    return RESAMPLE_FILTERS[name]
+
+
+def decode_image(source, size=IMG_SIZE, draft=None):
+    """Open an image from raw bytes or a path and convert it to RGB
+
+    With ``draft`` enabled, JPEGs are decoded at the smallest DCT scale
+    (1/2, 1/4 or 1/8) that still covers the target size, so a 12 MP phone
+    photo never gets fully decoded just to be shrunk to 224x224. The
+    reduced-scale decode gives slightly different pixels than a full decode,
+    so it is off unless ``JPEG_DRAFT`` is set.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+
+    if JPEG_DRAFT if draft is None else draft:
+        img.draft('RGB', _target_size(size))
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def resize_image(img, size=IMG_SIZE, resample=None):
+    """Resize a decoded image to the model input size"""
+    size = _target_size(size)
+    if img.size == size:
+        return img
+    return img.resize(size, get_resample_filter(resample))
+
+
+def load_uint8(source, size=IMG_SIZE, resample=None, draft=None, out=None):
+    """Decode and resize to a (H, W, 3) uint8 array, optionally into ``out``"""
+    img = resize_image(decode_image(source, size, draft), size, resample)
+    if out is None:
+        return np.asarray(img, dtype=np.uint8)
+    out[...] = np.asarray(img)
+    return out
+
+
+def normalize_into(pixels, out):
+    """Scale uint8 pixels to [0, 1] float32 in place of ``out``"""
+    np.divide(pixels, _SCALE, out=out, dtype=np.float32, casting='unsafe')
+    return out
+
+
+def preprocess_into(source, out, size=IMG_SIZE, resample=None, draft=None):
+    """Decode, resize and normalize to [0, 1] into a preallocated (H, W, 3) float32 slot"""
+    img = resize_image(decode_image(source, size, draft), size, resample)
+    return normalize_into(np.asarray(img), out)
+
+
+def preprocess_signature(size=IMG_SIZE, resample=None, draft=None):
+    """Identify the preprocessing settings, so cached tensors are never reused across them"""
+    width, height = _target_size(size)
+    draft = JPEG_DRAFT if draft is None else draft
+    return f"{width}x{height}-{(resample or RESAMPLE_FILTER).lower()}-{'draft' if draft else 'full'}"
+
+
+def preprocess(source, size=IMG_SIZE, resample=None, draft=None, batch_dim=True):
+    """Preprocess one image into a new float32 array, shaped (1, H, W, 3) by default"""
+    width, height = _target_size(size)
+    out = np.empty((1, height, width, 3), dtype=np.float32)
+    preprocess_into(source, out[0], size, resample, draft)
+    return out if batch_dim else out[0]
@@ -0,0 +1,198 @@
+"""
+Opt-in request profiling for slow predictions
+Sampled or slow requests keep a per-stage timing trace (and optionally a cProfile) in a bounded ring buffer
+"""
+
+import io
+import json
+import time
+import random
+import pstats
+import cProfile
+import logging
+import itertools
+import threading
+import contextvars
+from pathlib import Path
+from datetime import datetime
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('profiling_trace', default=None)
+
+
+def current_trace():
+    """The trace of the request running in this context, if it is being traced"""
+    return _current.get()
+
+
+class Trace:
+    """Stage timings and notes for one request"""
+
+    def __init__(self, trace_id, method, route, sampled, profile=None):
+        self.id = trace_id
+        self.method = method
+        self.route = route
+        self.sampled = sampled
+        self.profile = profile
+        self.profile_stats = None
+        self.status = None
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now().isoformat()
+        self.duration = None
+        self.stages = []  # (stage, offset, seconds)
+        self.notes = {}
+        self.token = None
+
+    def stage(self, name, seconds):
+        # Stages are recorded as they finish; the offset is when this one started
+        self.stages.append((name, time.perf_counter() - seconds - self.started, seconds))
+
+    def note(self, key, value):
+        self.notes[key] = value
+
+    def profiled(self, func, *args):
+        """Run ``func`` under this trace's cProfile, from whichever thread does the work"""
+        if self.profile is None:
+            return func(*args)
+        return self.profile.runcall(func, *args)
+
+    def close_profile(self):
+        """Stop the profiler and keep only its aggregated stats"""
+        if self.profile is None:
+            return
+        self.profile.disable()
+        try:
+            self.profile_stats = pstats.Stats(self.profile)
+        except TypeError:
+            pass  # nothing ran under the profiler
+        self.profile = None
+
+    def profile_text(self, limit=40):
+        if self.profile_stats is None:
+            return None
+        out = io.StringIO()
+        self.profile_stats.stream = out
+        self.profile_stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def to_dict(self, profile=False):
+        record = {
+            'id': self.id,
+            'timestamp': self.timestamp,
+            'method': self.method,
+            'route': self.route,
+            'status': self.status,
+            'duration_ms': self.duration * 1000 if self.duration is not None else None,
+            'reason': 'sampled' if self.sampled else 'slow',
+            'stages': [
+                {'stage': name, 'offset_ms': offset * 1000, 'ms': seconds * 1000}
+                for name, offset, seconds in self.stages
+            ],
+            'notes': self.notes,
+            'has_profile': self.profile_stats is not None
+        }
+        if profile:
+            record['profile'] = self.profile_text()
+        return record
+
+
+class RequestProfiler:
+    """Decide which requests to trace and keep the interesting traces
+
+    A ``sample_rate`` fraction of requests is traced from the start and, with
+    ``python_profile``, run under cProfile. With ``slow_ms`` set, every
+    request gets a stage trace (a few list appends), kept only if it ran
+    longer than that. A slow request that was not sampled has stage timings
+    but no Python profile, since cProfile can't be started after the fact.
+    Only one request is profiled with cProfile at a time; Python 3.12 allows
+    no more, and profiling concurrent requests would mix their timings anyway.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=0.0, python_profile=False, capacity=100,
+                 routes=None, dump_dir='logs/profiles'):
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.slow = float(slow_ms) / 1000 if slow_ms else None
+        self.python_profile = python_profile
+        self.capacity = max(1, int(capacity))
+        self.routes = set(routes) if routes else None
+        self.dump_dir = Path(dump_dir)
+        self.enabled = self.sample_rate > 0 or self.slow is not None
+
+        self._traces = deque(maxlen=self.capacity)
+        self._ids = itertools.count(1)
+        self._profile_lock = threading.Lock()
+        self.traced = 0
+        self.kept = 0
+
+    def begin(self, method, route):
+        """Start tracing a request if it is sampled or could turn out slow; returns the trace or None"""
+        if not self.enabled or (self.routes is not None and route not in self.routes):
+            return None
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow is None:
+            return None
+
+        profile = None
+        if sampled and self.python_profile and self._profile_lock.acquire(blocking=False):
+            profile = cProfile.Profile()
+        trace = Trace(next(self._ids), method, route, sampled, profile)
+        trace.token = _current.set(trace)
+        self.traced += 1
+        return trace
+
+    def end(self, trace, status=None):
+        """Finish a trace and keep it if it was sampled or slow"""
+        trace.duration = time.perf_counter() - trace.started
+        if status is not None:
+            trace.status = status
+        try:
+            _current.reset(trace.token)
+        except ValueError:
+            _current.set(None)  # ended from a different context than it began in
+        if trace.profile is not None:
+            trace.close_profile()
+            self._profile_lock.release()
+
+        slow = self.slow is not None and trace.duration >= self.slow
+        if not (trace.sampled or slow):
+            return None
+        self._traces.append(trace)
+        self.kept += 1
+        if slow:
+            logger.warning("Slow request %s %s: %.1f ms (%s)", trace.method, trace.route, trace.duration * 1000,
+                           ', '.join(f"{name} {seconds * 1000:.1f}" for name, _, seconds in trace.stages))
+        return trace
+
+    def traces(self):
+        """Kept traces, newest first"""
+        return list(reversed(self._traces))
+
+    def get(self, trace_id):
+        return next((t for t in list(self._traces) if t.id == trace_id), None)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow * 1000 if self.slow is not None else None,
+            'python_profile': self.python_profile,
+            'capacity': self.capacity,
+            'traced': self.traced,
+            'kept': self.kept,
+            'buffered': len(self._traces)
+        }
+
+    def dump(self):
+        """Write the buffered traces to ``dump_dir`` as JSON, with a .prof file per Python profile"""
+        traces = self.traces()
+        directory = self.dump_dir / datetime.now().strftime('%Y%m%d-%H%M%S')
+        directory.mkdir(parents=True, exist_ok=True)
+        for trace in traces:
+            if trace.profile_stats is not None:
+                trace.profile_stats.dump_stats(directory / f"trace-{trace.id}.prof")
+        with open(directory / 'traces.json', 'w') as f:
+            json.dump({'settings': self.stats(), 'traces': [t.to_dict(profile=True) for t in traces]}, f, indent=2)
+        logger.info("Dumped %d request traces to %s", len(traces), directory)
+        return directory, len(traces)
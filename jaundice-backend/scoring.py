@@ -0,0 +1,391 @@
+"""
+Offline bulk scoring
+Decodes in a process pool, runs one batched inference loop and writes results incrementally with resumable progress
+"""
+
+import os
+import csv
+import glob
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from pathlib import Path
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from preprocessing import IMG_SIZE, load_uint8, normalize_into, preprocess_signature
+from utils import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+FIELDS = ('path', 'prediction', 'confidence', 'probability_jaundice', 'probability_normal', 'error')
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_DECODE_CHUNK = 16
+DEFAULT_CHECKPOINT_EVERY = 4096
+
+
+# -- inputs ---------------------------------------------------------------------
+
+def _is_image(path):
+    return Path(path).suffix.lower().lstrip('.') in IMAGE_EXTENSIONS
+
+
+def _read_manifest(path):
+    """Image paths listed in a .txt (one per line), .csv (a 'path' column) or .jsonl ({"path": ...}) file"""
+    path = Path(path)
+    base = path.parent
+    with open(path, newline='') as f:
+        if path.suffix == '.csv':
+            entries = [row['path'] for row in csv.DictReader(f)]
+        elif path.suffix in ('.jsonl', '.ndjson'):
+            entries = [json.loads(line)['path'] for line in f if line.strip()]
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return [str(p if Path(p).is_absolute() else base / p) for p in entries]
+
+
+def collect_inputs(source):
+    """Image paths for a directory (recursive), a glob pattern or a manifest file, in a stable order"""
+    if any(ch in str(source) for ch in '*?['):
+        return sorted(p for p in glob.glob(str(source), recursive=True) if _is_image(p))
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(p) for p in source.rglob('*') if p.is_file() and _is_image(p))
+    if source.is_file():
+        if _is_image(source):
+            return [str(source)]
+        return _read_manifest(source)
+    raise FileNotFoundError(f"No such directory, manifest or matching files: {source}")
+
+
+def inputs_fingerprint(paths, *extra):
+    """Identify an input list plus scoring settings, so a resume never mixes two different jobs"""
+    digest = hashlib.blake2b(digest_size=16)
+    for value in (*extra, len(paths)):
+        digest.update(f"{value}\0".encode())
+    for path in paths:
+        digest.update(path.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# -- decoding (pool processes) --------------------------------------------------
+
+def decode_chunk(paths, img_size=IMG_SIZE):
+    """Decode and resize a chunk of images to uint8, with an error message for each failure
+
+    uint8 is a quarter of the float32 size, which keeps the transfer back to
+    the inference process cheap; normalizing happens there, into the batch.
+    """
+    pixels = np.zeros((len(paths), img_size, img_size, 3), dtype=np.uint8)
+    errors = [None] * len(paths)
+    for i, path in enumerate(paths):
+        try:
+            load_uint8(path, img_size, out=pixels[i])
+        except Exception as e:
+            errors[i] = f"{type(e).__name__}: {e}"
+    return pixels, errors
+
+
+def iter_decoded(paths, pool, chunk_size=DEFAULT_DECODE_CHUNK, max_in_flight=8, img_size=IMG_SIZE):
+    """Yield (path, uint8 pixels, error) in input order from pool-decoded chunks
+
+    At most ``max_in_flight`` chunks are queued or decoded at any time, so a
+    slow consumer stalls the decoders instead of piling up decoded images in
+    memory. The wait for each chunk is added to ``stats['decode_wait']``.
+    """
+    stats = {'decode_wait': 0.0}
+    chunks = (paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size))
+    pending = deque()
+
+    def generate():
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(decode_chunk, chunk, img_size)))
+            if len(pending) < max_in_flight:
+                continue
+            yield from take()
+        while pending:
+            yield from take()
+
+    def take():
+        chunk, future = pending.popleft()
+        started = time.perf_counter()
+        pixels, errors = future.result()
+        stats['decode_wait'] += time.perf_counter() - started
+        for path, row, error in zip(chunk, pixels, errors):
+            yield path, row, error
+
+    return generate(), stats
+
+
+# -- writers --------------------------------------------------------------------
+
+class _TextWriter:
+    """Append-only CSV/JSONL output; a checkpoint is the byte offset after the last flushed record"""
+
+    def __init__(self, path, resume_marker=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume_marker is not None and self.path.exists():
+            # Drop records written after the last checkpoint; they are scored again
+            with open(self.path, 'r+b') as f:
+                f.truncate(resume_marker)
+            self.file = open(self.path, 'a', newline='')
+        else:
+            self.file = open(self.path, 'w', newline='')
+            self._start()
+
+    def _start(self):
+        pass
+
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        self.file.close()
+
+
+class CSVWriter(_TextWriter):
+    def _start(self):
+        csv.writer(self.file).writerow(FIELDS)
+
+    def write(self, records):
+        writer = csv.writer(self.file)
+        writer.writerows([record.get(field) for field in FIELDS] for record in records)
+
+
+class JSONLWriter(_TextWriter):
+    def write(self, records):
+        self.file.writelines(json.dumps(record) + '\n' for record in records)
+
+
+class ParquetWriter:
+    """Parquet output as a directory of part files, one per checkpoint
+
+    A Parquet file is only readable once its footer is written, so each
+    checkpoint closes the current part. A killed run leaves at most one
+    unfinished part, which a resume deletes. The directory reads as one
+    table with ``pyarrow.parquet.read_table`` or ``pandas.read_parquet``.
+    """
+
+    def __init__(self, path, resume_marker=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from None
+        self.pa, self.pq = pa, pq
+        self.schema = pa.schema([('path', pa.string()), ('prediction', pa.string()),
+                                 ('confidence', pa.float64()), ('probability_jaundice', pa.float64()),
+                                 ('probability_normal', pa.float64()), ('error', pa.string())])
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self.parts = list(resume_marker or [])
+        for part in self.path.glob('part-*.parquet'):
+            if part.name not in self.parts:
+                part.unlink()
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+    def checkpoint(self):
+        if self.records:
+            name = f"part-{len(self.parts):05d}.parquet"
+            table = self.pa.Table.from_pylist(self.records, schema=self.schema)
+            self.pq.write_table(table, self.path / name)
+            self.parts.append(name)
+            self.records = []
+        return list(self.parts)
+
+    def close(self):
+        pass
+
+
+WRITERS = {'csv': CSVWriter, 'jsonl': JSONLWriter, 'parquet': ParquetWriter}
+
+
+def output_format(path, fmt=None):
+    """Explicit format, or the one the output path's suffix names"""
+    fmt = fmt or Path(path).suffix.lstrip('.').lower()
+    fmt = {'ndjson': 'jsonl'}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"Can't tell the output format of '{path}'. Use --format with one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+# -- progress -------------------------------------------------------------------
+
+def progress_path_for(output):
+    output = Path(output)
+    return output.with_name(output.name + '.progress.json')
+
+
+def read_progress(output):
+    path = progress_path_for(output)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_progress(output, progress):
+    path = progress_path_for(output)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(progress, indent=2))
+    os.replace(tmp, path)
+
+
+# -- scoring --------------------------------------------------------------------
+
+class ThroughputReporter:
+    """Log images/sec overall and over the last interval"""
+
+    def __init__(self, total, interval=10.0):
+        self.total = total
+        self.interval = interval
+        self.started = self._last_time = time.perf_counter()
+        self._last_done = 0
+
+    def update(self, done, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last_time < self.interval:
+            return
+        recent = (done - self._last_done) / max(now - self._last_time, 1e-9)
+        overall = done / max(now - self.started, 1e-9)
+        eta = (self.total - done) / overall if overall else float('inf')
+        logger.info("Scored %d/%d images: %.1f images/sec (last %.0fs: %.1f), ETA %.0fs",
+                    done, self.total, overall, now - self._last_time, recent, eta)
+        self._last_time, self._last_done = now, done
+
+
+def score(paths, engine, threshold, output, fmt=None, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+          decode_chunk=DEFAULT_DECODE_CHUNK, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, restart=False,
+          model_version=None, img_size=IMG_SIZE, pool=None):
+    """Score ``paths`` with ``engine`` into ``output`` and return a summary
+
+    Results are written in input order. Every ``checkpoint_every`` images the
+    output is flushed and the progress file records how many inputs are done
+    and where the output ends; a rerun with the same inputs and settings
+    resumes from there, cutting off anything written after that point.
+    """
+    from model_bundle import postprocess
+
+    fmt = output_format(output, fmt)
+    fingerprint = inputs_fingerprint(paths, threshold, model_version, preprocess_signature(img_size))
+    progress = None if restart else read_progress(output)
+    if progress and progress.get('fingerprint') != fingerprint:
+        raise ValueError(f"{output} holds results for other inputs or settings; use --restart to overwrite it")
+
+    if progress and not Path(output).exists():
+        raise FileNotFoundError(f"{output} is gone but its progress file remains; use --restart to score again")
+
+    done = progress['done'] if progress else 0
+    errors = progress['errors'] if progress else 0
+    if done:
+        logger.info("Resuming after %d of %d images", done, len(paths))
+    writer = WRITERS[fmt](output, progress['marker'] if progress else None)
+
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    own_pool = pool is None
+    if own_pool:
+        # Spawned decoders never inherit the inference runtime's threads or memory
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    batch = np.empty((batch_size, img_size, img_size, 3), dtype=np.float32)
+    batch_paths, batch_errors = [], []
+    reporter = ThroughputReporter(len(paths))
+    inference_seconds = 0.0
+    started = time.perf_counter()
+    since_checkpoint = 0
+
+    def flush():
+        nonlocal inference_seconds
+        count = len(batch_paths)
+        ok = [i for i, error in enumerate(batch_errors) if error is None]
+        probs = np.zeros(count, dtype=np.float32)
+        if ok:
+            t0 = time.perf_counter()
+            # Failed decodes are left in the buffer as zeros and their scores dropped
+            probs = engine.predict(batch[:count])
+            inference_seconds += time.perf_counter() - t0
+        records = postprocess(probs, threshold)
+        for i, (path, error) in enumerate(zip(batch_paths, batch_errors)):
+            if error is None:
+                records[i] = {'path': path, **records[i], 'error': None}
+            else:
+                records[i] = {'path': path, 'prediction': None, 'confidence': None,
+                              'probability_jaundice': None, 'probability_normal': None, 'error': error}
+        writer.write(records)
+        batch_paths.clear()
+        batch_errors.clear()
+        return count
+
+    def checkpoint():
+        write_progress(output, {
+            'fingerprint': fingerprint,
+            'inputs': len(paths),
+            'done': done,
+            'errors': errors,
+            'marker': writer.checkpoint(),
+            'format': fmt,
+            'model_version': model_version,
+            'threshold': threshold,
+            'updated_at': datetime.now().isoformat()
+        })
+
+    try:
+        decoded, decode_stats = iter_decoded(paths[done:], pool, decode_chunk, max_in_flight=2 * workers,
+                                             img_size=img_size)
+        for path, pixels, error in decoded:
+            slot = len(batch_paths)
+            if error is None:
+                normalize_into(pixels, batch[slot])
+            else:
+                batch[slot] = 0.0
+                errors += 1
+            batch_paths.append(path)
+            batch_errors.append(error)
+            if len(batch_paths) == batch_size:
+                done += flush()
+                since_checkpoint += batch_size
+                if since_checkpoint >= checkpoint_every:
+                    checkpoint()
+                    since_checkpoint = 0
+                reporter.update(done)
+        if batch_paths:
+            done += flush()
+        checkpoint()
+        reporter.update(done, force=True)
+    finally:
+        writer.close()
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+
+    seconds = time.perf_counter() - started
+    scored = done - (progress['done'] if progress else 0)
+    summary = {
+        'images': len(paths),
+        'scored': scored,
+        'resumed_from': progress['done'] if progress else 0,
+        'errors': errors,
+        'seconds': seconds,
+        'images_per_sec': scored / seconds if seconds else 0.0,
+        'inference_seconds': inference_seconds,
+        'decode_wait_seconds': decode_stats['decode_wait'],
+        'output': str(output),
+        'format': fmt
+    }
+    logger.info("Scored %d images in %.1fs (%.1f images/sec); inference %.1fs, waiting on decode %.1fs, %d errors",
+                scored, seconds, summary['images_per_sec'], inference_seconds, decode_stats['decode_wait'], errors)
+    return summary
@@ -0,0 +1,90 @@
+"""
+Incremental multipart parsing for streaming batch predictions
+Yields each uploaded file as soon as its part has been fully received
+"""
+
+import json
+import logging
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class MultipartFileParser:
+    """Feed raw request-body chunks in, get complete (filename, data) uploads out
+
+    Only one file's bytes are held at a time, so memory stays bounded by the
+    largest single upload rather than the whole request. Non-file fields and
+    files under other field names are skipped.
+    """
+
+    def __init__(self, boundary, field='files', max_file_size=None):
+        if isinstance(boundary, str):
+            boundary = boundary.encode('latin-1')
+        self.field = field
+        self.max_file_size = max_file_size
+        self._decoder = MultipartDecoder(boundary)
+        self._current = None  # filename of the file part being received
+        self._buffer = bytearray()
+        self._finished = False
+
+    def _drain(self):
+        uploads = []
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, NeedData):
+                break
+            if isinstance(event, Epilogue):
+                self._finished = True
+                break
+
+            if isinstance(event, File):
+                self._current = event.filename if event.name == self.field else None
+                self._buffer = bytearray()
+            elif isinstance(event, Field):
+                self._current = None
+            elif isinstance(event, Data) and self._current is not None:
+                self._buffer += event.data
+                if self.max_file_size and len(self._buffer) > self.max_file_size:
+                    raise ValueError(f"File {self._current} exceeds {self.max_file_size} bytes")
+                if not event.more_data:
+                    uploads.append((self._current, bytes(self._buffer)))
+                    self._current = None
+                    self._buffer = bytearray()
+        return uploads
+
+    def feed(self, chunk):
+        """Add a chunk of the request body and return uploads completed by it"""
+        if self._finished or not chunk:
+            return []
+        self._decoder.receive_data(chunk)
+        return self._drain()
+
+    def close(self):
+        """Signal the end of the body and return any remaining uploads"""
+        if self._finished:
+            return []
+        self._decoder.receive_data(None)
+        uploads = self._drain()
+        self._finished = True
+        return uploads
+
+
+def iter_uploads(read, boundary, field='files', chunk_size=READ_CHUNK_SIZE, max_file_size=None):
+    """Yield (filename, data) for each file while reading a body with ``read(n)``"""
+    parser = MultipartFileParser(boundary, field, max_file_size)
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def ndjson_line(record):
+    """Serialize one record as a newline-terminated JSON line"""
+    return json.dumps(record) + '\n'
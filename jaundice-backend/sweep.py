@@ -0,0 +1,391 @@
+"""
+Parallel hyperparameter sweep
+Trials run in a pinned process pool; ASHA (asynchronous successive halving) stops the weak ones early
+"""
+
+import csv
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import traceback
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import train_model as tm
+import distributed
+import dataset_cache
+from checkpointing import load_training_state
+from data_pipeline import as_input
+from model_bundle import write_bundle
+from preprocessing import preprocess_signature
+
+logger = logging.getLogger(__name__)
+
+SWEEPS_PATH = tm.BASE_PATH / "sweeps"
+
+# name: ('choice', [values]) | ('uniform', low, high) | ('log_uniform', low, high) | ('int', low, high)
+SEARCH_SPACE = {
+    'batch_size': ('choice', [16, 32, 64]),
+    'base_lr': ('log_uniform', 2e-5, 1e-3),
+    'fine_tune_lr': ('log_uniform', 1e-6, 1e-4),
+    'epochs_phase1': ('choice', [10, 20, 30]),
+    'epochs_phase2': ('choice', [10, 20, 30]),
+    'unfreeze_layers': ('choice', [20, 40, 60, 90]),
+    'dropout1': ('uniform', 0.2, 0.6),
+    'dropout2': ('uniform', 0.1, 0.5),
+}
+
+# What the unswept parameters fall back to: the hand-tuned train_model.py constants
+DEFAULTS = {
+    'batch_size': tm.BATCH_SIZE,
+    'base_lr': tm.BASE_LR,
+    'fine_tune_lr': tm.FINE_TUNE_LR,
+    'epochs_phase1': tm.EPOCHS_PHASE1,
+    'epochs_phase2': tm.EPOCHS_PHASE2,
+    'unfreeze_layers': tm.UNFREEZE_LAYERS,
+    'dropout1': tm.DROPOUT_RATES[0],
+    'dropout2': tm.DROPOUT_RATES[1],
+}
+
+
+def sample_config(space, rng):
+    """One random configuration from ``space``, with DEFAULTS for anything it doesn't cover"""
+    config = dict(DEFAULTS)
+    for name, (kind, *args) in space.items():
+        if kind == 'choice':
+            value = args[0][rng.integers(len(args[0]))]
+        elif kind == 'uniform':
+            value = rng.uniform(*args)
+        elif kind == 'log_uniform':
+            value = math.exp(rng.uniform(math.log(args[0]), math.log(args[1])))
+        elif kind == 'int':
+            value = rng.integers(args[0], args[1] + 1)
+        else:
+            raise ValueError(f"Unknown search space kind '{kind}' for {name}")
+        config[name] = value.item() if isinstance(value, np.generic) else value
+    return config
+
+
+def max_total_epochs(space):
+    """The longest schedule (phase 1 + phase 2 epochs) any configuration can have"""
+    def highest(name):
+        if name not in space:
+            return DEFAULTS[name]
+        kind, *args = space[name]
+        return max(args[0]) if kind == 'choice' else int(args[1])
+    return highest('epochs_phase1') + highest('epochs_phase2')
+
+
+def rung_budgets(min_epochs, max_epochs, eta):
+    """Epoch budgets of the successive-halving rungs: min_epochs * eta**k, ending at max_epochs
+
+    A last rung barely below max_epochs is merged into it rather than kept as an extra stop.
+    """
+    budgets = [min(min_epochs, max_epochs)]
+    while budgets[-1] * eta < max_epochs:
+        budgets.append(budgets[-1] * eta)
+    if max_epochs / budgets[-1] < math.sqrt(eta) and len(budgets) > 1:
+        budgets[-1] = max_epochs
+    elif budgets[-1] < max_epochs:
+        budgets.append(max_epochs)
+    return budgets
+
+
+class ASHA:
+    """Asynchronous successive halving (Li et al., 2018)
+
+    A trial that finished rung k is promoted to rung k+1 as soon as it is in
+    the top 1/eta of everything that has reported at rung k so far. When no
+    trial can be promoted, a new one starts at rung 0. Nothing waits for a
+    rung to fill up, so every worker stays busy. Once every trial has started
+    and nothing is running, the best paused trial of the highest rung is
+    trained to completion, so the sweep always ends with a finished winner.
+    """
+
+    def __init__(self, space, num_trials, budgets, eta=3, seed=0):
+        self.space = space
+        self.num_trials = num_trials
+        self.budgets = budgets
+        self.eta = eta
+        self.rng = np.random.default_rng(seed)
+        self.trials = {}
+        self.finalist = None
+
+    def _promotable(self, rung):
+        reported = [t for t in self.trials.values() if rung in t['results']]
+        reported.sort(key=lambda t: t['results'][rung]['val_loss'])
+        top = reported[:len(reported) // self.eta]
+        return [t for t in top if t['status'] == 'paused' and t['rung'] == rung]
+
+    def next_job(self):
+        """(trial, rung) to run next, or None if everything left depends on running jobs"""
+        for rung in reversed(range(len(self.budgets) - 1)):
+            candidates = self._promotable(rung)
+            if candidates:
+                trial = candidates[0]
+                trial['status'] = 'running'
+                trial['rung'] = rung + 1
+                return trial, rung + 1
+
+        if len(self.trials) < self.num_trials:
+            trial_id = f"trial-{len(self.trials):03d}"
+            trial = {'id': trial_id, 'config': sample_config(self.space, self.rng), 'status': 'running',
+                     'rung': 0, 'results': {}, 'seconds': 0.0}
+            self.trials[trial_id] = trial
+            return trial, 0
+
+        if any(t['status'] == 'running' for t in self.trials.values()):
+            return None
+        if self.finalist is None:
+            paused = [t for t in self.trials.values() if t['status'] == 'paused']
+            if not paused:
+                return None
+            self.finalist = min(paused, key=lambda t: (-t['rung'], t['results'][t['rung']]['val_loss']))
+        trial = self.finalist
+        if trial['status'] != 'paused':
+            return None
+        trial['status'] = 'running'
+        trial['rung'] += 1
+        return trial, trial['rung']
+
+    def report(self, trial_id, rung, result):
+        trial = self.trials[trial_id]
+        trial['results'][rung] = result
+        trial['seconds'] += result['seconds']
+        trial['status'] = 'completed' if result['completed'] else 'paused'
+
+    def fail(self, trial_id, error):
+        self.trials[trial_id]['status'] = 'failed'
+        self.trials[trial_id]['error'] = error
+
+    def finish(self):
+        """Trials still paused when the sweep ends were stopped early"""
+        for trial in self.trials.values():
+            if trial['status'] == 'paused':
+                trial['status'] = 'pruned'
+
+
+def run_trial(job):
+    """Train one trial up to its rung's epoch budget in this (pool) process
+
+    Runs from the trial's checkpoint when it was promoted from a lower rung,
+    so a promotion only pays for the extra epochs.
+    """
+    started = time.perf_counter()
+    trial_dir = Path(job['trial_dir'])
+    trial_dir.mkdir(parents=True, exist_ok=True)
+    if job['cpus']:
+        distributed.pin_to(job['cpus'])
+
+    # Keras progress bars and log lines of concurrent trials would interleave on the console
+    with open(trial_dir / 'train.log', 'a') as log, redirect_stdout(log), redirect_stderr(log):
+        # Console handlers only: FileHandler subclasses StreamHandler but must keep its file
+        handlers = [h for h in logging.getLogger().handlers if type(h) is logging.StreamHandler]
+        streams = [h.setStream(log) for h in handlers]
+        try:
+            return _train_trial(job, trial_dir, started)
+        finally:
+            for handler, stream in zip(handlers, streams):
+                handler.setStream(stream)
+
+
+def _train_trial(job, trial_dir, started):
+    config = job['config']
+    checkpoint_dir = trial_dir / 'checkpoints'
+    logger.info(f"{job['trial_id']} rung {job['rung']}: up to epoch {job['budget']} with {config}")
+
+    tm.keras.backend.clear_session()
+    tm.configure_precision(job['mixed_precision'])
+    train_data, val_data, test_data = tm.load_data(job['pipeline'], batch_size=config['batch_size'])
+    model, base_model = tm.build_model(job['jit_compile'], config['base_lr'], (config['dropout1'], config['dropout2']))
+    _, _, throughput = tm.train_model(
+        model, base_model, train_data, val_data,
+        jit_compile=job['jit_compile'],
+        checkpoint_dir=checkpoint_dir,
+        resume=job['rung'] > 0,
+        settings=config,
+        epochs=(config['epochs_phase1'], config['epochs_phase2']),
+        learning_rate=config['base_lr'],
+        fine_tune_lr=config['fine_tune_lr'],
+        unfreeze_layers=config['unfreeze_layers'],
+        max_epochs=job['budget'],
+        output_dir=trial_dir
+    )
+
+    val = model.evaluate(as_input(val_data), return_dict=True, verbose=0)
+    state = load_training_state(checkpoint_dir)
+    result = {
+        'trial_id': job['trial_id'],
+        'rung': job['rung'],
+        'budget': job['budget'],
+        'val_loss': float(val['loss']),
+        'val_accuracy': float(val['accuracy']),
+        'completed': bool(state and state['phase'] > 2),
+        'images_per_sec': throughput.summary().get('mean_images_per_sec')
+    }
+
+    if result['completed']:
+        metrics = tm.evaluate_model(model, test_data)
+        model_file = trial_dir / 'model.h5'
+        model.save(model_file)
+        write_bundle(model_file, metrics['threshold'], metrics, tm.IMG_SIZE, preprocess_signature(tm.IMG_SIZE))
+        result['test'] = {k: metrics[k] for k in ('accuracy', 'precision', 'recall', 'f1_score', 'threshold')}
+
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def leaderboard(scheduler):
+    """Trials ranked best first: finished ones by validation loss, then the rest by how far they got"""
+    rows = []
+    for trial in scheduler.trials.values():
+        last = trial['results'][max(trial['results'])] if trial['results'] else {}
+        rows.append({
+            'trial': trial['id'],
+            'status': trial['status'],
+            'rung': max(trial['results']) if trial['results'] else None,
+            'epochs': last.get('budget'),
+            'val_loss': last.get('val_loss'),
+            'val_accuracy': last.get('val_accuracy'),
+            **{f"test_{k}": v for k, v in last.get('test', {}).items()},
+            'seconds': round(trial['seconds'], 1),
+            'images_per_sec': last.get('images_per_sec'),
+            **trial['config'],
+            'error': trial.get('error')
+        })
+
+    def rank(row):
+        finished = row['status'] == 'completed'
+        loss = row['val_loss'] if row['val_loss'] is not None else math.inf
+        return (not finished, -(row['rung'] if row['rung'] is not None else -1), loss)
+    return sorted(rows, key=rank)
+
+
+def write_leaderboard(sweep_dir, scheduler):
+    rows = leaderboard(scheduler)
+    with open(sweep_dir / 'leaderboard.json', 'w') as f:
+        json.dump(rows, f, indent=2)
+
+    fields = []
+    for row in rows:
+        fields += [k for k in row if k not in fields]
+    with open(sweep_dir / 'leaderboard.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def run_sweep(sweep_dir, space=SEARCH_SPACE, num_trials=16, parallel=4, eta=3, min_epochs=2, seed=0,
+              pipeline='cached', mixed_precision=False, jit_compile=False, pin=True):
+    """Run the sweep and return its leaderboard"""
+    sweep_dir = Path(sweep_dir)
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    budgets = rung_budgets(min_epochs, max_total_epochs(space), eta)
+    scheduler = ASHA(space, num_trials, budgets, eta, seed)
+
+    with open(sweep_dir / 'sweep.json', 'w') as f:
+        json.dump({'space': space, 'num_trials': num_trials, 'parallel': parallel, 'eta': eta,
+                   'budgets': budgets, 'seed': seed, 'pipeline': pipeline, 'mixed_precision': mixed_precision,
+                   'jit_compile': jit_compile, 'started_at': datetime.now().isoformat()}, f, indent=2)
+    logger.info(f"Sweep {sweep_dir.name}: {num_trials} trials, {parallel} at a time, rung budgets {budgets} epochs")
+
+    if pipeline == 'cached':
+        # Decode once up front; every trial then reads the same memory-mapped arrays
+        for split in dataset_cache.SPLITS:
+            dataset_cache.build_split_cache(tm.DATASET_PATH, split, img_size=tm.IMG_SIZE)
+
+    free_slots = distributed.cpu_chunks(parallel) if pin else [None] * parallel
+    # A fresh interpreter per job, so TF's thread pools are sized for the job's CPU slot
+    pool_options = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {}
+    running = {}
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=multiprocessing.get_context('spawn'),
+                             **pool_options) as pool, open(sweep_dir / 'results.jsonl', 'a') as results_log:
+        while True:
+            while free_slots:
+                job = scheduler.next_job()
+                if job is None:
+                    break
+                trial, rung = job
+                cpus = free_slots.pop()
+                future = pool.submit(run_trial, {
+                    'trial_id': trial['id'], 'config': trial['config'], 'rung': rung, 'budget': budgets[rung],
+                    'trial_dir': str(sweep_dir / trial['id']), 'cpus': cpus, 'pipeline': pipeline,
+                    'mixed_precision': mixed_precision, 'jit_compile': jit_compile
+                })
+                running[future] = (trial['id'], rung, cpus)
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial_id, rung, cpus = running.pop(future)
+                free_slots.append(cpus)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"{trial_id} failed at rung {rung}: {e}")
+                    scheduler.fail(trial_id, ''.join(traceback.format_exception_only(type(e), e)).strip())
+                    continue
+                scheduler.report(trial_id, rung, result)
+                results_log.write(json.dumps(result) + "\n")
+                results_log.flush()
+                logger.info(f"{trial_id} rung {rung} ({result['budget']} epochs): val_loss {result['val_loss']:.4f}, "
+                            f"val_accuracy {result['val_accuracy']:.4f}, {result['seconds']:.0f}s"
+                            + (" [completed]" if result['completed'] else ""))
+            write_leaderboard(sweep_dir, scheduler)
+
+    scheduler.finish()
+    rows = write_leaderboard(sweep_dir, scheduler)
+    logger.info(f"Sweep finished in {time.perf_counter() - started:.0f}s; leaderboard in {sweep_dir / 'leaderboard.csv'}")
+    for row in rows[:5]:
+        logger.info(f"  {row['trial']} {row['status']:>9} rung {row['rung']} val_loss {row['val_loss']} "
+                    f"test_f1 {row.get('test_f1_score')}")
+    return rows
+
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Parallel hyperparameter sweep over train_model.py")
+    parser.add_argument("--trials", type=int, default=16, help="Number of configurations to try")
+    parser.add_argument("--parallel", type=int, default=4, help="Trials trained at the same time")
+    parser.add_argument("--eta", type=int, default=3, help="Keep the top 1/eta of each rung")
+    parser.add_argument("--min-epochs", type=int, default=2, help="Epoch budget of the first rung")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for sampling configurations")
+    parser.add_argument("--space", type=Path, help="JSON search space replacing the built-in one")
+    parser.add_argument("--name", help="Sweep directory name under sweeps/ (default: a timestamp)")
+    parser.add_argument("--pipeline", choices=["cached", "tfdata"], default="cached", help="Training input pipeline")
+    parser.add_argument("--mixed-precision", action="store_true", help="Train every trial with mixed_bfloat16")
+    parser.add_argument("--jit-compile", action="store_true", help="XLA-compile every trial's train/eval steps")
+    parser.add_argument("--no-pin", action="store_true", help="Don't pin trials to separate CPU sets")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, prog=None):
+    args = parse_args(argv, prog)
+    space = SEARCH_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = {name: tuple(spec) for name, spec in json.load(f).items()}
+    unknown = set(space) - set(DEFAULTS)
+    if unknown:
+        raise SystemExit(f"Unknown hyperparameters in search space: {', '.join(sorted(unknown))}")
+
+    sweep_dir = SWEEPS_PATH / (args.name or datetime.now().strftime("%Y%m%d-%H%M%S"))
+    run_sweep(sweep_dir, space, args.trials, args.parallel, args.eta, args.min_epochs, args.seed,
+              args.pipeline, args.mixed_precision, args.jit_compile, pin=not args.no_pin)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
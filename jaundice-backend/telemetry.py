@@ -0,0 +1,227 @@
+"""
+Serving metrics in the Prometheus text format
+Counters and histograms are sharded per thread, so recording never takes a lock; a scrape sums the shards
+"""
+
+import os
+import math
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def resident_memory_bytes():
+    """Current RSS of this process from /proc, or None where that isn't available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """Holds the metric definitions and every thread's shard of their values
+
+    Each thread writes only to its own dict, so updates are plain dict and
+    list operations. Scrapes copy the shards under a lock that recording
+    never touches, and fold the shards of threads that have exited into a
+    retired total so per-connection threads don't pile up.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (thread, values)
+        self._retired = {}
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, labelnames=()):
+        return self.register(Counter(self, name, description, labelnames))
+
+    def histogram(self, name, description, labelnames=(), buckets=REQUEST_BUCKETS):
+        return self.register(Histogram(self, name, description, labelnames, buckets))
+
+    def level(self, name, description, labelnames=()):
+        return self.register(Level(self, name, description, labelnames))
+
+    def gauge(self, name, description, labelnames=(), function=None):
+        return self.register(Gauge(name, description, labelnames, function))
+
+    def _merge(self, into, values):
+        for key, value in values.items():
+            if isinstance(value, list):
+                total = into.get(key)
+                if total is None:
+                    into[key] = list(value)
+                else:
+                    for i, v in enumerate(value):
+                        total[i] += v
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def collect(self):
+        """All sharded values summed, keyed by (metric name, label values)"""
+        with self._lock:
+            alive = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    self._merge(self._retired, values)
+            self._shards = alive
+
+            totals = {}
+            self._merge(totals, self._retired)
+            for _, values in alive:
+                self._merge(totals, values.copy())
+        return totals
+
+    def render(self):
+        """The exposition text for a /metrics response"""
+        totals = self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples(totals))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    """Monotonic count, optionally per label values"""
+
+    type = 'counter'
+
+    def __init__(self, registry, name, description, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labels, amount=1):
+        values = self.registry._shard()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def value(self, *labels, totals=None):
+        totals = totals if totals is not None else self.registry.collect()
+        return totals.get((self.name, labels), 0)
+
+    def samples(self, totals):
+        for (name, labels), value in sorted(totals.items()):
+            if name == self.name:
+                yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Level(Counter):
+    """Sharded gauge that threads move up and down, such as requests in flight
+
+    A thread may end on a different value than it started (work handed
+    between threads); only the sum across shards is meaningful.
+    """
+
+    type = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    """Bucketed observations (seconds) with their sum and count"""
+
+    type = 'histogram'
+
+    def __init__(self, registry, name, description, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        values = self.registry._shard()
+        key = (self.name, labels)
+        counts = values.get(key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then sum and count
+            counts = values[key] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def samples(self, totals):
+        for (name, labels), counts in sorted(totals.items()):
+            if name != self.name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                label_text = _format_labels(self.labelnames, labels, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket{label_text} {cumulative}'
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum{label_text} {_format_value(counts[-2])}'
+            yield f'{self.name}_count{label_text} {counts[-1]}'
+
+
+class Gauge:
+    """A value that is set directly, or read from ``function`` at scrape time
+
+    ``function`` returns a number, None (no sample), or a dict of label
+    tuples to numbers for labelled gauges.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, description, labelnames=(), function=None):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def samples(self, totals):
+        if self.function is not None:
+            value = self.function()
+            values = value if isinstance(value, dict) else {(): value}
+        else:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
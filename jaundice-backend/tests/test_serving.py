@@ -0,0 +1,203 @@
+"""
+Tests for the serving and training helpers
+Run from jaundice-backend/ with: python -m pytest tests
+"""
+
+import sys
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+BACKEND_PATH = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_PATH))
+
+from batching import MicroBatcher
+from cache import PredictionCache, SQLiteCache, content_key
+from thresholds import select_threshold, threshold_curve
+
+
+# ==========================================
+# THRESHOLD CURVE
+# ==========================================
+def brute_force_counts(labels, probs, threshold):
+    predicted = probs >= threshold
+    return int(np.sum(predicted & (labels == 1))), int(np.sum(predicted & (labels == 0)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_threshold_curve_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    size = int(rng.integers(1, 60))
+    labels = rng.integers(0, 2, size)
+    probs = rng.integers(0, 11, size) / 10  # plenty of ties
+
+    curve = threshold_curve(labels, probs)
+
+    assert list(curve['thresholds']) == sorted(curve['thresholds'], reverse=True)
+    assert len(curve['thresholds']) == len(np.unique(probs)) + 1
+    for index, threshold in enumerate(curve['thresholds']):
+        tp, fp = brute_force_counts(labels, probs, threshold)
+        assert (curve['tp'][index], curve['fp'][index]) == (tp, fp)
+        assert curve['fn'][index] == labels.sum() - tp
+        assert curve['tn'][index] == (labels == 0).sum() - fp
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_cost_objective_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 2, 40)
+    probs = rng.random(40)
+
+    curve = threshold_curve(labels, probs)
+    best = select_threshold(curve, 'cost', fp_cost=2.0, fn_cost=1.0)
+
+    candidates = np.r_[np.inf, np.unique(probs)]
+    costs = []
+    for threshold in candidates:
+        tp, fp = brute_force_counts(labels, probs, threshold)
+        costs.append(2.0 * fp + (labels.sum() - tp))
+    assert 2.0 * curve['fp'][best] + curve['fn'][best] == min(costs)
+
+
+def test_threshold_curve_can_flag_nothing():
+    curve = threshold_curve([0, 0, 0], [0.2, 0.6, 0.4])
+    best = select_threshold(curve, 'cost')
+
+    assert curve['thresholds'][best] > 0.6
+    assert curve['fp'][best] == 0
+
+
+# ==========================================
+# PREDICTION CACHES
+# ==========================================
+@pytest.fixture(params=['memory', 'sqlite'])
+def prediction_cache(request, tmp_path):
+    if request.param == 'memory':
+        return PredictionCache(max_entries=3)
+    cache = SQLiteCache(tmp_path / 'cache.sqlite3', max_entries=3)
+    cache.ACCESS_RESOLUTION_SECONDS = 0  # record every hit, so LRU order is exact
+    return cache
+
+
+def test_cache_round_trip(prediction_cache):
+    key = content_key(b'image bytes', 'v1')
+    value = {'prediction': 'jaundice', 'confidence': 0.91}
+
+    assert prediction_cache.get(key) is None
+    prediction_cache.put(key, value)
+
+    assert prediction_cache.get(key) == value
+    assert prediction_cache.get(content_key(b'image bytes', 'v2')) is None
+    stats = prediction_cache.get_stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+def test_cache_evicts_least_recently_used(prediction_cache):
+    for name in ('a', 'b', 'c'):
+        prediction_cache.put(name, {'name': name})
+    prediction_cache.get('a')
+    prediction_cache.put('d', {'name': 'd'})
+
+    assert prediction_cache.get('a') == {'name': 'a'}
+    assert prediction_cache.get('d') == {'name': 'd'}
+    assert prediction_cache.get_stats()['evictions'] == 1
+
+    prediction_cache.clear()
+    assert prediction_cache.get('a') is None
+
+
+def test_sqlite_cache_shares_entries_and_stores_bytes(tmp_path):
+    path = tmp_path / 'cache.sqlite3'
+    writer = SQLiteCache(path, namespace='tensors', codec='bytes')
+    reader = SQLiteCache(path, namespace='tensors', codec='bytes')
+
+    tensor = np.arange(12, dtype=np.float32)
+    writer.put('tensor', tensor.tobytes())
+
+    assert np.array_equal(np.frombuffer(reader.get('tensor'), dtype=np.float32), tensor)
+
+
+# ==========================================
+# MICRO-BATCHER
+# ==========================================
+def test_micro_batcher_returns_each_caller_its_own_result():
+    batch_sizes = []
+
+    def predict(images):
+        batch_sizes.append(len(images))
+        return images[:, 0, 0, 0] / 100
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=50, submit_timeout=10)
+    results = {}
+
+    def submit(value):
+        results[value] = batcher.submit(np.full((1, 2, 2, 3), value, dtype=np.float32))
+
+    threads = [threading.Thread(target=submit, args=(value,)) for value in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {value: pytest.approx(value / 100) for value in range(10)}
+    assert sum(batch_sizes) == 10 and max(batch_sizes) <= 4
+
+
+def test_micro_batcher_raises_batch_errors_to_callers():
+    def predict(images):
+        raise ValueError('bad batch')
+
+    batcher = MicroBatcher(predict, max_wait_ms=0, submit_timeout=10)
+
+    with pytest.raises(ValueError, match='bad batch'):
+        batcher.submit(np.zeros((1, 2, 2, 3), dtype=np.float32))
+
+
+def test_micro_batcher_submit_times_out():
+    release = threading.Event()
+
+    def predict(images):
+        release.wait(5)
+        return np.zeros(len(images))
+
+    batcher = MicroBatcher(predict, max_wait_ms=0)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.submit(np.zeros((1, 2, 2, 3), dtype=np.float32), timeout=0.05)
+    finally:
+        release.set()
+    assert batcher.get_stats()['timeouts'] == 1
+
+
+# ==========================================
+# ONNX PARITY
+# ==========================================
+def test_onnx_matches_keras_on_test_split(tmp_path, monkeypatch):
+    pytest.importorskip('tensorflow')
+    pytest.importorskip('tf2onnx')
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+
+    from export_model import ONNX_PARITY_TOLERANCE, export_onnx_and_check
+    from model_bundle import bundle_path_for
+
+    model_path = BACKEND_PATH / 'models' / 'jaundice_detection_model.h5'
+    dataset_path = BACKEND_PATH.parent / 'datasets'
+    if not model_path.exists() or not (dataset_path / 'test').exists():
+        pytest.skip('needs a trained model and the dataset test split')
+
+    # Export into a scratch copy so the test leaves models/ untouched
+    monkeypatch.delenv('MODEL_BUNDLE_PATH', raising=False)
+    scratch_model = tmp_path / model_path.name
+    shutil.copy(model_path, scratch_model)
+    if bundle_path_for(model_path).exists():
+        shutil.copy(bundle_path_for(model_path), bundle_path_for(scratch_model))
+
+    report = export_onnx_and_check(scratch_model, dataset_path)
+
+    for name, variant in report['variants'].items():
+        assert variant['max_abs_diff'] <= ONNX_PARITY_TOLERANCE, name
+    assert report['parity_ok']
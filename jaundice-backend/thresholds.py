@@ -0,0 +1,110 @@
+"""
+Decision-threshold optimization
+Precision/recall/F1/ROC for every candidate threshold in one sorted, cumulative-sum pass
+"""
+
+import numpy as np
+
+OBJECTIVES = ('f1', 'youden', 'recall_at_precision', 'cost')
+
+
+def threshold_curve(true_labels, probs):
+    """Confusion counts and metrics at every distinct score, predicting positive when prob >= threshold
+
+    O(n log n) for the sort, then O(n): thresholds are the distinct scores in
+    descending order, and the counts at each come from cumulative sums. The
+    first point sits just above the highest score and flags nothing (like
+    roc_curve's ``inf``), so an objective can prefer no positives at all.
+    """
+    true_labels = np.asarray(true_labels).astype(np.int64).ravel()
+    probs = np.asarray(probs, dtype=np.float64).ravel()
+    if true_labels.shape != probs.shape:
+        raise ValueError("true_labels and probs must have the same length")
+
+    order = np.argsort(probs, kind='mergesort')[::-1]
+    sorted_probs = probs[order]
+    sorted_labels = true_labels[order]
+
+    # Last position of each run of equal scores, after a leading point with nothing flagged
+    cut = np.r_[np.flatnonzero(np.diff(sorted_probs)), len(sorted_probs) - 1]
+    tp = np.r_[0, np.cumsum(sorted_labels)[cut]]
+    fp = np.r_[0, (cut + 1) - tp[1:]]
+    top = sorted_probs[0] if len(sorted_probs) else 1.0
+    thresholds = np.r_[np.nextafter(top, np.inf), sorted_probs[cut]]
+
+    positives = int(true_labels.sum())
+    negatives = len(true_labels) - positives
+    fn = positives - tp
+    tn = negatives - fp
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        recall = np.where(positives > 0, tp / max(positives, 1), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        fpr = np.where(negatives > 0, fp / max(negatives, 1), 0.0)
+
+    return {
+        'thresholds': thresholds,
+        'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'fpr': fpr,
+        'youden': recall - fpr,
+        'accuracy': (tp + tn) / max(len(true_labels), 1)
+    }
+
+
+def select_threshold(curve, objective='f1', min_precision=0.9, fp_cost=1.0, fn_cost=1.0):
+    """Index of the best threshold on a curve for the given objective
+
+    - ``f1``: highest F1
+    - ``youden``: highest TPR - FPR (Youden's J)
+    - ``recall_at_precision``: highest recall with precision >= ``min_precision``
+      (falls back to the most precise threshold if none qualifies)
+    - ``cost``: lowest ``fp_cost * FP + fn_cost * FN``
+
+    Ties go to the highest threshold.
+    """
+    if objective == 'f1':
+        return int(np.argmax(curve['f1']))
+    if objective == 'youden':
+        return int(np.argmax(curve['youden']))
+    if objective == 'recall_at_precision':
+        eligible = np.flatnonzero(curve['precision'] >= min_precision)
+        if not len(eligible):
+            return int(np.argmax(curve['precision']))
+        return int(eligible[np.argmax(curve['recall'][eligible])])
+    if objective == 'cost':
+        return int(np.argmin(fp_cost * curve['fp'] + fn_cost * curve['fn']))
+    raise ValueError(f"Unknown threshold objective '{objective}'. Choose from: {', '.join(OBJECTIVES)}")
+
+
+def curve_summary(curve, max_points=500, keep=None):
+    """JSON-ready copy of the curve, evenly thinned to at most ``max_points`` (always keeping ``keep``)"""
+    count = len(curve['thresholds'])
+    if count > max_points:
+        index = np.unique(np.r_[np.linspace(0, count - 1, max_points).round().astype(int),
+                                [] if keep is None else [keep]])
+    else:
+        index = np.arange(count)
+    keys = ('thresholds', 'precision', 'recall', 'f1', 'fpr', 'tp', 'fp', 'fn', 'tn')
+    return {key: curve[key][index].tolist() for key in keys}
+
+
+def optimize_threshold(true_labels, probs, objective='f1', max_points=500, **options):
+    """Pick a threshold and report its metrics along with the (thinned) full curve"""
+    curve = threshold_curve(true_labels, probs)
+    best = select_threshold(curve, objective, **options)
+    return {
+        'threshold': float(curve['thresholds'][best]),
+        'objective': objective,
+        'options': options,
+        'accuracy': float(curve['accuracy'][best]),
+        'precision': float(curve['precision'][best]),
+        'recall': float(curve['recall'][best]),
+        'f1_score': float(curve['f1'][best]),
+        'confusion_matrix': [[int(curve['tn'][best]), int(curve['fp'][best])],
+                             [int(curve['fn'][best]), int(curve['tp'][best])]],
+        'curve': curve_summary(curve, max_points, keep=best)
+    }
@@ -5,15 +5,14 @@ Author: Bhuvan A
 """
 
 import os
+import sys
 import json
+import shutil
 import logging
+import argparse
 from pathlib import Path
 from datetime import datetime
 import numpy as np
-from sklearn.metrics import (
-    accuracy_score, precision_score, recall_score, f1_score,
-    confusion_matrix, roc_curve
-)
 from sklearn.utils.class_weight import compute_class_weight
 import tensorflow as tf
 from tensorflow import keras
@@ -22,6 +21,14 @@ from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.optimizers import Adam
 
+from data_pipeline import DatasetSplit, ThroughputLogger, as_input, cache_spec, load_cached_split, load_split
+import feature_cache
+from thresholds import OBJECTIVES, optimize_threshold
+from checkpointing import TrainingCheckpoint, checkpoint_weights, load_training_state
+import distributed
+from model_bundle import configured_bundle_path, write_bundle
+from preprocessing import preprocess_signature
+
 # ==========================================
 # CONFIGURATION
 # ==========================================
@@ -31,24 +38,81 @@ EPOCHS_PHASE1 = 30
 EPOCHS_PHASE2 = 30
 BASE_LR = 1e-4
 FINE_TUNE_LR = 1e-5
+UNFREEZE_LAYERS = 60            # MobileNetV2 layers trained in phase 2, counted from the top
+DROPOUT_RATES = (0.5, 0.3)      # after the 256- and 128-unit Dense layers
 
 BASE_PATH = Path(__file__).parent.parent
 DATASET_PATH = BASE_PATH / "datasets"
 MODEL_PATH = BASE_PATH / "models"
 LOGS_PATH = BASE_PATH / "logs"
+TFDATA_CACHE_PATH = Path(__file__).parent / "cache" / "tfdata"
 
 MODEL_PATH.mkdir(exist_ok=True)
 LOGS_PATH.mkdir(exist_ok=True)
 
+TRAINING_RUNS_LOG = LOGS_PATH / "training_runs.jsonl"
+CHECKPOINT_PATH = MODEL_PATH / "checkpoints"
+# The model and bundle the server loads (its MODEL_PATH, resolved from this directory)
+SERVING_MODEL_PATH = Path(__file__).parent / os.getenv("MODEL_PATH", "models/jaundice_detection_model.h5")
+SERVING_BUNDLE_PATH = configured_bundle_path(SERVING_MODEL_PATH)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ==========================================
+# PRECISION / COMPILATION
+# ==========================================
+def cpu_supports_bf16():
+    """True if the CPU has native bfloat16 arithmetic (AVX512-BF16, AMX or Arm BF16)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = {flag for line in f if line.startswith(("flags", "Features")) for flag in line.split()}
+    except OSError:
+        return False
+    return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+
+def configure_precision(mixed_precision=False):
+    """Set the global Keras dtype policy; returns the policy name actually used
+
+    mixed_bfloat16 computes in bfloat16 with float32 variables. It is only
+    enabled when the CPU has native bf16 support, since emulated bf16 is
+    slower than float32.
+    """
+    policy = "float32"
+    if mixed_precision:
+        if cpu_supports_bf16() or tf.config.list_physical_devices("GPU"):
+            policy = "mixed_bfloat16"
+        else:
+            logger.warning("CPU has no native bfloat16 support; training in float32")
+    keras.mixed_precision.set_global_policy(policy)
+    logger.info(f"Precision policy: {policy}")
+    return policy
+
 # ==========================================
 # DATA LOADING
 # ==========================================
-def load_data():
-    """Load and prepare train/val/test datasets with strong augmentation"""
-    logger.info("Loading datasets...")
+def load_data(pipeline="generator", cache_eval="memory", shard=None, batch_size=BATCH_SIZE):
+    """Load and prepare train/val/test datasets with strong augmentation
+
+    ``shard`` splits train/validate across workers; every worker keeps the full test split.
+    """
+    logger.info(f"Loading datasets ({pipeline} pipeline)...")
+
+    if pipeline == "cached":
+        train_data = load_cached_split(DATASET_PATH, "train", IMG_SIZE, batch_size, training=True, shard=shard)
+        val_data = load_cached_split(DATASET_PATH, "validate", IMG_SIZE, batch_size, shard=shard)
+        test_data = load_cached_split(DATASET_PATH, "test", IMG_SIZE, batch_size)
+        logger.info(f"Train samples: {train_data.samples}, Val samples: {val_data.samples}, Test samples: {test_data.samples}")
+        return train_data, val_data, test_data
+
+    if pipeline == "tfdata":
+        train_data = load_split(DATASET_PATH, "train", IMG_SIZE, batch_size, training=True, shard=shard)
+        val_data = load_split(DATASET_PATH, "validate", IMG_SIZE, batch_size, shard=shard,
+                              cache=cache_spec(cache_eval, TFDATA_CACHE_PATH, "validate", shard))
+        test_data = load_split(DATASET_PATH, "test", IMG_SIZE, batch_size,
+                               cache=cache_spec(cache_eval, TFDATA_CACHE_PATH, "test"))
+        logger.info(f"Train samples: {train_data.samples}, Val samples: {val_data.samples}, Test samples: {test_data.samples}")
+        return train_data, val_data, test_data
 
     train_aug = ImageDataGenerator(
         rescale=1./255,
@@ -67,21 +131,21 @@ def load_data():
     train_gen = train_aug.flow_from_directory(
         DATASET_PATH / "train",
         target_size=(IMG_SIZE, IMG_SIZE),
-        batch_size=BATCH_SIZE,
+        batch_size=batch_size,
         class_mode='binary',
         classes={'train N': 0, 'train J': 1}
     )
     val_gen = val_aug.flow_from_directory(
         DATASET_PATH / "validate",
         target_size=(IMG_SIZE, IMG_SIZE),
-        batch_size=BATCH_SIZE,
+        batch_size=batch_size,
         class_mode='binary',
         classes={'validate N': 0, 'validate J': 1}
     )
     test_gen = test_aug.flow_from_directory(
         DATASET_PATH / "test",
         target_size=(IMG_SIZE, IMG_SIZE),
-        batch_size=BATCH_SIZE,
+        batch_size=batch_size,
         class_mode='binary',
         shuffle=False,
         classes={'test N': 0, 'test J': 1}
@@ -93,7 +157,7 @@ def load_data():
 # ==========================================
 # MODEL CREATION
 # ==========================================
-def build_model():
+def build_model(jit_compile=False, learning_rate=BASE_LR, dropout=DROPOUT_RATES):
     """Build enhanced MobileNetV2-based CNN"""
     base_model = MobileNetV2(
         input_shape=(IMG_SIZE, IMG_SIZE, 3),
@@ -108,17 +172,19 @@ def build_model():
         layers.GlobalAveragePooling2D(),
         layers.Dense(256, activation='relu', kernel_regularizer='l2'),
         layers.BatchNormalization(),
-        layers.Dropout(0.5),
+        layers.Dropout(dropout[0]),
         layers.Dense(128, activation='relu', kernel_regularizer='l2'),
         layers.BatchNormalization(),
-        layers.Dropout(0.3),
-        layers.Dense(1, activation='sigmoid')
+        layers.Dropout(dropout[1]),
+        # Probabilities stay float32 under mixed precision for a stable loss
+        layers.Dense(1, activation='sigmoid', dtype='float32')
     ])
 
     model.compile(
-        optimizer=Adam(learning_rate=BASE_LR),
+        optimizer=Adam(learning_rate=learning_rate),
         loss='binary_crossentropy',
-        metrics=['accuracy', keras.metrics.Precision(), keras.metrics.Recall()]
+        metrics=['accuracy', keras.metrics.Precision(), keras.metrics.Recall()],
+        jit_compile=jit_compile
     )
     logger.info("✅ Base model built successfully")
     return model, base_model
@@ -126,9 +192,70 @@ def build_model():
 # ==========================================
 # TRAINING
 # ==========================================
-def train_model(model, base_model, train_gen, val_gen):
-    """Train model with progressive fine-tuning and class balancing"""
+def train_head_on_features(model, callbacks, class_weights, augment_copies=0, jit_compile=False, initial_epoch=0,
+                           epochs=EPOCHS_PHASE1, batch_size=BATCH_SIZE, learning_rate=BASE_LR):
+    """Phase 1 on cached backbone embeddings instead of full forward passes
+
+    The head model shares its layers with ``model``, so the trained head
+    weights are already in place for phase 2.
+    """
+    train_features, train_labels = feature_cache.load_or_extract(
+        model, DATASET_PATH, "train", IMG_SIZE, batch_size, augment_copies=augment_copies)
+    val_features, val_labels = feature_cache.load_or_extract(
+        model, DATASET_PATH, "validate", IMG_SIZE, batch_size)
+
+    head = feature_cache.head_model(model)
+    head.compile(
+        optimizer=Adam(learning_rate=learning_rate),
+        loss='binary_crossentropy',
+        metrics=['accuracy', keras.metrics.Precision(), keras.metrics.Recall()],
+        jit_compile=jit_compile
+    )
+
+    # Checkpoints of the head alone aren't loadable models; phase 2 saves the full one
+    head_callbacks = [c for c in callbacks if not isinstance(c, keras.callbacks.ModelCheckpoint)]
+    for callback in head_callbacks:
+        if isinstance(callback, ThroughputLogger):
+            callback.samples = len(train_labels)
+    return head.fit(
+        feature_cache.feature_dataset(train_features, train_labels, batch_size, training=True),
+        validation_data=feature_cache.feature_dataset(val_features, val_labels, batch_size),
+        epochs=epochs,
+        initial_epoch=initial_epoch,
+        callbacks=head_callbacks,
+        class_weight=class_weights,
+        verbose=1
+    )
+
+def train_model(model, base_model, train_gen, val_gen, use_feature_cache=False, feature_augment_copies=0,
+                jit_compile=False, checkpoint_dir=CHECKPOINT_PATH, resume=False, settings=None,
+                cluster=None, lr_scale=1.0, epochs=(EPOCHS_PHASE1, EPOCHS_PHASE2), learning_rate=BASE_LR,
+                fine_tune_lr=FINE_TUNE_LR, unfreeze_layers=UNFREEZE_LAYERS, max_epochs=None, output_dir=None):
+    """Train model with progressive fine-tuning and class balancing
+
+    With ``checkpoint_dir`` set, the full training state is checkpointed after
+    every epoch and ``resume`` continues from the last one: same phase, next
+    epoch, same weights, optimizer slots, learning rate and callback counters.
+
+    With a distributed ``cluster`` the model must have been built in its
+    scope and the splits loaded with ``shard=cluster.shard``; ``lr_scale``
+    multiplies the phase 2 learning rate like build_model's for phase 1.
+
+    ``max_epochs`` stops at that epoch of the combined schedule (phase 1's
+    ``epochs[0]`` epochs, then phase 2's), leaving the checkpoint ready for a
+    later call with a larger budget and ``resume=True`` to carry on from
+    there. ``output_dir`` replaces models/ and logs/ for the Keras
+    checkpoint and TensorBoard files.
+    """
     logger.info("Starting training...")
+    cluster = cluster or distributed.Cluster()
+
+    state = load_training_state(checkpoint_dir) if resume and checkpoint_dir else None
+    if resume and state is None:
+        logger.warning(f"No checkpoint found in {checkpoint_dir}; starting from scratch")
+    if state and settings and state.get("settings") != settings:
+        logger.warning(f"Resuming with different settings: {state.get('settings')} -> {settings}")
+    start_phase = state["phase"] if state else 1
 
     # Compute class weights
     class_weights = compute_class_weight(
@@ -139,77 +266,144 @@ def train_model(model, base_model, train_gen, val_gen):
     class_weights = dict(enumerate(class_weights))
     logger.info(f"Class Weights: {class_weights}")
 
+    # Every worker feeds its own shard; Keras can't apply class_weight to that, so it becomes sample weights
+    if cluster.distributed:
+        train_input, train_steps = distributed.distribute_split(cluster, train_gen, class_weights, training=True)
+        val_input, val_steps = distributed.distribute_split(cluster, val_gen)
+        fit_options = {"steps_per_epoch": train_steps, "validation_steps": val_steps, "class_weight": None}
+        samples = train_steps * cluster.global_batch_size(train_gen.batch_size)
+    else:
+        train_input, val_input = as_input(train_gen), as_input(val_gen)
+        fit_options = {"class_weight": class_weights}
+        samples = train_gen.samples
+
+    throughput = ThroughputLogger(samples, "tf.data" if isinstance(train_gen, DatasetSplit) else "generator")
+    early_stopping = keras.callbacks.EarlyStopping(monitor="val_loss", patience=8, restore_best_weights=True)
     callbacks = [
-        keras.callbacks.EarlyStopping(monitor="val_loss", patience=8, restore_best_weights=True),
+        throughput,
+        early_stopping,
         keras.callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.3, patience=4, min_lr=1e-7),
-        keras.callbacks.ModelCheckpoint(str(MODEL_PATH / "best_model.h5"), save_best_only=True, monitor="val_accuracy"),
-        keras.callbacks.TensorBoard(log_dir=str(LOGS_PATH / "tensorboard"))
+        keras.callbacks.ModelCheckpoint(str(cluster.worker_path(Path(output_dir or MODEL_PATH) / "best_model.h5")),
+                                        save_best_only=True, monitor="val_accuracy"),
+        keras.callbacks.TensorBoard(log_dir=str(cluster.worker_path(Path(output_dir or LOGS_PATH) / "tensorboard")))
     ]
+    checkpoint = None
+    if checkpoint_dir:
+        # Last, so it restores counters after the other callbacks reset them
+        checkpoint = TrainingCheckpoint(model, checkpoint_dir, callbacks[:4], settings, write=cluster.is_chief)
+        callbacks.append(checkpoint)
+        if state is None:
+            checkpoint.clear()
+    throughput.phase = start_phase - 1
+
+    # A phase cut short by max_epochs (rather than finished or early-stopped) stays open in the checkpoint
+    epochs1, epochs2 = epochs
+    phase1_epochs = epochs1 if max_epochs is None else min(epochs1, max_epochs)
+    phase2_epochs = epochs2 if max_epochs is None else max(0, min(epochs2, max_epochs - epochs1))
+
+    def finish(history1, history2):
+        if checkpoint:
+            checkpoint.close()
+        logger.info(f"Training throughput: {throughput.summary().get('mean_images_per_sec', 0.0):.1f} images/sec")
+        return history1, history2, throughput
 
     # Phase 1: Train top layers
-    history1 = model.fit(
-        train_gen,
-        validation_data=val_gen,
-        epochs=EPOCHS_PHASE1,
-        callbacks=callbacks,
-        class_weight=class_weights,
-        verbose=1
-    )
+    history1 = None
+    if start_phase == 1:
+        initial_epoch = state["epoch"] if state else 0
+        if checkpoint:
+            checkpoint.begin_phase(1, state)
+        if use_feature_cache:
+            history1 = train_head_on_features(model, callbacks, class_weights, feature_augment_copies, jit_compile,
+                                              initial_epoch, phase1_epochs, train_gen.batch_size, learning_rate)
+        else:
+            history1 = model.fit(
+                train_input,
+                validation_data=val_input,
+                epochs=phase1_epochs,
+                initial_epoch=initial_epoch,
+                callbacks=callbacks,
+                verbose=1,
+                **fit_options
+            )
+        if phase1_epochs < epochs1 and not early_stopping.stopped_epoch:
+            logger.info(f"Stopping at the {max_epochs}-epoch budget in phase 1")
+            return finish(history1, None)
+        if checkpoint:
+            checkpoint.end_phase()
+    else:
+        logger.info("Phase 1 already complete in checkpoint; skipping")
+    if not phase2_epochs:
+        return finish(history1, None)
 
     # Phase 2: Fine-tuning deeper layers
     logger.info("Fine-tuning deeper layers...")
+    throughput.samples = samples
     base_model.trainable = True
-    for layer in base_model.layers[:-60]:
+    for layer in base_model.layers[:-unfreeze_layers]:
         layer.trainable = False
 
-    model.compile(
-        optimizer=Adam(learning_rate=FINE_TUNE_LR),
-        loss='binary_crossentropy',
-        metrics=['accuracy', keras.metrics.Precision(), keras.metrics.Recall()]
-    )
-
-    history2 = model.fit(
-        train_gen,
-        validation_data=val_gen,
-        epochs=EPOCHS_PHASE2,
-        callbacks=callbacks,
-        class_weight=class_weights,
-        verbose=1
-    )
-
-    return history1, history2
+    with cluster.scope():
+        model.compile(
+            optimizer=Adam(learning_rate=fine_tune_lr * lr_scale),
+            loss='binary_crossentropy',
+            metrics=['accuracy', keras.metrics.Precision(), keras.metrics.Recall()],
+            jit_compile=jit_compile
+        )
+
+    history2 = None
+    if start_phase <= 2:
+        resume_state = state if start_phase == 2 else None
+        if checkpoint:
+            checkpoint.begin_phase(2, resume_state)
+        history2 = model.fit(
+            train_input,
+            validation_data=val_input,
+            epochs=phase2_epochs,
+            initial_epoch=resume_state["epoch"] if resume_state else 0,
+            callbacks=callbacks,
+            verbose=1,
+            **fit_options
+        )
+        if phase2_epochs < epochs2 and not early_stopping.stopped_epoch:
+            logger.info(f"Stopping at the {max_epochs}-epoch budget in phase 2")
+            return finish(history1, history2)
+        if checkpoint:
+            checkpoint.end_phase()
+    else:
+        # Both phases finished before the interruption; only the final weights are needed
+        model.set_weights(checkpoint_weights(state))
+        logger.info("Training already complete in checkpoint; restored final weights")
+
+    return finish(history1, history2)
 
 # ==========================================
 # EVALUATION
 # ==========================================
-def evaluate_model(model, test_gen):
+def evaluate_model(model, test_gen, objective="f1", **threshold_options):
     """Evaluate and optimize classification threshold"""
     logger.info("Evaluating model...")
 
-    probs = model.predict(test_gen).flatten()
+    probs = model.predict(as_input(test_gen)).flatten()
     true_labels = test_gen.classes
 
-    # Find optimal threshold via ROC curve
-    fpr, tpr, thresholds = roc_curve(true_labels, probs)
-    f1_scores = [2 * (precision_score(true_labels, (probs >= t)) * recall_score(true_labels, (probs >= t))) /
-                 (precision_score(true_labels, (probs >= t)) + recall_score(true_labels, (probs >= t)) + 1e-7)
-                 for t in thresholds]
-    best_threshold = thresholds[np.argmax(f1_scores)]
-
-    pred_labels = (probs >= best_threshold).astype(int)
-    cm = confusion_matrix(true_labels, pred_labels)
-    acc = accuracy_score(true_labels, pred_labels)
-    prec = precision_score(true_labels, pred_labels)
-    rec = recall_score(true_labels, pred_labels)
-    f1 = f1_score(true_labels, pred_labels)
-
-    logger.info(f"✅ Optimized Threshold: {best_threshold:.3f}")
-    logger.info(f"Accuracy: {acc:.4f}, Precision: {prec:.4f}, Recall: {rec:.4f}, F1: {f1:.4f}")
+    # One sorted pass over every candidate threshold
+    result = optimize_threshold(true_labels, probs, objective, **threshold_options)
+    best_threshold = result["threshold"]
+    cm = np.array(result["confusion_matrix"])
+
+    logger.info(f"✅ Optimized Threshold ({objective}): {best_threshold:.3f}")
+    logger.info(f"Accuracy: {result['accuracy']:.4f}, Precision: {result['precision']:.4f}, "
+                f"Recall: {result['recall']:.4f}, F1: {result['f1_score']:.4f}")
     logger.info(f"Confusion Matrix:\n{cm}")
 
     return {
-        "accuracy": acc, "precision": prec, "recall": rec, "f1_score": f1,
-        "confusion_matrix": cm.tolist(), "threshold": float(best_threshold)
+        "accuracy": result["accuracy"], "precision": result["precision"], "recall": result["recall"],
+        "f1_score": result["f1_score"], "confusion_matrix": result["confusion_matrix"],
+        "threshold": best_threshold,
+        "threshold_objective": objective,
+        "threshold_options": result["options"],
+        "threshold_curve": result["curve"]
     }
 
 # ==========================================
@@ -221,33 +415,174 @@ def save_model(model, metrics):
     model.save(model_file)
     logger.info(f"Model saved to: {model_file}")
 
+    bundle_file = write_bundle(model_file, metrics["threshold"], metrics, IMG_SIZE, preprocess_signature(IMG_SIZE))
+    logger.info(f"Model bundle saved to: {bundle_file}")
+
+    # Publish the model and its bundle together where serving loads them; the
+    # server rejects a bundle whose version doesn't match the model's digest
+    SERVING_MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = SERVING_MODEL_PATH.with_name(SERVING_MODEL_PATH.name + ".tmp")
+    shutil.copyfile(model_file, tmp)
+    os.replace(tmp, SERVING_MODEL_PATH)
+    serving_bundle = write_bundle(SERVING_MODEL_PATH, metrics["threshold"], metrics, IMG_SIZE,
+                                  preprocess_signature(IMG_SIZE), path=SERVING_BUNDLE_PATH)
+    logger.info(f"Serving model saved to: {SERVING_MODEL_PATH} (bundle {serving_bundle})")
+
     metrics_file = MODEL_PATH / "best_model_metrics.json"
     metrics["training_date"] = datetime.now().isoformat()
     with open(metrics_file, "w") as f:
         json.dump(metrics, f, indent=2)
     logger.info(f"Metrics saved to: {metrics_file}")
 
+# ==========================================
+# RUN LOG
+# ==========================================
+def _phase_epoch_seconds(throughput, phase):
+    epochs = [e["epoch_seconds"] for e in throughput.epochs if e["phase"] == phase]
+    return float(np.mean(epochs)) if epochs else None
+
+def log_training_run(settings, throughput, metrics, path=TRAINING_RUNS_LOG):
+    """Append this run to logs/training_runs.jsonl and compare it with the last run of other settings"""
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        **settings,
+        "phase1_epoch_seconds": _phase_epoch_seconds(throughput, 1),
+        "phase2_epoch_seconds": _phase_epoch_seconds(throughput, 2),
+        "images_per_sec": throughput.summary().get("mean_images_per_sec"),
+        "metrics": {k: metrics.get(k) for k in ("accuracy", "precision", "recall", "f1_score", "threshold")}
+    }
+
+    previous = []
+    if path.exists():
+        with open(path) as f:
+            previous = [json.loads(line) for line in f if line.strip()]
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+    keys = {"precision_policy": None, "jit_compile": None, "workers": 1}
+    baseline = next((r for r in reversed(previous)
+                     if r.get("pipeline") == record["pipeline"]
+                     and any(r.get(k, default) != record.get(k, default) for k, default in keys.items())), None)
+    if baseline is None:
+        logger.info(f"Run logged to {path} (no run with other precision/XLA/worker settings to compare yet)")
+        return record
+
+    logger.info(f"Compared with {baseline.get('precision_policy')}/jit={baseline.get('jit_compile')}"
+                f"/workers={baseline.get('workers', 1)} run of {baseline['timestamp']}:")
+    for phase in ("phase1_epoch_seconds", "phase2_epoch_seconds"):
+        if record[phase] and baseline.get(phase):
+            logger.info(f"  {phase}: {record[phase]:.1f}s vs {baseline[phase]:.1f}s "
+                        f"({baseline[phase] / record[phase]:.2f}x)")
+    for metric, value in record["metrics"].items():
+        before = baseline.get("metrics", {}).get(metric)
+        if value is not None and before is not None:
+            logger.info(f"  {metric}: {value:.4f} vs {before:.4f} ({value - before:+.4f})")
+    return record
+
 # ==========================================
 # MAIN PIPELINE
 # ==========================================
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the jaundice detection model")
+    parser.add_argument("--pipeline", choices=["cached", "tfdata", "generator"], default="generator",
+                        help="Input pipeline: the ImageDataGenerator (default), tf.data over the "
+                             "preprocessed dataset cache, or tf.data decoding the images")
+    parser.add_argument("--cache-eval", choices=["memory", "disk", "none"], default="memory",
+                        help="Cache decoded validation/test images with the tf.data pipeline")
+    parser.add_argument("--feature-cache", action="store_true",
+                        help="Phase 1: train the head on cached frozen-backbone embeddings")
+    parser.add_argument("--feature-augment-copies", type=int, default=0,
+                        help="Fixed augmented copies of the train set to embed for --feature-cache")
+    parser.add_argument("--threshold-objective", choices=OBJECTIVES, default="f1",
+                        help="How to pick the decision threshold on the test split")
+    parser.add_argument("--min-precision", type=float, default=0.9,
+                        help="Precision floor for --threshold-objective recall_at_precision")
+    parser.add_argument("--fp-cost", type=float, default=1.0, help="False positive cost for --threshold-objective cost")
+    parser.add_argument("--fn-cost", type=float, default=1.0, help="False negative cost for --threshold-objective cost")
+    parser.add_argument("--mixed-precision", action="store_true",
+                        help="Train with the mixed_bfloat16 policy when the CPU supports bfloat16")
+    parser.add_argument("--jit-compile", action="store_true", help="XLA-compile the train/eval steps")
+    parser.add_argument("--checkpoint-dir", type=Path, default=CHECKPOINT_PATH,
+                        help="Where to write the per-epoch training checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the last checkpoint in --checkpoint-dir")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Don't write per-epoch checkpoints")
+    parser.add_argument("--local-workers", type=int, default=1,
+                        help="Data-parallel worker processes on this host (MultiWorkerMirroredStrategy)")
+    parser.add_argument("--lr-scaling", choices=distributed.LR_SCALING, default="linear",
+                        help="How to scale the learning rates with the global batch size across workers")
+    parser.add_argument("--no-pin", action="store_true", help="Don't pin local workers to separate CPU sets")
+    args = parser.parse_args(argv)
+    if args.local_workers > 1 or distributed.in_cluster():
+        if args.pipeline == "generator":
+            parser.error("multi-worker training needs a tf.data pipeline (--pipeline cached or tfdata)")
+        if args.feature_cache:
+            parser.error("--feature-cache is single-process only")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.local_workers > 1 and not distributed.in_cluster():
+        if args.pipeline == "cached":
+            # Build the dataset cache once here rather than racing on it from every worker
+            import dataset_cache
+            for split in dataset_cache.SPLITS:
+                dataset_cache.build_split_cache(DATASET_PATH, split, img_size=IMG_SIZE)
+        return distributed.launch_local_workers(args.local_workers, __file__,
+                                                sys.argv[1:] if argv is None else argv, pin=not args.no_pin)
+
     try:
+        cluster = distributed.Cluster.from_env()
         logger.info("="*80)
         logger.info("🚀 Enhanced Jaundice Detection Model Training Started")
         logger.info("="*80)
 
-        train_gen, val_gen, test_gen = load_data()
-        model, base_model = build_model()
-        train_model(model, base_model, train_gen, val_gen)
-        metrics = evaluate_model(model, test_gen)
+        policy = configure_precision(args.mixed_precision)
+        train_gen, val_gen, test_gen = load_data(args.pipeline, args.cache_eval, cluster.shard)
+        lr_scale = cluster.lr_scale(args.lr_scaling)
+        with cluster.scope():
+            model, base_model = build_model(args.jit_compile, BASE_LR * lr_scale)
+        settings = {
+            "pipeline": args.pipeline,
+            "feature_cache": args.feature_cache,
+            "precision_policy": policy,
+            "jit_compile": args.jit_compile,
+            "workers": cluster.num_workers
+        }
+        if cluster.distributed:
+            logger.info(f"Global batch size {cluster.global_batch_size(BATCH_SIZE)}, "
+                        f"learning rates x{lr_scale:.2f} ({args.lr_scaling})")
+        _, _, throughput = train_model(model, base_model, train_gen, val_gen,
+                                       args.feature_cache, args.feature_augment_copies, args.jit_compile,
+                                       checkpoint_dir=None if args.no_checkpoint else args.checkpoint_dir,
+                                       resume=args.resume, settings=settings, cluster=cluster, lr_scale=lr_scale)
+        if not cluster.is_chief:
+            return 0
+        if cluster.distributed:
+            model = distributed.local_copy(model)
+        if args.threshold_objective == "recall_at_precision":
+            threshold_options = {"min_precision": args.min_precision}
+        elif args.threshold_objective == "cost":
+            threshold_options = {"fp_cost": args.fp_cost, "fn_cost": args.fn_cost}
+        else:
+            threshold_options = {}
+        metrics = evaluate_model(model, test_gen, args.threshold_objective, **threshold_options)
+        metrics["training_throughput"] = throughput.summary()
+        metrics["precision_policy"] = policy
+        metrics["jit_compile"] = args.jit_compile
         save_model(model, metrics)
+        log_training_run({**settings, "cpu_bf16": cpu_supports_bf16()}, throughput, metrics)
 
         logger.info("="*80)
         logger.info("🎯 Training Completed — Optimized Model Saved Successfully!")
         logger.info("="*80)
+        return 0
 
     except Exception as e:
         logger.error("Training failed: %s", e, exc_info=True)
+        if not args.no_checkpoint:
+            logger.error(f"Rerun with --resume to continue from the last checkpoint in {args.checkpoint_dir}")
+        return 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
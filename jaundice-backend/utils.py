@@ -5,31 +5,51 @@ Utility functions for the Jaundice Detection backend
 import logging
 import numpy as np
 from pathlib import Path
-from PIL import Image
-import cv2
+
+from preprocessing import preprocess, preprocess_into
 
 logger = logging.getLogger(__name__)
 
-def load_image(image_path, target_size=(224, 224)):
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'bmp', 'gif'}
+
+def load_image(image_path, target_size=(224, 224), out=None):
     """Load and preprocess an image from file"""
     try:
-        img = Image.open(image_path)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        img = img.resize(target_size, Image.Resampling.LANCZOS)
-        img_array = np.array(img, dtype=np.float32) / 255.0
-        return img_array
+        if out is not None:
+            return preprocess_into(image_path, out, target_size)
+        return preprocess(image_path, target_size, batch_dim=False)
     except Exception as e:
         logger.error("Error loading image %s: %s", image_path, str(e))
         raise
 
-def load_batch(image_paths, target_size=(224, 224)):
-    """Load a batch of images"""
-    images = []
-    for path in image_paths:
-        img = load_image(path, target_size)
-        images.append(img)
-    return np.array(images)
+def load_batch(image_paths, target_size=(224, 224), use_cache=True):
+    """Load a batch of images, from the preprocessed dataset cache when it has them"""
+    width, height = target_size
+    images = np.empty((len(image_paths), height, width, 3), dtype=np.float32)
+    
+    dataset_cache = None
+    if use_cache:
+        from dataset_cache import get_default_cache
+        dataset_cache = get_default_cache()
+        if dataset_cache is not None and (dataset_cache.img_size, dataset_cache.img_size) != (width, height):
+            dataset_cache = None
+    
+    for i, path in enumerate(image_paths):
+        if dataset_cache is None or not dataset_cache.load_into(path, images[i]):
+            load_image(path, target_size, out=images[i])
+    return images
+
+def list_split_images(dataset_path, split):
+    """List image paths and binary labels (normal=0, jaundice=1) for a dataset split"""
+    dataset_path = Path(dataset_path)
+    paths, labels = [], []
+    for suffix, label in (('N', 0), ('J', 1)):
+        class_dir = dataset_path / split / f'{split} {suffix}'
+        for path in sorted(class_dir.glob('*')):
+            if path.suffix.lower().lstrip('.') in IMAGE_EXTENSIONS:
+                paths.append(path)
+                labels.append(label)
+    return paths, np.array(labels, dtype=np.int64)
 
 def get_dataset_statistics(dataset_path):
     """Get statistics about the dataset"""
@@ -60,6 +80,35 @@ def get_dataset_statistics(dataset_path):
     
     return stats
 
+def get_process_memory(pid='self'):
+    """Resident, proportional and private memory of a process in MB (Linux /proc)
+
+    PSS splits pages shared with other processes (e.g. copy-on-write pages
+    inherited from a preloading gunicorn master) between their owners, so
+    summing PSS across workers gives their real combined footprint.
+    """
+    memory = {'rss_mb': 0.0, 'pss_mb': None, 'private_mb': None}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory['rss_mb'] = int(line.split()[1]) / 1024
+                    break
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            private_kb = 0
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'Pss':
+                    memory['pss_mb'] = int(value.split()[0]) / 1024
+                elif key in ('Private_Clean', 'Private_Dirty'):
+                    private_kb += int(value.split()[0])
+            memory['private_mb'] = private_kb / 1024
+    except (OSError, ValueError):
+        import resource
+        if not memory['rss_mb']:
+            memory['rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return memory
+
 def format_confidence(confidence):
     """Format confidence as percentage"""
     return f"{confidence * 100:.2f}%"
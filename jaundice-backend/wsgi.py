@@ -1,10 +1,15 @@
 """
 WSGI configuration for production deployment
-Use with gunicorn: gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app
+Use with gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+(or plain: gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app)
 """
 
 import os
-from app import app
+from app import app, PRELOAD_MODEL, preload_model
+
+if PRELOAD_MODEL:
+    # With preload_app this runs once in the gunicorn master, before forking
+    preload_model()
 
 if __name__ == "__main__":
     app.run()